@@ -1,101 +1,651 @@
-import sys, os, gpustat, json, subprocess, platform, psutil, re, requests, darkdetect, qdarkstyle, time
-
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QDoubleValidator, QIntValidator
-from PyQt5.QtWidgets import QAction, QApplication, QCheckBox, QComboBox, QFileDialog, QFrame, QGridLayout, QHBoxLayout, QLabel, QLineEdit, QListWidget, QListWidgetItem, QMainWindow, QMessageBox, QPushButton, QRadioButton, QSlider, QSpinBox, QToolBar, QVBoxLayout, QWidget
+import time
+startup_time = time.perf_counter()
+
+# pynvml, psutil, requests, darkdetect and qdarkstyle are imported where they are used,
+# so none of them delay the first window.
+import sys, os, json, subprocess, platform, shutil
+from contextlib import contextmanager
+
+# Headless mode: build (and start) a profile without loading PyQt5 at all
+if __name__ == "__main__" and "--profile" in sys.argv:
+    from launcher import main
+    sys.exit(main(sys.argv[1:]))
+
+# Prints a phase by phase breakdown of the startup time, when StartUI is started with --profile-startup
+class StartupProfiler:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.phases = []
+        self.depth = 0
+        self.reported = False
+
+    @contextmanager
+    def phase(self, name):
+        # Reserve the slot when the phase starts, so nested phases are printed below their parent
+        index = len(self.phases)
+        self.phases.append((self.depth, name, 0.0))
+        start = time.perf_counter()
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            self.phases[index] = (self.depth, name, time.perf_counter() - start)
+
+    def add(self, name, start):
+        self.phases.append((self.depth, name, time.perf_counter() - start))
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        print("StartUI startup profile:")
+        for depth, name, duration in self.phases:
+            print(f"  {'  ' * depth}{name:<{32 - 2 * depth}} {duration * 1000:8.1f} ms")
+        print(f"  {'total until first paint':<32} {(time.perf_counter() - startup_time) * 1000:8.1f} ms")
+
+startup_profiler = StartupProfiler("--profile-startup" in sys.argv)
+
+from PyQt5.QtCore import Qt, QFileSystemWatcher, QPointF, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QDoubleValidator, QIntValidator, QPainter, QPen
+from PyQt5.QtWidgets import QAction, QActionGroup, QApplication, QCheckBox, QComboBox, QDialog, QFileDialog, QFrame, QGridLayout, QHBoxLayout, QInputDialog, QLabel, QLineEdit, QListWidget, QListWidgetItem, QMainWindow, QMessageBox, QPushButton, QRadioButton, QSlider, QSpinBox, QTableWidget, QTableWidgetItem, QToolBar, QVBoxLayout, QWidget
+
+from launcher import auto_terminal, build_command_args, build_launch_command, cache_folder, characters_folder, extensions_folder, load_gui_config, loras_folder, missing_packages, model_folder, no_terminal, popen_with_conda, profiles_folder, repo_path, run_cmd_with_conda, server_ports, set_gui_config_value, set_terminal_emulator, stop_process_tree, terminal_emulators, webui_file
+from hardware import get_hardware_inventory
+from model_index import ModelIndex, format_size
+from flag_schema import schema, unset_values
+from supervisor import ServerSupervisor, port_open
+from history import LaunchHistory, webui_version
+from hot_switch import launch_args, plan_switch, switch_model
+from instances import InstanceSet, load_instance_sets, plan_instances, save_instance_sets
+from proxy import LoadBalancingProxy, default_proxy_ports, proxy_strategies, stats_path
+from prewarm import ModelPrewarmer
+from verify import ModelVerifier
+from storage_probe import assess_storage, describe_storage, probe_storage
+from monitor import ResourceMonitor, default_monitor_interval
+from autotune import LlamaAutotuner, ServerEvaluator, build_search_space
+from memory_planner import describe_plan, estimate_model_memory, gib, gpu_overhead, plan_memory, suggest_settings
+
+startup_profiler.add("imports", startup_time)
 
 # For showing the current version and checking for updates
 version = "1.6"
 
-# Profile folder for loading and saving profiles.
-profiles_folder = "./profiles"
-# Create the profile folder if it doesn't exist
-os.makedirs(profiles_folder, exist_ok=True)
+def list_characters():
+    # get a list of all .json files in the characters folder
+    try:
+        return sorted((file[:-len(".json")] for file in os.listdir(characters_folder) if file.endswith(".json")), key=str.lower)
+    except OSError:
+        return []
 
-repo_path = "./text-generation-webui"
-model_folder = "./text-generation-webui/models"
-extensions_folder = "./text-generation-webui/extensions"
-loras_folder = "./text-generation-webui/loras"
-characters_folder = "./text-generation-webui/characters"
+def list_extensions():
+    try:
+        return sorted(name for name in os.listdir(extensions_folder) if os.path.isdir(os.path.join(extensions_folder, name)) and "api" not in name.lower())
+    except OSError:
+        return []
 
-if getattr(sys, 'frozen', False):
-    webui_file = sys._MEIPASS + '/webuiGUI.py'
-else:
-    webui_file = 'webuiGUI.py'
+def list_loras():
+    try:
+        return sorted((name for name in os.listdir(loras_folder) if os.path.isdir(os.path.join(loras_folder, name))), key=str.lower)
+    except OSError:
+        return []
 
-# Get the current Max CPU threads to use, so the user can't exceed his thread count.
-max_threads = psutil.cpu_count(logical=True)
-
-# Check if Nvidia GPU and driver is installed, set boolean for later references
-try:
-    output = subprocess.check_output(['nvidia-smi'])
-    nvidia_gpu = True
-except:
-    nvidia_gpu = False
-    pass
-
-# # Get the absolute path of the script file
-script_path = os.path.abspath(__file__)
-
-# Define the path of the settings file relative to the script file
-settings_file = os.path.join(os.path.dirname(script_path), "gui-config.json")
-
-# Define the conda environment path
-if platform.system() == 'Windows':
-    # Sets the Conda Environment based on Windows
-    conda_binary = r".\installer_files\conda\condabin\conda.bat"
-    conda_env_path = r".\installer_files\env"
-if platform.system() == 'Linux':
-    # Sets the Conda Environment based on Linux
-    conda_binary = "./installer_files/conda/condabin/conda"
-    conda_env_path = "./installer_files/env"
-
-def run_cmd_with_conda(cmd, env=None):
-    if platform.system() == 'Windows':
-        # For Windows, activate the Conda environment using the activate.bat script
-        activate_cmd = f"{conda_binary} activate {conda_env_path} && "
-        full_cmd = activate_cmd + cmd
-
-        # Open a separate terminal window and execute the command
-        subprocess.Popen(['start', 'cmd', '/k', full_cmd], shell=True, env=env)
-    
-    elif platform.system() == 'Linux':
-        # Define the necessary variables from the bash script
-        install_dir = os.path.dirname(os.path.abspath(__file__))
-        conda_root_prefix = os.path.join(install_dir, "installer_files", "conda")
-        install_env_dir = os.path.join(install_dir, "installer_files", "env")
+def list_profiles():
+    return sorted((name for name in os.listdir(profiles_folder) if name.endswith(".json")), key=str.lower)
+
+# Folder changes are applied after this many ms without further changes
+folder_watch_debounce = 300
+
+# Output of the webui started from the GUI
+server_log_file = os.path.join(cache_folder, "server.log")
+# Results of the model file checks, per file
+model_verifier = ModelVerifier(os.path.join(cache_folder, "model_verify.json"))
+# How often (ms) the GUI checks on the server process
+supervisor_poll_interval = 1000
+
+# Every start from the GUI with time-to-ready, peak memory and how it ended
+launch_history = LaunchHistory(os.path.join(cache_folder, "launch_history.sqlite3"))
+
+# Size, format and quantization of every model, kept next to the profiles
+model_index = ModelIndex(model_folder, os.path.join(cache_folder, "model_index.json"))
 
-        # For Linux, activate the Conda environment
-        activate_cmd = f"source {os.path.join(conda_root_prefix, 'etc', 'profile.d', 'conda.sh')} && conda activate {install_env_dir}"
+# GPU, CPU and RAM information for this session. Reads NVML once, or a fresh snapshot of a previous launch.
+with startup_profiler.phase("hardware probe"):
+    hardware = get_hardware_inventory(os.path.join(cache_folder, "hardware_snapshot.json"))
 
-        # Check for available terminal emulators
-        terminal_emulators = ['xdg-terminal', 'gnome-terminal', 'konsole', 'xfce4-terminal', 'mate-terminal', 'lxterminal', 'termite', 'tilix', 'xterm']
-        terminal_cmd = None
+# Set boolean for later references, if a Nvidia GPU and driver is installed
+nvidia_gpu = hardware.nvidia_gpu
 
-        for emulator in terminal_emulators:
+# Get the current Max CPU threads to use, so the user can't exceed his thread count.
+max_threads = hardware.cpu_logical_cores
+
+# GitHub release lookup, shared by the update badge, the version window and the about window
+latest_release_url = "https://api.github.com/repos/Pakobbix/StartUI-oobabooga-webui/releases/latest"
+release_cache_file = os.path.join(cache_folder, "latest_release.json")
+# Don't let a slow proxy or an air-gapped box keep the fetch alive forever
+release_fetch_timeout = 5
+# Seconds StartUI waits on close for a cancelled autotune run, after its server was stopped
+autotune_stop_timeout = 15
+
+def load_release_cache():
+    # Returns the last known release as {"etag": ..., "release": {...}} or an empty dict
+    try:
+        with open(release_cache_file, "r") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def fetch_latest_release():
+    import requests
+
+    # One conditional request against GitHub. With a matching ETag, GitHub answers 304
+    # and the cached release is reused (304 responses also don't count against the rate limit).
+    cache = load_release_cache()
+    headers = {}
+    if cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+
+    try:
+        response = requests.get(latest_release_url, headers=headers, timeout=release_fetch_timeout)
+        if response.status_code == 304:
+            return cache.get("release")
+        if response.status_code == 200:
+            release = response.json()
+            cache = {"etag": response.headers.get("ETag", ""), "release": {"tag_name": release.get("tag_name"), "body": release.get("body")}}
             try:
-                subprocess.run([emulator, '--version'], check=True)
-                terminal_cmd = emulator
-                break
-            except FileNotFoundError:
-                continue
+                with open(release_cache_file, "w") as file:
+                    json.dump(cache, file, indent=4)
+            except OSError as e:
+                print(f"Error writing release cache: {str(e)}")
+            return cache["release"]
+    except Exception as e:
+        print(f"Error fetching latest release: {str(e)}")
+
+    # Offline or GitHub unhappy, keep using whatever we know
+    return cache.get("release")
+
+class ReleaseCheckThread(QThread):
+    release_fetched = pyqtSignal(object)
+
+    def run(self):
+        self.release_fetched.emit(fetch_latest_release())
+
+class AutotuneThread(QThread):
+    progress = pyqtSignal(str)
+    tuned = pyqtSignal(object)
+
+    def __init__(self, base_args, space, parent=None):
+        super().__init__(parent)
+        self.evaluator = ServerEvaluator(lambda args: popen_with_conda(f"python {webui_file} {' '.join(args)}"), stop_process_tree, base_args)
+        self.space = space
+
+    def run(self):
+        def report(params, result):
+            score, prompt_tps, generation_tps = result
+            settings = ", ".join(f"{name} {value}" for name, value in params.items())
+            if score == float("-inf"):
+                self.progress.emit(f"{settings}: failed")
+            else:
+                self.progress.emit(f"{settings}: {prompt_tps:.1f} prompt t/s, {generation_tps:.1f} t/s")
+
+        tuner = LlamaAutotuner(self.evaluator, self.space, progress=report)
+        self.tuned.emit(tuner.tune({}))
+
+    def cancel(self):
+        self.evaluator.cancel()
+
+class ModelSwitchThread(QThread):
+    # Model info and the seconds the load took, or None and the error
+    switched = pyqtSignal(object, object)
+
+    def __init__(self, api_url, plan, parent=None):
+        super().__init__(parent)
+        self.api_url = api_url
+        self.plan = plan
 
-        if terminal_cmd is None:
-            raise RuntimeError("No compatible terminal emulator found.")
+    def run(self):
+        start = time.perf_counter()
+        try:
+            switch_model(self.api_url, self.plan)
+            self.switched.emit(self.plan, time.perf_counter() - start)
+        except RuntimeError as e:
+            self.switched.emit(None, str(e))
+
+class ModelVerifyThread(QThread):
+    verified = pyqtSignal(object)
+
+    def __init__(self, model_path, parent=None):
+        super().__init__(parent)
+        self.model_path = model_path
+
+    def run(self):
+        # The launch waits for this signal, so it's sent even if the check itself fails
+        try:
+            result = model_verifier.verify(self.model_path)
+        except Exception as e:
+            result = {"ok": False, "problems": [f"the check failed: {str(e)}"], "checked": 0, "cached": 0}
+        self.verified.emit(result)
+
+class StorageProbeThread(QThread):
+    # The measurements, or None and the error
+    probed = pyqtSignal(object, object)
+
+    def __init__(self, folder, parent=None):
+        super().__init__(parent)
+        self.folder = folder
 
-        # Execute the command within the Conda environment in a separate terminal
-        print(cmd)
-        subprocess.Popen([terminal_cmd, '--', 'bash', '-c', f"{activate_cmd} && {cmd}"], env=env)
+    def run(self):
+        # The buttons stay disabled until this signal arrives, so it's sent whatever goes wrong
+        try:
+            result = probe_storage(self.folder)
+        except Exception as e:
+            self.probed.emit(None, str(e))
+            return
+        self.probed.emit(result, None)
+
+# Launches of a profile, summed up per webui version and one by one
+class LaunchHistoryDialog(QDialog):
+    def __init__(self, profile, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Launch History")
+        self.resize(900, 500)
+        layout = QVBoxLayout(self)
+
+        self.profile_dropdown = QComboBox()
+        self.profile_dropdown.addItems(launch_history.profiles())
+        self.profile_dropdown.setCurrentText(profile)
+        self.profile_dropdown.currentTextChanged.connect(self.show_profile)
+        layout.addWidget(self.profile_dropdown)
+
+        layout.addWidget(QLabel("Per webui version:"))
+        self.versions_table = QTableWidget()
+        self.versions_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.versions_table)
+
+        layout.addWidget(QLabel("Launches:"))
+        self.launches_table = QTableWidget()
+        self.launches_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.launches_table)
+
+        self.show_profile(self.profile_dropdown.currentText())
+
+    def show_profile(self, profile):
+        versions = [
+            [row["webui_version"], row["launches"], format_seconds(row["avg_time_to_ready"]), format_seconds(row["best_time_to_ready"]), format_mib(row["peak_vram"]), format_mib(row["peak_ram"]), row["never_ready"], row["crashes"]]
+            for row in launch_history.compare_versions(profile)
+        ]
+        self.fill_table(self.versions_table, ["webui", "Launches", "Avg. ready", "Best ready", "Peak VRAM", "Peak RAM", "Never ready", "Crashes"], versions)
+
+        launches = [
+            [time.strftime("%Y-%m-%d %H:%M", time.localtime(row["started_at"])), row["webui_version"], row["model"], format_seconds(row["time_to_ready"]), format_mib(row["peak_vram"]), format_mib(row["peak_ram"]), "" if row["exit_code"] is None else row["exit_code"], row["crash_reason"] or "", row["command"]]
+            for row in launch_history.launches(profile)
+        ]
+        self.fill_table(self.launches_table, ["Started", "webui", "Model", "Ready after", "Peak VRAM", "Peak RAM", "Exit code", "Crash reason", "Command"], launches)
+
+    def fill_table(self, table, headers, rows):
+        table.clear()
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            for column_index, value in enumerate(row):
+                table.setItem(row_index, column_index, QTableWidgetItem(str(value)))
+        table.resizeColumnsToContents()
+
+def format_seconds(seconds):
+    return "-" if seconds is None else f"{seconds:.1f}s"
+
+def format_milliseconds(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f} ms"
+
+def format_mib(mib):
+    return "-" if not mib else f"{mib / 1024:.1f} GiB"
+
+# A small line chart of the last values of a metric
+class Sparkline(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.values = []
+        self.setMinimumSize(200, 30)
+
+    def set_values(self, values):
+        self.values = values
+        self.update()
+
+    def paintEvent(self, event):
+        if len(self.values) < 2:
+            return
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(QColor("#4fa3e0"), 1.5))
+        width, height = self.width() - 2, self.height() - 2
+        # Scaled from 0, so a flat line at the top means "high", not "unchanged"
+        top = max(max(self.values), 1)
+        step = width / (len(self.values) - 1)
+        points = [QPointF(1 + index * step, 1 + height - value / top * height) for index, value in enumerate(self.values)]
+        for start, end in zip(points, points[1:]):
+            painter.drawLine(start, end)
+        painter.end()
+
+# Live GPU, RAM and webui process usage
+class ResourceMonitorWindow(QWidget):
+    def __init__(self, monitor, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.monitor = monitor
+        self.setWindowTitle("Resource Monitor")
+        self.layout = QGridLayout(self)
+        self.rows = {}
+
+        self.layout.addWidget(QLabel("Sample every"), 0, 0)
+        self.interval_dropdown = QComboBox()
+        self.interval_dropdown.addItems(["0.5s", "1s", "2s", "5s"])
+        self.interval_dropdown.setCurrentText(f"{monitor.interval:g}s")
+        self.interval_dropdown.currentTextChanged.connect(self.on_interval_changed)
+        self.layout.addWidget(self.interval_dropdown, 0, 1)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(500)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        # Only sample while someone is looking
+        self.monitor.start()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def closeEvent(self, event):
+        self.refresh_timer.stop()
+        self.monitor.stop()
+        super().closeEvent(event)
+
+    def on_interval_changed(self, text):
+        self.monitor.interval = float(text.rstrip("s"))
+        set_gui_config_value("monitor_interval", self.monitor.interval)
+
+    def refresh(self):
+        for name, values in self.monitor.series().items():
+            if name not in self.rows:
+                row = len(self.rows) + 1
+                value_label = QLabel()
+                sparkline = Sparkline()
+                self.layout.addWidget(QLabel(name), row, 0)
+                self.layout.addWidget(value_label, row, 1)
+                self.layout.addWidget(sparkline, row, 2)
+                self.rows[name] = (value_label, sparkline)
+            value_label, sparkline = self.rows[name]
+            value_label.setText(f"{values[-1]:g} (max {max(values):g})")
+            sparkline.set_values(values)
+
+# Several profiles side by side, each on its own GPUs and ports, started and stopped together
+class InstanceSetWindow(QWidget):
+    def __init__(self, restart_on_crash, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setWindowTitle("Instance Sets")
+        self.resize(800, 500)
+        self.restart_on_crash = restart_on_crash
+        self.instance_sets = load_instance_sets()
+        self.instance_set = None
+        layout = QVBoxLayout(self)
+
+        set_row = QHBoxLayout()
+        self.set_dropdown = QComboBox()
+        self.set_dropdown.addItems(sorted(self.instance_sets, key=str.lower))
+        self.set_dropdown.currentTextChanged.connect(self.show_set)
+        set_row.addWidget(self.set_dropdown, 1)
+        for text, handler in (("New Set", self.on_new_set_clicked), ("Delete Set", self.on_delete_set_clicked)):
+            button = QPushButton(text)
+            button.clicked.connect(handler)
+            set_row.addWidget(button)
+        layout.addLayout(set_row)
+
+        layout.addWidget(QLabel("Profiles and the GPUs they run on (comma separated, empty for all):"))
+        self.members_table = QTableWidget(0, 2)
+        self.members_table.setHorizontalHeaderLabels(["Profile", "GPUs"])
+        self.members_table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.members_table)
+
+        member_row = QHBoxLayout()
+        for text, handler in (("Add Profile", self.on_add_member_clicked), ("Remove Profile", self.on_remove_member_clicked), ("Save Set", self.on_save_set_clicked)):
+            button = QPushButton(text)
+            button.clicked.connect(handler)
+            member_row.addWidget(button)
+        layout.addLayout(member_row)
+
+        layout.addWidget(QLabel("Instances:"))
+        self.status_table = QTableWidget()
+        self.status_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.status_table)
+
+        control_row = QHBoxLayout()
+        self.start_set_button = QPushButton("Start Set")
+        self.start_set_button.clicked.connect(self.on_start_set_clicked)
+        control_row.addWidget(self.start_set_button)
+        self.stop_set_button = QPushButton("Stop Set")
+        self.stop_set_button.setEnabled(False)
+        self.stop_set_button.clicked.connect(self.on_stop_set_clicked)
+        control_row.addWidget(self.stop_set_button)
+        layout.addLayout(control_row)
+
+        # One address for the API of all instances
+        self.proxy = None
+        self.proxy_ports = load_gui_config().get("proxy_ports", default_proxy_ports)
+        proxy_row = QHBoxLayout()
+        proxy_row.addWidget(QLabel("Load Balancer:"))
+        self.proxy_strategy_dropdown = QComboBox()
+        self.proxy_strategy_dropdown.addItems(proxy_strategies)
+        self.proxy_strategy_dropdown.setCurrentText(load_gui_config().get("proxy_strategy", proxy_strategies[0]))
+        self.proxy_strategy_dropdown.currentTextChanged.connect(self.on_proxy_strategy_changed)
+        proxy_row.addWidget(self.proxy_strategy_dropdown)
+        self.proxy_button = QPushButton("Start Load Balancer")
+        self.proxy_button.setToolTip(f"Clients use the API on port {self.proxy_ports['api']} and the streaming API on port {self.proxy_ports['streaming api']}.\nThe requests go to the ready instances, the stats are at http://127.0.0.1:{self.proxy_ports['api']}{stats_path}")
+        self.proxy_button.clicked.connect(self.on_proxy_button_clicked)
+        proxy_row.addWidget(self.proxy_button)
+        proxy_row.addStretch()
+        layout.addLayout(proxy_row)
+        self.proxy_table = QTableWidget()
+        self.proxy_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.proxy_table.setVisible(False)
+        layout.addWidget(self.proxy_table)
+
+        # Keeps watching the instances while the window is closed (hidden)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(supervisor_poll_interval)
+        self.poll_timer.timeout.connect(self.on_poll_timer)
+
+        self.show_set(self.set_dropdown.currentText())
+
+    def show_set(self, name):
+        self.members_table.setRowCount(0)
+        for member in self.instance_sets.get(name, []):
+            self.add_member_row(member["profile"], member.get("gpus", []))
+
+    def add_member_row(self, profile, gpus):
+        row = self.members_table.rowCount()
+        self.members_table.insertRow(row)
+        profile_dropdown = QComboBox()
+        profile_dropdown.addItems([name[:-5] for name in list_profiles()])
+        profile_dropdown.setCurrentText(profile)
+        self.members_table.setCellWidget(row, 0, profile_dropdown)
+        self.members_table.setItem(row, 1, QTableWidgetItem(",".join(str(gpu) for gpu in gpus)))
+
+    def members(self):
+        members = []
+        for row in range(self.members_table.rowCount()):
+            gpus_item = self.members_table.item(row, 1)
+            gpus = [int(gpu) for gpu in (gpus_item.text() if gpus_item else "").replace(" ", "").split(",") if gpu.isdigit()]
+            members.append({"profile": self.members_table.cellWidget(row, 0).currentText(), "gpus": gpus})
+        return members
+
+    def on_new_set_clicked(self):
+        name, ok = QInputDialog.getText(self, "New Instance Set", "Name:")
+        if ok and name and name not in self.instance_sets:
+            self.instance_sets[name] = []
+            self.set_dropdown.addItem(name)
+            self.set_dropdown.setCurrentText(name)
+
+    def on_delete_set_clicked(self):
+        name = self.set_dropdown.currentText()
+        if name in self.instance_sets:
+            del self.instance_sets[name]
+            save_instance_sets(self.instance_sets)
+            self.set_dropdown.removeItem(self.set_dropdown.currentIndex())
+
+    def on_add_member_clicked(self):
+        # Suggest the next GPU nobody uses yet
+        used = {gpu for member in self.members() for gpu in member["gpus"]}
+        free = [index for index in range(len(hardware.gpus)) if index not in used]
+        self.add_member_row("default", free[:1])
+
+    def on_remove_member_clicked(self):
+        row = self.members_table.currentRow()
+        if row >= 0:
+            self.members_table.removeRow(row)
+
+    def on_save_set_clicked(self):
+        name = self.set_dropdown.currentText()
+        if not name:
+            return
+        self.instance_sets[name] = self.members()
+        save_instance_sets(self.instance_sets)
+
+    def on_start_set_clicked(self):
+        members = self.members()
+        if not members:
+            return
+        try:
+            instances, warnings = plan_instances(members)
+        except ValueError as e:
+            QMessageBox.critical(self, "Instance Set", f"Error:\n{str(e)}")
+            return
+        if warnings:
+            reply = QMessageBox.warning(self, "Instance Set", "\n".join(warnings) + "\n\nStart anyway?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
+        for instance in instances:
+            print(f"Instance {instance['name']} (CUDA_VISIBLE_DEVICES={instance['env'].get('CUDA_VISIBLE_DEVICES', 'all')}): {instance['command']}")
+
+        self.instance_set = InstanceSet(self.set_dropdown.currentText(), instances, self.restart_on_crash)
+        try:
+            self.instance_set.start()
+        except OSError as e:
+            QMessageBox.critical(self, "Instance Set", f"Error:\nCould not start the instances: {str(e)}")
+            return
+        self.start_set_button.setEnabled(False)
+        self.stop_set_button.setEnabled(True)
+        self.poll_timer.start()
+        self.refresh()
+
+    def on_stop_set_clicked(self):
+        self.stop()
+
+    def on_proxy_strategy_changed(self, strategy):
+        set_gui_config_value("proxy_strategy", strategy)
+        if self.proxy:
+            self.proxy.strategy = strategy
+
+    def on_proxy_button_clicked(self):
+        if self.proxy and self.proxy.running:
+            self.stop_proxy()
+            return
+        # Only instances of the set that are ready get requests
+        self.proxy = LoadBalancingProxy(lambda kind: self.instance_set.backends(kind) if self.instance_set else [], self.proxy_strategy_dropdown.currentText(), self.proxy_ports)
+        try:
+            self.proxy.start()
+        except OSError as e:
+            QMessageBox.critical(self, "Load Balancer", f"Error:\nCould not open the load balancer ports: {str(e)}")
+            self.proxy = None
+            return
+        self.proxy_button.setText("Stop Load Balancer")
+        self.proxy_table.setVisible(True)
+        self.refresh()
+
+    def stop_proxy(self):
+        if self.proxy:
+            self.proxy.stop()
+            self.proxy = None
+        self.proxy_button.setText("Start Load Balancer")
+        self.proxy_table.setVisible(False)
+
+    def stop(self):
+        self.stop_proxy()
+        if self.instance_set:
+            self.instance_set.stop()
+            self.refresh()
+        self.poll_timer.stop()
+        self.start_set_button.setEnabled(True)
+        self.stop_set_button.setEnabled(False)
+
+    @property
+    def running(self):
+        return self.instance_set is not None and self.instance_set.running
+
+    def pids(self):
+        return self.instance_set.pids() if self.instance_set else []
+
+    def on_poll_timer(self):
+        self.instance_set.poll()
+        if self.isVisible():
+            self.refresh()
+        if not self.instance_set.running:
+            self.stop()
+
+    def refresh(self):
+        rows = [
+            [row["name"], row["gpus"], row["ports"], row["state"], format_seconds(row["time_to_ready"]), format_mib(row["peak_vram"]), row["restarts"]]
+            for row in (self.instance_set.status() if self.instance_set else [])
+        ]
+        self.fill_table(self.status_table, ["Instance", "GPUs", "Ports", "State", "Ready after", "Peak VRAM", "Restarts"], rows)
+        if self.proxy:
+            rows = [
+                [name, stats["kind"], stats["port"], stats["requests"], stats["active"], stats["peak_active"], stats["errors"], format_milliseconds(stats["avg_latency"]), format_milliseconds(stats["last_latency"]), format_seconds(stats["avg_duration"])]
+                for name, stats in sorted(self.proxy.stats().items())
+            ]
+            self.fill_table(self.proxy_table, ["Backend", "API", "Port", "Requests", "Outstanding", "Peak outstanding", "Errors", "Avg. first byte", "Last first byte", "Avg. duration"], rows)
+
+    def fill_table(self, table, headers, rows):
+        table.clear()
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            for column_index, value in enumerate(row):
+                table.setItem(row_index, column_index, QTableWidgetItem(str(value)))
+        table.resizeColumnsToContents()
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
 
-        self.init_ui()
-        self.load_settings()
+        # Start with the cached release, the background check replaces it when it's done
+        self.latest_release = load_release_cache().get("release")
+
+        with startup_profiler.phase("init_ui"):
+            self.init_ui()
+        with startup_profiler.phase("load_settings"):
+            self.load_settings()
+        self.init_folder_watcher()
         self.set_ram_slider_max()
         self.update_check()
 
+        # The webui started from the GUI, watched by a timer
+        self.supervisor = None
+        self.browser_url = None
+        # Row in the launch history of the current server process
+        self.launch_id = None
+        self.launch_profile = None
+        self.launch_model = None
+        # Server arguments of the running webui, to tell if a new profile only needs another model
+        self.launch_args = None
+        self.model_switch_thread = None
+        self.pending_launch = None
+        self.instance_set_window = None
+        self.prewarmer = None
+        self.verify_thread = None
+        self.storage_probe_thread = None
+        self.supervisor_timer = QTimer(self)
+        self.supervisor_timer.setInterval(supervisor_poll_interval)
+        self.supervisor_timer.timeout.connect(self.on_supervisor_timer)
+
     def init_ui(self):
         self.setWindowTitle(f'StartUI for oobabooga webui v{version}')
 
@@ -176,6 +726,54 @@ class MainWindow(QMainWindow):
 
         # Main menu
         main_menu = menu.addMenu("StartUI")
+
+        # Terminal selection, only Linux needs to choose an emulator
+        terminal_menu = main_menu.addMenu("Terminal")
+        terminal_menu.setToolTipsVisible(True)
+        self.terminal_action_group = QActionGroup(self)
+        terminal_choices = [("Auto detect", auto_terminal)]
+        if platform.system() == 'Linux':
+            terminal_choices += [(emulator, emulator) for emulator in terminal_emulators if shutil.which(emulator)]
+        else:
+            terminal_choices += [("cmd", "cmd")]
+        terminal_choices += [("No Terminal", no_terminal)]
+        configured_terminal = load_gui_config().get("terminal_emulator", auto_terminal) or auto_terminal
+        for label, terminal in terminal_choices:
+            terminal_action = QAction(label, self, checkable=True)
+            terminal_action.setChecked(terminal == configured_terminal)
+            terminal_action.triggered.connect(lambda checked, terminal=terminal: set_terminal_emulator(terminal))
+            if terminal == no_terminal:
+                terminal_action.setToolTip("Starts the webui without a terminal window. The output is shown in the console StartUI was started from.")
+            self.terminal_action_group.addAction(terminal_action)
+            terminal_menu.addAction(terminal_action)
+
+        # Server supervision
+        self.restart_on_crash_action = QAction("Restart Server on Crash", self, checkable=True)
+        self.restart_on_crash_action.setChecked(load_gui_config().get("restart_on_crash", True))
+        self.restart_on_crash_action.setToolTip("Starts the webui again if it crashes, waiting a bit longer after every crash.")
+        self.restart_on_crash_action.triggered.connect(self.on_restart_on_crash_toggled)
+        main_menu.addAction(self.restart_on_crash_action)
+        self.direct_conda_launch_action = QAction("Fast Conda Launch", self, checkable=True)
+        self.direct_conda_launch_action.setChecked(load_gui_config().get("direct_conda_launch", True))
+        self.direct_conda_launch_action.setToolTip("Reuses the activated Conda environment instead of running conda activate for every start.\nOnly used without a terminal window.")
+        self.direct_conda_launch_action.triggered.connect(lambda checked: set_gui_config_value("direct_conda_launch", checked))
+        main_menu.addAction(self.direct_conda_launch_action)
+        self.prewarm_model_action = QAction("Prewarm Model Files", self, checkable=True)
+        self.prewarm_model_action.setChecked(load_gui_config().get("prewarm_model", False))
+        self.prewarm_model_action.setToolTip("Reads the model files into the page cache while the webui starts up.\nHelps with models on HDDs and network shares, files already cached are skipped.")
+        self.prewarm_model_action.triggered.connect(lambda checked: set_gui_config_value("prewarm_model", checked))
+        main_menu.addAction(self.prewarm_model_action)
+        self.verify_model_action = QAction("Check Model Files Before Start", self, checkable=True)
+        self.verify_model_action.setChecked(load_gui_config().get("verify_model", True))
+        self.verify_model_action.setToolTip("Checks the model files for incomplete downloads before the webui loads them.\nSHA-256 checksums (SHA256SUMS, *.sha256, Hugging Face cache blobs) are compared if there are any.\nUnchanged files are only checked once.")
+        self.verify_model_action.triggered.connect(lambda checked: set_gui_config_value("verify_model", checked))
+        main_menu.addAction(self.verify_model_action)
+        main_menu.addAction("Open Server Log", self.on_open_server_log_clicked)
+        main_menu.addAction("Launch History", self.on_launch_history_clicked)
+        main_menu.addAction("Resource Monitor", self.on_resource_monitor_clicked)
+        main_menu.addAction("Instance Sets", self.on_instance_sets_clicked)
+
+        main_menu.addSeparator()
         main_menu.addAction("Exit", self.close)
 
         # help menu
@@ -231,7 +829,8 @@ class MainWindow(QMainWindow):
         # Model Dropdown
         # Get the list of models in models folder
         model_box = QHBoxLayout()
-        model_folders = [name for name in os.listdir(model_folder) if os.path.isdir(os.path.join(model_folder, name))]
+        with startup_profiler.phase("folder scans: models"):
+            model_folders = model_index.refresh()
         self.model_dropdown = QComboBox()
         self.model_dropdown.addItem("none")
         self.model_dropdown.addItems(model_folders)
@@ -240,6 +839,11 @@ class MainWindow(QMainWindow):
         model_box.addWidget(self.model_dropdown)
         layout.addLayout(model_box, 0, 0)
 
+        # Model Info Label, filled from the model index
+        self.model_info_label = QLabel("")
+        self.model_info_label.setToolTip("Format, size and shards of the selected Model")
+        model_box.addWidget(self.model_info_label)
+
         # Reload Model Button
         self.reload_model_button = QPushButton("Reload the Model List")
         self.reload_model_button.setToolTip("Reloads the Names in the Models Folder")
@@ -269,9 +873,8 @@ class MainWindow(QMainWindow):
 
         # Character Dropdown
         self.character_to_load = QComboBox()
-        # get a list of all .json files in the characters folder
-        character_jsons = [file for file in os.listdir(characters_folder) if file.endswith(".json")]
-        without_suffix = [file.replace(".json", "") for file in character_jsons]
+        with startup_profiler.phase("folder scans: characters"):
+            without_suffix = list_characters()
         self.character_to_load.addItem("none")
         self.character_to_load.addItems(without_suffix)
         self.character_to_load.setToolTip("Select the Character you want to load")
@@ -306,6 +909,10 @@ class MainWindow(QMainWindow):
         groupsize_box.addWidget(self.gsize_dropdown)
         layout.addLayout(groupsize_box, 2, 1, 1, 2)
 
+        # Prefill wbits and groupsize from the model index when the model changes
+        self.update_model_tooltips()
+        self.model_dropdown.currentTextChanged.connect(self.on_model_dropdown_changed)
+
         # Interface Mode Box
         interface_mode_box = QHBoxLayout()
 
@@ -368,16 +975,16 @@ class MainWindow(QMainWindow):
             self.gpu_vram_sliders = []
             self.gpu_vram_labels = []
             self.gpu_labels = []
-            gpu_stats = gpustat.GPUStatCollection.new_query()
+            gpu_stats = hardware.gpus
     
             for i, gpu in enumerate(gpu_stats):
-                gpu_label = QLabel(f"{gpu.name} VRAM:")
-                gpu_label.setToolTip(f"Total VRAM: {gpu.memory_total} MiB\nUsed VRAM: {gpu.memory_used} MiB\nFree VRAM: {gpu.memory_free} MiB")
+                gpu_label = QLabel(f"{gpu['name']} VRAM:")
+                gpu_label.setToolTip(f"Total VRAM: {gpu['memory_total']} MiB\nUsed VRAM: {gpu['memory_used']} MiB\nFree VRAM: {gpu['memory_free']} MiB\nCompute Capability: {gpu['compute_capability']}")
                 layout.addWidget(gpu_label, 11 + i, 0)
                 self.gpu_labels.append(gpu_label)
         
                 vram_slider = QSlider(Qt.Horizontal)
-                vram_slider.setMaximum(int(gpu.memory_total / 1024))
+                vram_slider.setMaximum(int(gpu['memory_total'] / 1024))
                 vram_slider.valueChanged.connect(lambda value, idx=i: self.on_vram_slider_changed(value, idx))
                 layout.addWidget(vram_slider, 11 + i, 1)
         
@@ -392,11 +999,7 @@ class MainWindow(QMainWindow):
 
         # Create the "Built-in RAM" label, slider, and value label
         self.ram_label = QLabel("Built-in RAM:")
-        ram_info = psutil.virtual_memory()
-        total_ram = ram_info.total // (1024 ** 2)  # Convert to MiB
-        used_ram = ram_info.used // (1024 ** 2)  # Convert to MiB
-        free_ram = ram_info.available // (1024 ** 2)  # Convert to MiB
-        self.ram_label.setToolTip(f"Total RAM: {total_ram} MiB\nUsed RAM: {used_ram} MiB\nFree RAM: {free_ram} MiB")
+        self.ram_label.setToolTip(f"Total RAM: {hardware.ram_total} MiB\nUsed RAM: {hardware.ram_used} MiB\nFree RAM: {hardware.ram_available} MiB\nCPU Cores: {hardware.cpu_physical_cores} ({hardware.cpu_logical_cores} Threads)")
         self.ram_label.hide()
         layout.addWidget(self.ram_label, 11, 0)
     
@@ -423,7 +1026,7 @@ class MainWindow(QMainWindow):
         # Don't get confused. With the latest changes, each GPU can have it's own pre_layer value. So we check again gpu_stats for the amount.
         if nvidia_gpu:
             for i, gpu in enumerate(gpu_stats):
-                pre_layer_labels = QLabel(f"{gpu.name} Pre_Layer:")
+                pre_layer_labels = QLabel(f"{gpu['name']} Pre_Layer:")
                 pre_layer_labels.setToolTip(f"The number of layers to allocate to the GPU.\nSetting this parameter enables CPU offloading for 4-bit models.\nFor multi-gpu, write the numbers separated by spaces, eg --pre_layer 30 60.")
                 layout.addWidget(pre_layer_labels, 11 + (len(gpu_stats) * 2) + i, 0)
                 self.pre_layer_labels.append(pre_layer_labels)
@@ -523,6 +1126,16 @@ class MainWindow(QMainWindow):
         self.choose_disk_folder_button.clicked.connect(self.on_choose_disk_folder_button_clicked)
         layout.addWidget(self.choose_disk_folder_button, 20 + (len(gpu_stats) * 2), 1)
 
+        # Disk cache speed test
+        self.disk_cache_probe_label = QLabel("")
+        self.disk_cache_probe_label.setVisible(False)
+        layout.addWidget(self.disk_cache_probe_label, 19 + (len(gpu_stats) * 2), 2)
+        self.disk_cache_probe_button = QPushButton("Test Speed")
+        self.disk_cache_probe_button.setVisible(False)
+        self.disk_cache_probe_button.setToolTip("Measures how fast the disk cache folder reads and writes (takes a few seconds, writes a 256 MiB test file).")
+        self.disk_cache_probe_button.clicked.connect(lambda: self.probe_offload_folder("disk"))
+        layout.addWidget(self.disk_cache_probe_button, 20 + (len(gpu_stats) * 2), 2)
+
         # Use sdp_attention
         self.use_sdp_attention_checkbox = QCheckBox("Use sdp-attention")
         self.use_sdp_attention_checkbox.setToolTip("Use torch 2.0's sdp attention.")
@@ -622,6 +1235,16 @@ class MainWindow(QMainWindow):
         self.deepspeed_nvme_button.clicked.connect(self.on_deepspeed_nvme_button_clicked)
         layout.addWidget(self.deepspeed_nvme_button, 34 + (len(gpu_stats) * 2), 1)
 
+        # NVMe offload speed test
+        self.deepspeed_nvme_probe_label = QLabel("")
+        self.deepspeed_nvme_probe_label.setVisible(False)
+        layout.addWidget(self.deepspeed_nvme_probe_label, 33 + (len(gpu_stats) * 2), 2)
+        self.deepspeed_nvme_probe_button = QPushButton("Test Speed")
+        self.deepspeed_nvme_probe_button.setVisible(False)
+        self.deepspeed_nvme_probe_button.setToolTip("Measures how fast the offload directory reads and writes (takes a few seconds, writes a 256 MiB test file).")
+        self.deepspeed_nvme_probe_button.clicked.connect(lambda: self.probe_offload_folder("nvme"))
+        layout.addWidget(self.deepspeed_nvme_probe_button, 34 + (len(gpu_stats) * 2), 2)
+
         # Local Rank
         self.deepspeed_local_rank_label = QLabel("Local Rank:")
         self.deepspeed_local_rank_label.setVisible(False)
@@ -788,6 +1411,18 @@ class MainWindow(QMainWindow):
         llama_seed_inner_layout.addWidget(self.llama_seed_spinbox)
         layout.addLayout(llama_seed_inner_layout, 46 + (len(gpu_stats) * 2), 1, 1, 2)
 
+        # llama.cpp Autotune Button
+        self.llama_autotune_button = QPushButton("Autotune")
+        self.llama_autotune_button.setToolTip("Starts the webui with different Threads, Batch Size and GPU Layer values,\nmeasures the tokens/s through the API and saves the fastest values into the current Profile.\nThis takes a while, the model is loaded once for every try.")
+        self.llama_autotune_button.setVisible(False)
+        self.llama_autotune_button.clicked.connect(self.on_llama_autotune_button_clicked)
+        layout.addWidget(self.llama_autotune_button, 47 + (len(gpu_stats) * 2), 0)
+
+        # llama.cpp Autotune Status
+        self.llama_autotune_label = QLabel("")
+        self.llama_autotune_label.setVisible(False)
+        layout.addWidget(self.llama_autotune_label, 47 + (len(gpu_stats) * 2), 1, 1, 2)
+
         # Seperator for the Toolbox Options
         self.llama_line = QFrame()
         self.llama_line.setFrameShape(QFrame.HLine)
@@ -1132,14 +1767,9 @@ class MainWindow(QMainWindow):
         layout.addWidget(self.extensions_list, 90 + (len(gpu_stats) * 2), 1, 1, 2)
         self.extensions_list.setFixedHeight(150)
         self.extensions_list.setVisible(False)
-        extensions = [name for name in os.listdir(extensions_folder) if os.path.isdir(os.path.join(extensions_folder, name)) and "api" not in name.lower()]
-        extensions.sort()
-
-        for extension in extensions:
-            item = QListWidgetItem(extension)
-            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-            item.setCheckState(Qt.Unchecked)
-            self.extensions_list.addItem(item)
+        with startup_profiler.phase("folder scans: extensions"):
+            extensions = list_extensions()
+        self.sync_list_widget(self.extensions_list, extensions)
 
         # Lora selection menu
         self.use_lora_checkbox = QCheckBox("Use Loras")
@@ -1152,12 +1782,9 @@ class MainWindow(QMainWindow):
         layout.addWidget(self.lora_list, 100 + (len(gpu_stats) * 2), 1, 1, 2)
         self.lora_list.setVisible(False)
         
-        loras = [name for name in os.listdir(loras_folder) if os.path.isdir(os.path.join(loras_folder, name))]
-        for lora in loras:
-            item = QListWidgetItem(lora)
-            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-            item.setCheckState(Qt.Unchecked)
-            self.lora_list.addItem(item)
+        with startup_profiler.phase("folder scans: loras"):
+            loras = list_loras()
+        self.sync_list_widget(self.lora_list, loras)
 
         # Use Whole Local Network
         self.use_network_checkbox = QCheckBox("Local Network Mode")
@@ -1190,6 +1817,29 @@ class MainWindow(QMainWindow):
         self.start_button.clicked.connect(self.on_start_button_clicked)
         layout.addWidget(self.start_button, 140 + (len(gpu_stats) * 2), 0)
 
+        # Memory Plan Button
+        self.memory_plan_button = QPushButton("Check Memory")
+        self.memory_plan_button.setToolTip("Estimates if the selected Model fits into the VRAM/RAM set above and where it will be placed.")
+        self.memory_plan_button.clicked.connect(self.on_memory_plan_button_clicked)
+        layout.addWidget(self.memory_plan_button, 140 + (len(gpu_stats) * 2), 2)
+
+        # Stop and Restart the webui started with the Start button
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setToolTip("Stops the webui and every process it started.")
+        self.stop_button.clicked.connect(self.on_stop_button_clicked)
+        self.stop_button.setEnabled(False)
+        layout.addWidget(self.stop_button, 145 + (len(gpu_stats) * 2), 0)
+
+        self.restart_button = QPushButton("Restart")
+        self.restart_button.setToolTip("Stops the webui and starts it again with the same settings.")
+        self.restart_button.clicked.connect(self.on_restart_button_clicked)
+        self.restart_button.setEnabled(False)
+        layout.addWidget(self.restart_button, 145 + (len(gpu_stats) * 2), 1)
+
+        self.server_status_label = QLabel("Server: stopped")
+        self.server_status_label.setWordWrap(True)
+        layout.addWidget(self.server_status_label, 145 + (len(gpu_stats) * 2), 2)
+
         self.save_button = QPushButton("Save Settings")
         self.save_button.setToolTip("You can Save your current Settings. Neat, isn't it?")
         self.save_button.clicked.connect(self.on_save_button_clicked)
@@ -1301,6 +1951,8 @@ class MainWindow(QMainWindow):
         self.llama_n_ctx_dropdown.setVisible(state == Qt.Checked)
         self.llama_seed_label.setVisible(state == Qt.Checked)
         self.llama_seed_spinbox.setVisible(state == Qt.Checked)
+        self.llama_autotune_button.setVisible(state == Qt.Checked)
+        self.llama_autotune_label.setVisible(state == Qt.Checked)
 
     def on_deepspeed_nvme_button_clicked(self):
         folder = QFileDialog.getExistingDirectory(self, "Offload Directory")
@@ -1314,6 +1966,42 @@ class MainWindow(QMainWindow):
         self.deepspeed_nvme_label.setVisible(state == Qt.Checked)
         self.deepspeed_nvme_current_label.setVisible(state == Qt.Checked)
         self.deepspeed_nvme_button.setVisible(state == Qt.Checked)
+        self.deepspeed_nvme_probe_label.setVisible(state == Qt.Checked)
+        self.deepspeed_nvme_probe_button.setVisible(state == Qt.Checked)
+
+    def probe_offload_folder(self, mode):
+        if mode == "nvme":
+            folder = self.selected_offload_directory
+            if folder in unset_values:
+                self.show_error_message("Please choose an offload directory first.")
+                return
+            label, button = self.deepspeed_nvme_probe_label, self.deepspeed_nvme_probe_button
+        else:
+            # Without a chosen folder the webui uses its own cache folder
+            folder = self.disk_cache_textfield.text() if self.change_disk_cache_checkbox.isChecked() and self.disk_cache_textfield.text() else os.path.join(repo_path, "cache")
+            label, button = self.disk_cache_probe_label, self.disk_cache_probe_button
+        if self.storage_probe_thread is not None:
+            return
+        button.setEnabled(False)
+        label.setStyleSheet("")
+        label.setText("Testing...")
+        self.storage_probe_thread = StorageProbeThread(folder, self)
+        self.storage_probe_thread.probed.connect(lambda result, error: self.on_storage_probed(result, error, mode, label, button))
+        self.storage_probe_thread.start()
+
+    def on_storage_probed(self, result, error, mode, label, button):
+        self.storage_probe_thread = None
+        button.setEnabled(True)
+        if result is None:
+            label.setText("Test failed")
+            label.setToolTip(error)
+            return
+        warnings = assess_storage(result, mode)
+        label.setText(f"{result['seq_read']:.0f} MB/s read, {result['seq_write']:.0f} MB/s write, {result['random_read_latency']:.2f} ms" + (" - too slow?" if warnings else ""))
+        label.setStyleSheet("QLabel { color: #ff9999; }" if warnings else "")
+        label.setToolTip(describe_storage(result) + ("\n\n" + "\n".join(warnings) if warnings else ""))
+        if warnings:
+            QMessageBox.warning(self, "Storage Speed", f"{describe_storage(result)}\n\n" + "\n".join(warnings))
 
     def on_deepspeed_settings_checkbox_stateChanged(self, state):
         self.deepspeed_label_header.setVisible(state == Qt.Checked)
@@ -1329,6 +2017,57 @@ class MainWindow(QMainWindow):
         self.show_version_window()
 
     def update_check(self):
+        # Show what the cache knows right away, then ask GitHub without blocking the window
+        self.show_update_badge()
+        self.release_check_thread = ReleaseCheckThread(self)
+        self.release_check_thread.release_fetched.connect(self.on_release_fetched)
+        self.release_check_thread.start()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if startup_profiler.enabled and not startup_profiler.reported:
+            startup_profiler.add("first paint", self.shown_time)
+            startup_profiler.report()
+
+    def showEvent(self, event):
+        self.shown_time = time.perf_counter()
+        super().showEvent(event)
+
+    def closeEvent(self, event):
+        # Qt aborts if a QThread object dies while still running, so let the release check finish first
+        if self.release_check_thread.isRunning():
+            self.release_check_thread.wait((release_fetch_timeout + 1) * 1000)
+        if self.verify_thread is not None:
+            # Hashing a big model takes minutes, once cancelled it stops after the current chunk. Nothing is launched then.
+            self.verify_thread.verified.disconnect()
+            model_verifier.cancel()
+            self.verify_thread.wait()
+        if self.storage_probe_thread is not None:
+            self.storage_probe_thread.wait()
+        # Don't leave an autotune server running
+        if getattr(self, "autotune_thread", None) and self.autotune_thread.isRunning():
+            # cancel() stops the server of the current run, which ends its request too
+            self.autotune_thread.cancel()
+            self.autotune_thread.wait(autotune_stop_timeout * 1000)
+        if getattr(self, "resource_monitor_window", None) is not None:
+            self.resource_monitor_window.close()
+        if self.instance_set_window is not None and self.instance_set_window.running:
+            reply = QMessageBox.question(self, "Stop the instances?", "The instance set is still running. Stop it?", QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply == QMessageBox.Yes:
+                self.instance_set_window.stop()
+        # The webui keeps running on its own if the user wants that, otherwise it's stopped with StartUI
+        if self.supervisor and self.supervisor.running:
+            reply = QMessageBox.question(self, "Stop the webui?", "The webui is still running. Stop it?", QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply == QMessageBox.Yes:
+                self.supervisor.stop()
+        super().closeEvent(event)
+
+    def on_release_fetched(self, release):
+        if release:
+            self.latest_release = release
+        self.show_update_badge()
+
+    def show_update_badge(self):
         latest_version = self.get_latest_version()
         if latest_version and latest_version > version:
             self.update_button_ui.setVisible(True)
@@ -1380,36 +2119,18 @@ class MainWindow(QMainWindow):
                 self.show_error_message("Error", f"Could not open the link. Please open it manually.\n{oobabooga_url}")
 
     def get_latest_version(self):
-        try:
-            url = "https://api.github.com/repos/Pakobbix/StartUI-oobabooga-webui/releases/latest"
-            response = requests.get(url)
-            if response.status_code == 200:
-                latest_release = response.json()
-                tag_name = latest_release["tag_name"]
-                return tag_name
-            else:
-                return None
-        except Exception as e:
-            print(f"Error fetching latest version: {str(e)}")
-            return None
+        if self.latest_release:
+            return self.latest_release.get("tag_name")
+        return None
 
     def get_release_notes(self):
-        try:
-            url = "https://api.github.com/repos/Pakobbix/StartUI-oobabooga-webui/releases/latest"
-            response = requests.get(url)
-            if response.status_code == 200:
-                latest_release = response.json()
-                release_notes = latest_release["body"]
-                return release_notes
-            else:
-                return None
-        except Exception as e:
-            print(f"Error fetching release notes: {str(e)}")
-            return None
+        if self.latest_release:
+            return self.latest_release.get("body")
+        return None
 
     def show_about_window(self, action):
         latest_version = self.get_latest_version()
-        release_url = f"https://github.com/Pakobbix/StartUI-oobabself.offload_directoryooga-webui/releases/tag/{latest_version}"
+        release_url = f"https://github.com/Pakobbix/StartUI-oobabooga-webui/releases/tag/{latest_version}"
         if latest_version and latest_version > version:
             about_text = f"A new version ({latest_version}) is available! Please <a href='{release_url}'>update.</a> <br><br>StartUI for oobabooga's webui.<br><br> Current Version: {version}<br><br>This is an GUI (Graphical User Interface), to set flags depending on the user selection."
         else:
@@ -1425,6 +2146,8 @@ class MainWindow(QMainWindow):
     def on_use_disk_checkbox_changed(self, state):
         self.change_disk_cache_checkbox.setVisible(state == Qt.Checked)
         self.current_disk_cache_label.setVisible(state == Qt.Checked)
+        self.disk_cache_probe_label.setVisible(state == Qt.Checked)
+        self.disk_cache_probe_button.setVisible(state == Qt.Checked)
 
         if not self.use_disk_checkbox.isChecked():
             self.choose_disk_folder_label.setVisible(False)
@@ -1457,13 +2180,119 @@ class MainWindow(QMainWindow):
         QMessageBox.critical(self, "Error", message)
 
     def reload_models(self):
-        model_folders = [name for name in os.listdir(model_folder) if os.path.isdir(os.path.join(model_folder, name))]
-        self.model_dropdown.clear()  # Clear the existing items
-        self.model_dropdown.addItems(model_folders)  # Add the updated items
+        # Keeps "none" and the current selection, only adds and removes what changed
+        self.sync_combo_box(self.model_dropdown, model_index.refresh())
+        self.update_model_tooltips()
+        self.watch_model_folders()
+
+    def update_model_tooltips(self):
+        for i in range(self.model_dropdown.count()):
+            model = model_index.get(self.model_dropdown.itemText(i))
+            if model:
+                self.model_dropdown.setItemData(i, self.model_info_text(model), Qt.ToolTipRole)
+
+    def sync_combo_box(self, combo_box, names):
+        # Remove entries that are gone and insert new ones at their sorted position. A leading "none" is kept.
+        wanted = set(names)
+        for i in reversed(range(combo_box.count())):
+            if combo_box.itemText(i) != "none" and combo_box.itemText(i) not in wanted:
+                combo_box.removeItem(i)
+        first = 1 if combo_box.count() and combo_box.itemText(0) == "none" else 0
+        for name in names:
+            if combo_box.findText(name, Qt.MatchExactly) != -1:
+                continue
+            position = first
+            while position < combo_box.count() and combo_box.itemText(position).lower() < name.lower():
+                position += 1
+            combo_box.insertItem(position, name)
+
+    def sync_list_widget(self, list_widget, names):
+        # Same as sync_combo_box, for the checkable lists. Check states of existing items stay untouched.
+        wanted = set(names)
+        for i in reversed(range(list_widget.count())):
+            if list_widget.item(i).text() not in wanted:
+                list_widget.takeItem(i)
+        existing = set(list_widget.item(i).text() for i in range(list_widget.count()))
+        for name in names:
+            if name in existing:
+                continue
+            position = 0
+            while position < list_widget.count() and list_widget.item(position).text().lower() < name.lower():
+                position += 1
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            list_widget.insertItem(position, item)
+
+    def init_folder_watcher(self):
+        # Watch the folders we list in the GUI, so new downloads show up without pressing reload
+        self.folder_watcher = QFileSystemWatcher(self)
+        self.watched_folders = {
+            os.path.normpath(model_folder): self.reload_models,
+            os.path.normpath(loras_folder): lambda: self.sync_list_widget(self.lora_list, list_loras()),
+            os.path.normpath(extensions_folder): lambda: self.sync_list_widget(self.extensions_list, list_extensions()),
+            os.path.normpath(characters_folder): lambda: self.sync_combo_box(self.character_to_load, list_characters()),
+            os.path.normpath(profiles_folder): self.populate_profiles_dropdown,
+        }
+        self.folder_watcher.addPaths([folder for folder in self.watched_folders if os.path.isdir(folder)])
+        self.watch_model_folders()
+        self.folder_watcher.directoryChanged.connect(self.on_watched_folder_changed)
+
+        # Downloads and rsync touch the folders many times in a row, so collect changes for a moment
+        self.pending_folder_changes = set()
+        self.folder_change_timer = QTimer(self)
+        self.folder_change_timer.setSingleShot(True)
+        self.folder_change_timer.setInterval(folder_watch_debounce)
+        self.folder_change_timer.timeout.connect(self.apply_folder_changes)
+
+    def watch_model_folders(self):
+        # Each model folder is watched too, to keep size and shard count in the index up to date
+        if not hasattr(self, "folder_watcher"):
+            return
+        watched = set(self.folder_watcher.directories())
+        model_paths = [os.path.join(model_folder, name) for name in model_index.models]
+        self.folder_watcher.addPaths([path for path in model_paths if path not in watched])
+
+    def on_watched_folder_changed(self, path):
+        self.pending_folder_changes.add(os.path.normpath(path))
+        self.folder_change_timer.start()
+
+    def apply_folder_changes(self):
+        changes = self.pending_folder_changes
+        self.pending_folder_changes = set()
+        for path in changes:
+            if path in self.watched_folders:
+                self.watched_folders[path]()
+            elif os.path.dirname(path) == os.path.normpath(model_folder):
+                # Something changed inside a single model folder
+                name = os.path.basename(path)
+                model = model_index.refresh_model(name)
+                self.update_model_tooltips()
+                if model and self.model_dropdown.currentText() == name:
+                    self.model_info_label.setText(self.model_info_text(model))
+
+    def model_info_text(self, model):
+        info = f"{model['format']}, {format_size(model['size'])}, {model['shards']} shard(s)"
+        if model.get("wbits"):
+            info += f", {model['wbits']}bit"
+        if model.get("groupsize") and model["groupsize"] != "none":
+            info += f" {model['groupsize']}g"
+        return info
+
+    def on_model_dropdown_changed(self, name):
+        model = model_index.get(name)
+        if not model:
+            self.model_info_label.setText("")
+            return
+        self.model_info_label.setText(self.model_info_text(model))
+        # Only prefill values the dropdowns actually offer
+        if model.get("wbits") and self.wbit_dropdown.findText(model["wbits"]) != -1:
+            self.wbit_dropdown.setCurrentText(model["wbits"])
+        if model.get("groupsize") and self.gsize_dropdown.findText(model["groupsize"]) != -1:
+            self.gsize_dropdown.setCurrentText(model["groupsize"])
 
     def set_ram_slider_max(self):
-        ram_size = psutil.virtual_memory().available
-        ram_size_gb = ram_size // (1024 ** 3)
+        ram_size_gb = hardware.ram_available // 1024
         self.ram_slider.setMaximum(ram_size_gb)
 
     def on_ram_slider_changed(self, value):
@@ -1564,95 +2393,55 @@ class MainWindow(QMainWindow):
                 file_path = selected_files[0]
                 self.choose_file_label.setText(file_path)
 
-    def on_save_button_clicked(self):
-        settings = {
-            "model": self.model_dropdown.currentText(), # Saves the Current selected Model
-            "model_type": self.model_type.currentText(), # Saves the Current selected Model Type
-            "wbits": self.wbit_dropdown.currentText(), # Saves the WBIT Setting
-            "groupsize": self.gsize_dropdown.currentText(), # Saves the Groupsize
-            "mode": self.mode_dropdown.currentText(), # Saves the selected interaction mode (Chat,cai_chat,Notebook)
-            "use_gpu": self.gpu_radio_button.isChecked(),  # Save the state of the GPU radio button
-            "use_cpu": self.cpu_radio_button.isChecked(),  # Save the state of the CPU radio button
-            "use_auto": self.auto_radio_button.isChecked(),  # Save the state of the auto device radio button
-            "built_in_ram": self.ram_slider.value(),  # Save the value of the built-in RAM slider
-            "use_8bit": self.use_8bit_checkbox.isChecked(), # Saves the state of the 8bit checkbox
-            "no_stream": self.use_nostream_checkbox.isChecked(), # Saves the state of the no_stream checkbox
-            "use_16bit": self.use_16bit_checkbox.isChecked(), # Saves the state of the use_16bit checkbox
-            "use_disk": self.use_disk_checkbox.isChecked(), # Saves the state of the use_disk checkbox
-            "disk_cache": self.disk_cache_textfield.text(), # Saves the state of the disk_cache textfield
-            "xformers": self.use_xformers_checkbox.isChecked(), # Saves the state of the xformers checkbox
-            "trust_remote_code": self.use_trc_checkbox.isChecked(), # Saves the state of the trust_remote_code checkbox
-            "monkeypatch": self.use_monkey_checkbox.isChecked(), # Saves the state of the monkeypatch checkbox
-            "quant_attn": self.use_quant_checkbox.isChecked(), # Saves the state of the quant_attn checkbox
-            "multimodal": self.use_multimodal_checkbox.isChecked(), # Saves the state of the multimodal checkbox
-            "sdp_attention": self.use_sdp_attention_checkbox.isChecked(), # Saves the state of the sdp_attention checkbox
-            "autogptq": self.use_autogptq_checkbox.isChecked(), # Saves the state of the autogptq checkbox
-            "triton": self.use_triton_checkbox.isChecked(), # Saves the state of the triton checkbox
-            "acceleration": self.Accelerate_settings_checkbox.isChecked(), # Saves the state of the Accelerate checkbox
-            "use_4bit": self.accelerate4bit_checkbox.isChecked(), # Saves the state of the accelerate4bit checkbox
-            "compute_dtype": self.accelerate4bit_compute_type_dropdown.currentText(), # Saves the state of the accelerate4bit_compute_type_dropdown
-            "quant_type": self.accelerate4bit_quant_type_dropdown.currentText(), # Saves the state of the accelerate4bit_quant_type_dropdown
-            "use_x2_quant": self.accelerate4bit_double_quant_checkbox.isChecked(), # Saves the state of the accelerate4bit_double_quant_checkbox
-            "deepspeed": self.deepspeed_settings_checkbox.isChecked(), # Saves the state of the deepspeed checkbox
-            "deepspeed_enabled": self.deepspeed_checkbox.isChecked(), # Saves the state of the deepspeed checkbox
-            "deepspeed_gpu_num": self.deepspeed_gpu_num_spinbox.value(), # Saves the state of the deepspeed_gpu_num_spinbox
-            "deepspeed_nvme_enabled": self.deepspeed_nvme_checkbox.isChecked(), # Saves the state of the deepspeed_nvme_checkbox
-            "deepspeed_nvme_path": self.selected_offload_directory, # Saves the state of the offload_directory
-            "deepspeed_local_rank": self.deepspeed_local_rank_spinbox.value(), # Saves the state of the deepspeed_local_rank_spinbox
-            "llama_settings": self.llama_settings_checkbox.isChecked(), # Saves the state of the llama_settings_checkbox
-            "llama_threads": self.llama_threads_spinbox.value(), # Saves the state of the llama_threads_spinbox
-            "llama_batch_size": self.llama_batch_size_spinbox.value(), # Saves the state of the llama_batch_size_spinbox
-            "llama_no_map": self.llama_mmap_checkbox.isChecked(), # Saves the state of the llama_no_map_checkbox
-            "llama_use_mlock": self.llama_mlock_checkbox.isChecked(), # Saves the state of the llama_mlock_checkbox
-            "llama_cache_capacity": self.llama_cache_capacity_spinbox.value(), # Saves the state of the llama_cache_capacity_spinbox
-            "llama_cache_units": self.llama_cache_capacity_units.currentText(), # Saves the state of the llama_cache_capacity_units
-            "llama_gpu_layer": self.llama_gpu_layer_spinbox.value(), # Saves the state of the llama_gpu_layer_spinbox
-            "llama_n_ctx": self.llama_n_ctx_dropdown.currentText(), # Saves the state of the llama_n_ctx_dropdown
-            "llama_seed": self.llama_seed_spinbox.value(), # Saves the state of the llama_seed_spinbox
-            "flexgen_settings": self.flexgen_settings_checkbox.isChecked(), # Saves the state of the flexgen_settings_checkbox
-            "use_flexgen": self.flexgen_checkbox.isChecked(), # Saves the state of the flexgen_checkbox
-            "flexgen_precentage_1": self.flexgen_percentage_spinbox1.value(), # Saves the state of the flexgen_percentage_spinbox1
-            "flexgen_precentage_2": self.flexgen_percentage_spinbox2.value(), # Saves the state of the flexgen_percentage_spinbox2
-            "flexgen_precentage_3": self.flexgen_percentage_spinbox3.value(), # Saves the state of the flexgen_percentage_spinbox3
-            "flexgen_precentage_4": self.flexgen_percentage_spinbox4.value(), # Saves the state of the flexgen_percentage_spinbox4
-            "flexgen_precentage_5": self.flexgen_percentage_spinbox5.value(), # Saves the state of the flexgen_percentage_spinbox5
-            "flexgen_precentage_6": self.flexgen_percentage_spinbox6.value(), # Saves the state of the flexgen_percentage_spinbox6
-            "flexgen_compression": self.flexgen_compression_checkbox.isChecked(), # Saves the state of the flexgen_compression_checkbox
-            "flexgen_pin_weight": self.flexgen_pin_weight_dropdown.currentText(), # Saves the state of the flexgen_pin_weight_dropdown
-            "rwkv_settings": self.rwkv_settings_checkbox.isChecked(), # Saves the state of the rwkv_settings_checkbox
-            "use_rwkv": self.rwkv_checkbox.isChecked(), # Saves the state of the rwkv_checkbox
-            "rwkv_strategy": self.rwkv_strategy_checkbox.isChecked(), # Saves the state of the rwkv_strategy_checkbox
-            "rwkv_strategy_dropdown": self.rwkv_strategy_dropdown.currentText(), # Saves the state of the rwkv_strategy_dropdown
-            "rwkv_allocation": self.rwkv_allocation_spinbox.value(), # Saves the state of the rwkv_allocation_spinbox
-            "rwkv_cuda": self.rwkv_cuda_checkbox.isChecked(), # Saves the state of the rwkv_cuda_checkbox
-            "api_settings": self.api_settings_checkbox.isChecked(), # Saves the state of the api_settings_checkbox
-            "use_api": self.api_checkbox.isChecked(), # Saves the state of the api_checkbox
-            "api_blocking_port_enabled": self.api_blocking_port_checkbox.isChecked(), # Saves the state of the api_blocking_port_checkbox
-            "api_blocking_port": self.api_blocking_port_SpinBox.value(), # Saves the state of the api_blocking_port_SpinBox
-            "api_streaming_port_enabled": self.api_streaming_port_checkbox.isChecked(), # Saves the state of the api_streaming_port_checkbox
-            "api_streaming_port": self.api_streaming_port_SpinBox.value(), # Saves the state of the api_streaming_port_SpinBox
-            "public_api": self.api_public_checkbox.isChecked(), # Saves the state of the api_public_checkbox
-            "autotune": self.use_autotune_checkbox.isChecked(), # Saves the state of the autotune checkbox
-            "autolaunch": self.use_autolaunch_checkbox.isChecked(), # Saves the state of the autotune checkbox
-            "autoclose": self.use_autoclose_checkbox.isChecked(), # Saves the state of the autotune checkbox
-            "nocache": self.use_nocache_checkbox.isChecked(), # Saves the state of the autotune checkbox
-            "listen": self.use_network_checkbox.isChecked(), # Saves the state of the Local Network Checkbox
-            "listen_port": self.listen_port_checkbox.isChecked(), # Saves the state of the Listen Port Checkbox
-            "port_number": self.listen_port_textfield.text(), # Saves the Port given in the Textbox
-            "authentication": self.authentication_checkbox.isChecked(), # Saves the state of the Authentication
-            "authentication_file": self.choose_file_label.text(),  # Save the authentication file path
-            "character": self.character_to_load.currentText(), # Saves the Characters given in the Textbox
-            "use_extension": self.use_extensions_checkbox.isChecked(), # Saves the state of the Extension Checkbox
-            "extensions": [self.extensions_list.item(i).text() for i in range(self.extensions_list.count()) if self.extensions_list.item(i).checkState() == Qt.Checked], # Saves the chosen Extensions
-            "use_lora": self.use_lora_checkbox.isChecked(), # Saves the state of the Lora Checkbox
-            "loras": [self.lora_list.item(i).text() for i in range(self.lora_list.count()) if self.lora_list.item(i).checkState() == Qt.Checked] # Saves the chosen loras
-        }
-
-        pre_layer_values = [slider.value() for slider in self.pre_layer_slider]
-        settings["prelayer"] = pre_layer_values
+    def get_settings(self):
+        # Every setting is read from the widget flag_schema binds it to
+        settings = {}
+        for setting in schema:
+            widget = getattr(self, setting.widget, None)
+            # No Nvidia GPU means no VRAM sliders
+            if widget is None:
+                continue
+            settings[setting.key] = self.read_setting_widget(widget, setting.kind)
+        return settings
+
+    def read_setting_widget(self, widget, kind):
+        if kind == "check":
+            return widget.isChecked()
+        if kind == "combo":
+            return widget.currentText()
+        if kind == "spin":
+            return widget.value()
+        if kind == "text":
+            return widget.text()
+        if kind == "checklist":
+            return [widget.item(i).text() for i in range(widget.count()) if widget.item(i).checkState() == Qt.Checked]
+        if kind == "sliders":
+            return [slider.value() for slider in widget]
+        return widget
+
+    def write_setting_widget(self, setting, value):
+        widget = getattr(self, setting.widget, None)
+        if widget is None:
+            return
+        if setting.kind == "check":
+            widget.setChecked(bool(value))
+        elif setting.kind == "combo":
+            widget.setCurrentText(str(value))
+        elif setting.kind == "spin":
+            widget.setValue(int(value))
+        elif setting.kind == "text":
+            widget.setText(str(value))
+        elif setting.kind == "checklist":
+            for i in range(widget.count()):
+                widget.item(i).setCheckState(Qt.Checked if widget.item(i).text() in value else Qt.Unchecked)
+        elif setting.kind == "sliders":
+            for slider, slider_value in zip(widget, value):
+                slider.setValue(slider_value)
+        else:
+            setattr(self, setting.widget, value)
 
-        if nvidia_gpu:
-            settings["gpu_vram"] = [slider.value() for slider in self.gpu_vram_sliders]
+    def on_save_button_clicked(self):
+        settings = self.get_settings()
 
         # Get the text entered in the text field
         profile_name = self.profile_name_textfield.text()
@@ -1662,266 +2451,353 @@ class MainWindow(QMainWindow):
         with open(file_path, "w") as file:
             json.dump(settings, file, indent=4)
 
-    def expression_check(self, command):
-        selected_model = self.model_dropdown.currentText()
-        
-        # Use a regular expression to check if the selected model matches the pattern
-        if re.search(r".*mpt.*7b", selected_model, re.IGNORECASE):
-            # Run the additional commands
-            run_cmd_with_conda("pip install einops && exit")
-        elif re.search(r".*vicuna.*7b", selected_model, re.IGNORECASE):
-            pass
-
-    def on_start_button_clicked(self):
-        command = ""
-
-        # LLama Stuff
+    def build_memory_plan(self):
+        # Returns (plan, suggestion) for the selected model, or (None, None) if we know nothing about it
+        model = model_index.get(self.model_dropdown.currentText())
+        if not model or not model.get("size"):
+            return None, None
 
-        # llama.cpp threads
+        required = estimate_model_memory(model, self.use_8bit_checkbox.isChecked(), self.accelerate4bit_checkbox.isChecked())
+        ram_available = hardware.ram_available // 1024
+        pre_layer_values = [slider.value() for slider in self.pre_layer_slider]
 
-        if self.llama_threads_spinbox.value() != 0:
-            command += f" --threads {self.llama_threads_spinbox.value()}"
-            command += f" --n_batch {self.llama_batch_size_spinbox.value()}"
-            command += f" --cache-capacity {self.llama_cache_capacity_spinbox.value()}{self.llama_cache_capacity_units.currentText()}"
-            command += f" --n_ctx {self.llama_n_ctx_dropdown.currentText()}"
-            command += f" --llama_cpp_seed {self.llama_seed_spinbox.value()}"
+        if self.cpu_radio_button.isChecked():
+            gpu_limits = []
+            cpu_limit = self.ram_slider.value()
+        elif self.gpu_radio_button.isChecked() and any(pre_layer_values) and model.get("layers"):
+            # With pre_layer, the GPUs get exactly their share of the layers and the rest goes to the CPU
+            layer_size = required / model["layers"]
+            gpu_limits = [(value * layer_size + gpu_overhead) / gib for value in pre_layer_values]
+            cpu_limit = ram_available
+        elif self.gpu_radio_button.isChecked():
+            gpu_limits = [slider.value() for slider in self.gpu_vram_sliders]
+            # The webui lets accelerate use up to 99GiB of RAM, if --cpu-memory isn't set
+            cpu_limit = self.ram_slider.value() or ram_available
+        else:
+            # Autodevice uses whatever is free
+            gpu_limits = [gpu["memory_free"] // 1024 for gpu in hardware.gpus]
+            cpu_limit = ram_available
+
+        use_disk = self.use_disk_checkbox.isChecked() or (self.deepspeed_checkbox.isChecked() and self.deepspeed_nvme_checkbox.isChecked())
+        plan = plan_memory(required, gpu_limits, cpu_limit, use_disk)
+        suggestion = suggest_settings(required, hardware.gpus, hardware.ram_available, model.get("layers"))
+        return plan, suggestion
+
+    def on_memory_plan_button_clicked(self):
+        plan, suggestion = self.build_memory_plan()
+        if plan is None:
+            QMessageBox.information(self, "Memory Plan", "No size information for the selected Model.")
+            return
+        title = "The Model should fit" if plan["fits"] else "The Model will not fit"
+        QMessageBox.information(self, "Memory Plan", f"{title}\n\n{describe_plan(plan, suggestion)}")
+
+    def on_llama_autotune_button_clicked(self):
+        # A second click cancels a running autotune
+        if getattr(self, "autotune_thread", None) and self.autotune_thread.isRunning():
+            self.autotune_thread.cancel()
+            self.llama_autotune_label.setText("Cancelling after the current run...")
+            return
 
-        if self.llama_gpu_layer_spinbox.value() != 0:
-            command += f" --n-gpu-layers {self.llama_gpu_layer_spinbox.value()}"
+        chosen_model = self.model_dropdown.currentText()
+        if chosen_model == "none":
+            self.show_error_message("Choose a llama.cpp Model to autotune first.")
+            return
 
+        # Everything but the tuned values stays as set in the GUI
+        base_args = ["--model", chosen_model, "--n_ctx", self.llama_n_ctx_dropdown.currentText()]
         if self.llama_mmap_checkbox.isChecked():
-            command += " --no-map"
-
+            base_args.append("--no-mmap")
         if self.llama_mlock_checkbox.isChecked():
-            command += " --mlock"
-
-        # FlexGen Commands
-
-        if self.flexgen_checkbox.isChecked():
-            command += " --flexgen"
-            command += f" --percent {self.flexgen_percentage_spinbox1.value()} {self.flexgen_percentage_spinbox2.value()} {self.flexgen_percentage_spinbox3.value()} {self.flexgen_percentage_spinbox4.value()} {self.flexgen_percentage_spinbox5.value()} {self.flexgen_percentage_spinbox6.value()}"
-            if self.flexgen_compression_checkbox.isChecked():
-                command += " --compression-weight"
-            if self.flexgen_pin_weight_dropdown.currentText() != "none":
-                command += f" --pin-weight {self.flexgen_pin_weight_dropdown.currentText()}"
+            base_args.append("--mlock")
+
+        model = model_index.get(chosen_model) or {}
+        space = build_search_space(hardware.cpu_physical_cores, hardware.cpu_logical_cores, nvidia_gpu, model.get("layers"))
+        self.autotune_thread = AutotuneThread(base_args, space, self)
+        self.autotune_thread.progress.connect(self.llama_autotune_label.setText)
+        self.autotune_thread.tuned.connect(self.on_llama_autotune_finished)
+        self.autotune_thread.start()
+        self.llama_autotune_button.setText("Cancel Autotune")
+        self.llama_autotune_label.setText("Starting...")
+
+    def on_llama_autotune_finished(self, result):
+        self.llama_autotune_button.setText("Autotune")
+        if not result["ok"]:
+            self.llama_autotune_label.setText("Autotune failed, the server didn't start with any of the tried settings.")
+            return
+
+        params = result["params"]
+        self.llama_threads_spinbox.setValue(params["threads"])
+        self.llama_batch_size_spinbox.setValue(params["n_batch"])
+        if "n_gpu_layers" in params:
+            self.llama_gpu_layer_spinbox.setValue(params["n_gpu_layers"])
+        self.llama_autotune_label.setText(f"Best: {result['prompt_tps']:.1f} prompt t/s, {result['generation_tps']:.1f} t/s ({result['evaluations']} runs). Saved to the Profile.")
+        # Write the winning values into the current profile
+        self.on_save_button_clicked()
 
-        # Add the chosen model to the command
-        chosen_model = self.model_dropdown.currentText()
-        if self.model_dropdown.currentText() != "none":
-            command += f" --model {chosen_model}"
-
-        # Add the chosen model type to the command
-        if self.model_type.currentText() != "none" and self.model_dropdown.currentText() != "none":
-            command += f" --model_type {self.model_type.currentText()}"
-
-        # Add loras to the command
-        loras = [self.lora_list.item(i).text() for i in range(self.lora_list.count()) if self.lora_list.item(i).checkState() == Qt.Checked]
-        if self.use_lora_checkbox.isChecked() and self.model_dropdown.currentText() != "none":
-            if loras:
-                command += f" --lora {' '.join(loras)}"
-
-        # Add Characters to the command
-        if self.character_to_load.currentText() != "none":
-            command += f" --character {self.character_to_load.currentText()}"
-
-        # Adds wbits to the command, if not "none"
-        if self.wbit_dropdown.currentText() != "none":
-            if not self.cpu_radio_button.isChecked() and self.model_dropdown.currentText() != "none":
-                command += f" --wbits {self.wbit_dropdown.currentText()}"
-
-        # Adds Groupsize to the command, if not "none"
-        if self.gsize_dropdown.currentText() != "none":
-            if not self.cpu_radio_button.isChecked() and self.model_dropdown.currentText() != "none":
-                command += f" --groupsize {self.gsize_dropdown.currentText()}"
-
-        # Add the chosen mode to the command (Chat, cai-chat, notebook)
-        chosen_mode = self.mode_dropdown.currentText()
-        command += f" --{chosen_mode}"
-
-        # Handle GPU or CPU selection
-        if self.gpu_radio_button.isChecked():
-            # GPU radio button is selected
-            total_vram = sum(slider.value() for slider in self.gpu_vram_sliders)
-            if total_vram == 0:
-                error_message = "Error:\nAt least one VRAM value must be greater than 0 for GPU execution."
-                self.show_error_message(error_message)
-            else:
-                command += " --gpu-memory"
-                for vram in [slider.value() for slider in self.gpu_vram_sliders]:
-                    if vram > 0:
-                        command += f" {vram}"
-        elif self.cpu_radio_button.isChecked():
-            # CPU radio button is selected
-            command += " --cpu-memory"
-            ram_value = self.ram_slider.value()
-            if ram_value > 0:
-                command += f" {ram_value}"
-            else:
-                # Display an error message in a dialog box when RAM value is 0
-                error_message = "Error:\nRAM value cannot be 0 for CPU execution."
-                self.show_error_message(error_message)
+    def on_start_button_clicked(self):
+        # Warn before loading a model that would run out of memory
+        plan, suggestion = self.build_memory_plan()
+        if plan is not None and not plan["fits"]:
+            message = f"The selected Model will probably not fit into the memory you've set.\n\n{describe_plan(plan, suggestion)}\n\nStart anyway?"
+            reply = QMessageBox.warning(self, "Memory Plan", message, QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
                 return
 
-        # Auto Device is Activated:
-        elif self.auto_radio_button.isChecked():
-            command += " --auto-device"
-
-        # Add 8bit loading
-        if self.use_8bit_checkbox.isChecked():
-            command += " --load-in-8bit"
-
-        # Add no-stream
-        if self.use_nostream_checkbox.isChecked():
-            command += " --no-stream"
-
-        # Add 16bit full precision loading
-        if self.use_16bit_checkbox.isChecked():
-            command += " --bf16"
-
-        # Add xformers loading
-        if self.use_xformers_checkbox.isChecked():
-            command += " --xformers"
-
-        # Use "Trust Remote Code=TRUE" for ex. MPT-7B
-        if self.use_trc_checkbox.isChecked():
-            command += " --trust-remote-code"
-        if re.search(r"mpt.*7b", chosen_model):
-            if not self.use_trc_checkbox.isChecked():
-                command += " --trust-remote-code"
-
-        # Use Triton Warmup & Autotune
-        if self.use_autotune_checkbox.isChecked():
-            command += " --warmup_autotune"
-
-        # Add loading with Monkey Patch 
-        if self.use_monkey_checkbox.isChecked():
-            command += " --monkey-patch"
-
-        # Enable quant attention
-        if self.use_quant_checkbox.isChecked():
-            command += " --quant_attn"
-
-        # Accelerate 4-bit
-
-        # 4-bit usage
-        if self.accelerate4bit_checkbox.isChecked():
-            command += " --load-in-4bit"
-
-        if self.accelerate4bit_compute_type_dropdown.currentText() != "none":
-            command += f" --compute_dtype {self.accelerate4bit_compute_type_dropdown.currentText()}"
-
-        if self.accelerate4bit_quant_type_dropdown.currentText() != "none":
-            command += f" --quant_type {self.accelerate4bit_quant_type_dropdown.currentText()}"
-
-        if self.accelerate4bit_double_quant_checkbox.isChecked():
-            command += " --use_double_quant"
-
-        # Disable Cache
-        if self.use_nocache_checkbox.isChecked():
-            command += " --no-cache"
-
-        # Add --auto-launch
-        if self.use_autolaunch_checkbox.isChecked():
-            command += " --auto-launch"
-
-        # Local Network Mode
-        if self.use_network_checkbox.isChecked():
-            command += " --listen"
-
-        # Multimodal Mode
-        if self.use_multimodal_checkbox.isChecked():
-            command += " --multimodal-pipeline"
-
-        # Use Disk to store part of the Model
-        if self.use_disk_checkbox.isChecked():
-            command += " --disk"
-            if self.change_disk_cache_checkbox.isChecked():
-                if self.disk_cache_textfield.text():
-                    command += f" --disk-cache-dir {self.disk_cache_textfield.text()}"
-
-        # Add listen port if the checkbox is checked and a port number is provided
-        if self.listen_port_checkbox.isChecked():
-            listen_port = self.listen_port_textfield.text()
-            if listen_port.isdigit():
-                command += f" --listen-port {listen_port}"
-
-        # Adds the authentication to the command, if active
-        if self.authentication_checkbox.isChecked():
-            if self.choose_file_label.text():
-                command += f" --gradio-auth-path {self.choose_file_label.text()}"
-
-        ## Adds the Prelayer selection
-        slider_values = [slider.value() for slider in self.pre_layer_slider]
-        if any(value > 0 for value in slider_values):
-            command += f" --pre_layer {' '.join(str(value) for value in slider_values if value > 0)}"
-
-        # IF sdp_attention is checked
-        if self.use_sdp_attention_checkbox.isChecked():
-            command += " --sdp-attention"
-
-        # If AutoGPTQ is checked
-        if self.use_autogptq_checkbox.isChecked():
-            command += " --autogptq"
-
-        # If triton is checked
-        if self.use_triton_checkbox.isChecked():
-            command += " --triton"
-
-        # if desc_act is checked
-        if self.use_desc_act_checkbox.isChecked():
-            command += " --desc_act"
-
-        # Adds the chosen extensions to the list of the command.
-        extensions = [self.extensions_list.item(i).text() for i in range(self.extensions_list.count()) if self.extensions_list.item(i).checkState() == Qt.Checked]
-        if self.use_extensions_checkbox.isChecked():
-            if extensions:
-                command += f" --extensions {' '.join(extensions)}"
-
-        if self.api_checkbox.isChecked():
-            command += " --api"
-            if self.api_public_checkbox.isChecked():
-                command += " --public-api"
-        if self.api_checkbox.isChecked() and not self.api_public_checkbox.isChecked():
-            if self.api_blocking_port_checkbox.isChecked():
-                command += f" --api-blocking-port {self.api_blocking_port_SpinBox.text()}"
-            if self.api_streaming_port_checkbox.isChecked():
-                command += f" --api-streaming-port {self.api_streaming_port_SpinBox.text()}"
+        # The command is built from the same settings a profile would save, so GUI and headless launches match
+        settings = self.get_settings()
+        # A supervised server gets the browser opened by StartUI once it's ready, instead of --auto-launch
+        open_browser = settings["autolaunch"] and not settings["autoclose"]
+        launch_settings = dict(settings, autolaunch=False) if open_browser else settings
+        try:
+            launch_command = build_launch_command(launch_settings)
+            server_args = launch_args(launch_settings, build_command_args(launch_settings))
+        except ValueError as e:
+            self.show_error_message(f"Error:\n{str(e)}")
+            return
 
         # Just for debugging.
-        print(f"Command generated: python {webui_file} {command}")
-
-        # Based on the Model that's chosen, we will take care of some necessary stuff.
-        # Starts the webui in the conda env with the user given Options
-        if self.deepspeed_checkbox.isChecked():
-            if platform.system() == "Linux":
-                gpu_number = self.deepspeed_gpu_num_spinbox.text()
-
-                deepspeed_command = f"deepspeed --num_gpus={gpu_number} ./text-generation-webui/server.py --deepspeed"
-                if self.deepspeed_nvme_checkbox.isChecked():
-                    deepspeed_command += f" --nvme-offload-dir {self.offload_directory}"
-                if self.deepspeed_local_rank_spinbox.text() != "0":
-                    deepspeed_command += f" --local_rank {self.deepspeed_local_rank_spinbox.text()}"
-                run_cmd_with_conda(f"pip install deepspeed ; clear && {deepspeed_command} {command}")
-            elif platform.system() == "Windows":
-                message = "DeepSpeed is currently not supported on Windows"
-                QMessageBox.critical(self, "Error", message)
-
-        if not self.deepspeed_checkbox.isChecked():
-            if self.use_8bit_checkbox.isChecked():
-                run_cmd_with_conda(f"pip install accelerate && python {webui_file} {command}")
-            else:
-                run_cmd_with_conda(f"python {webui_file} {command}")
+        print(f"Command generated: {launch_command}")
 
+        # Broken shards otherwise only fail minutes into loading. Once checked, an unchanged model costs a stat() per file.
+        if self.verify_model_action.isChecked() and settings["model"] not in unset_values:
+            if self.verify_thread is not None:
+                return
+            launch = (settings, launch_settings, launch_command, server_args, open_browser)
+            self.verify_thread = ModelVerifyThread(os.path.join(model_folder, settings["model"]), self)
+            self.verify_thread.verified.connect(lambda result: self.on_model_verified(result, launch))
+            self.verify_thread.start()
+            if not (self.supervisor and self.supervisor.running):
+                self.server_status_label.setText("Server: checking model files")
+            return
+        self.launch(settings, launch_settings, launch_command, server_args, open_browser)
+
+    def on_model_verified(self, result, launch):
+        self.verify_thread = None
+        if result.get("cancelled"):
+            return
+        print(f"Model check: {result['checked']} files checked, {result['cached']} unchanged")
+        if not result["ok"]:
+            problems = "\n".join(result["problems"][:10]) + ("\n..." if len(result["problems"]) > 10 else "")
+            reply = QMessageBox.warning(self, "Model Check", f"Some model files look broken:\n\n{problems}\n\nStart anyway?", QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                if not (self.supervisor and self.supervisor.running):
+                    self.server_status_label.setText("Server: model files broken")
+                return
+        if not (self.supervisor and self.supervisor.running):
+            self.server_status_label.setText("Server: stopped")
+        self.launch(*launch)
+
+    def launch(self, settings, launch_settings, launch_command, server_args, open_browser):
         if self.use_autoclose_checkbox.isChecked():
+            # Nobody is left to watch the server, so it gets its own terminal like before
+            run_cmd_with_conda(launch_command)
             sys.exit()
+
+        if self.model_switch_thread is not None:
+            self.show_error_message("Error:\nThe webui is still loading the last model.")
+            return
+        if self.supervisor and self.supervisor.running:
+            plan = self.plan_running_switch(launch_settings, server_args)
+            if plan["action"] == "load":
+                # Only the model changed, the running server loads it without a restart
+                self.pending_launch = (settings, launch_command, server_args, open_browser, self.supervisor, self.supervisor.started_at)
+                self.switch_running_model(plan)
+                return
+            if plan["action"] == "none":
+                question = "The webui already runs with these settings. Restart it anyway?"
+            else:
+                question = f"The webui is already running and needs a restart, {plan['reason']}. Restart it with these settings?"
+            reply = QMessageBox.question(self, "Restart the webui?", question, QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply != QMessageBox.Yes:
+                return
+            self.supervisor.stop()
+
+        self.start_server(settings, launch_command, server_args, open_browser)
+
+    def start_server(self, settings, launch_command, server_args, open_browser):
+        # Something else on our ports would look like a ready server
+        ports = server_ports(settings)
+        busy_ports = [f"{name} ({port})" for name, port in ports.items() if port_open(port)]
+        if busy_ports:
+            self.show_error_message(f"Error:\nThese ports are already in use: {', '.join(busy_ports)}\nIs another webui still running?")
+            return
+        self.browser_url = f"http://127.0.0.1:{ports['webui']}" if open_browser else None
+        self.launch_profile = self.profile_name_textfield.text() or "default"
+        self.launch_model = settings["model"]
+        self.launch_args = server_args
+
+        # The shards are read while Conda and the webui imports start, instead of after them
+        self.stop_prewarm()
+        if self.prewarm_model_action.isChecked() and settings["model"] not in unset_values:
+            # Up to most of the free RAM, more would push the first shards out of the cache again
+            self.prewarmer = ModelPrewarmer(os.path.join(model_folder, settings["model"]), budget=int(hardware.ram_available * 0.8) * 1024 ** 2)
+            self.prewarmer.start()
+
+        # Starts the webui in the conda env with the user given Options, owned by StartUI
+        self.supervisor = ServerSupervisor(launch_command, server_log_file, self.restart_on_crash_action.isChecked(), self.on_server_event, ports=ports)
+        try:
+            self.supervisor.start()
+        except OSError as e:
+            self.show_error_message(f"Error:\nCould not start the webui: {str(e)}")
+            return
+        self.supervisor_timer.start()
+
+    def plan_running_switch(self, settings, server_args):
+        if self.launch_args is None or self.supervisor.ready_at is None:
+            return {"action": "restart", "reason": "because it is still starting"}
+        if missing_packages(settings):
+            return {"action": "restart", "reason": "because packages have to be installed first"}
+        plan = plan_switch(self.launch_args, server_args, "api" in self.supervisor.ports)
+        if plan["action"] == "restart":
+            plan["reason"] = f"because {plan['reason']}"
+        return plan
+
+    def switch_running_model(self, plan):
+        print(f"Loading {plan['model_name']} into the running webui ({plan['reason']})")
+        api_url = f"http://127.0.0.1:{self.supervisor.ports['api']}/api/v1"
+        self.model_switch_thread = ModelSwitchThread(api_url, plan, self)
+        self.model_switch_thread.switched.connect(self.on_model_switched)
+        self.model_switch_thread.start()
+        self.server_status_label.setText(f"Server: loading {plan['model_name']}")
+
+    def on_model_switched(self, plan, result):
+        self.model_switch_thread = None
+        settings, launch_command, server_args, open_browser, supervisor, started_at = self.pending_launch
+        self.pending_launch = None
+        if plan is None:
+            reply = QMessageBox.question(self, "Model switch failed", f"The running webui couldn't load the model:\n{result}\n\nRestart the webui with these settings instead?", QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply == QMessageBox.Yes:
+                if self.supervisor:
+                    self.supervisor.stop()
+                self.start_server(settings, launch_command, server_args, open_browser)
+            else:
+                self.server_status_label.setText("Server: model switch failed")
+            return
+
+        # The server was stopped or restarted while it loaded, the model went with it
+        if self.supervisor is not supervisor or supervisor.started_at != started_at or not supervisor.running:
+            self.server_status_label.setText("Server: restarted while the model was loading")
+            return
+
+        # A restart after a crash has to start the server with the model it runs now
+        self.supervisor.command = launch_command
+        self.launch_args = server_args
+        self.launch_model = settings["model"]
+        self.server_status_label.setText(f"Server: ready, {plan['model_name']} loaded in {result:.1f}s")
+
+    def stop_prewarm(self):
+        if self.prewarmer is not None:
+            self.prewarmer.cancel()
+            self.prewarmer = None
+
+    def on_stop_button_clicked(self):
+        self.stop_prewarm()
+        if self.supervisor:
+            self.supervisor.stop()
+        self.supervisor_timer.stop()
+
+    def on_restart_button_clicked(self):
+        if self.supervisor:
+            self.supervisor.restart()
+            self.supervisor_timer.start()
+
+    def on_supervisor_timer(self):
+        if self.supervisor:
+            self.supervisor.poll()
+            if self.supervisor.running:
+                self.server_status_label.setToolTip(f"Processes: {', '.join(str(pid) for pid in self.supervisor.pids)}\nLog: {os.path.abspath(server_log_file)}")
+                if self.supervisor.ready_at is None:
+                    self.server_status_label.setText(f"Server: loading ({time.time() - self.supervisor.started_at:.0f}s){self.prewarm_status()}")
+
+    def prewarm_status(self):
+        status = self.prewarmer.status() if self.prewarmer is not None else ""
+        return f", {status}" if status else ""
+
+    def on_server_event(self, state, message):
+        self.record_launch(state)
+        self.server_status_label.setText(f"Server: {state}" + (f" ({message})" if message else ""))
+        # Stop also cancels a pending restart after a crash
+        active = self.supervisor.running or self.supervisor.restart_at is not None
+        self.stop_button.setEnabled(active and state != "stopping")
+        self.restart_button.setEnabled(state != "stopping")
+        if not active:
+            self.supervisor_timer.stop()
+        if state in ("ready", "stopping", "crashed"):
+            # Once the model is loaded (or won't be), reading it ahead is pointless
+            self.stop_prewarm()
+        if state == "ready":
+            self.server_status_label.setText(f"Server: ready after {self.supervisor.time_to_ready:.1f}s")
+            if self.browser_url:
+                import webbrowser
+
+                webbrowser.open(self.browser_url)
+                # Only once, not after every restart
+                self.browser_url = None
+
+    def record_launch(self, state):
+        # Every process start (also restarts after a crash) is one launch in the history
+        supervisor = self.supervisor
+        try:
+            if state == "running":
+                self.launch_id = launch_history.start(self.launch_profile, supervisor.command, self.launch_model, webui_version(repo_path))
+            elif self.launch_id is None:
+                return
+            elif state == "ready":
+                launch_history.update(self.launch_id, time_to_ready=supervisor.time_to_ready)
+            elif state in ("stopped", "exited", "crashed"):
+                crash_reason = supervisor.crash_reason if state == "crashed" else None
+                launch_history.update(self.launch_id, ended_at=time.time(), exit_code=supervisor.exit_code, crash_reason=crash_reason, peak_vram=supervisor.peak_vram, peak_ram=supervisor.peak_ram)
+                self.launch_id = None
+        except Exception as e:
+            # The history is nice to have, it must never get in the way of starting the webui
+            print(f"Error writing launch history: {str(e)}")
+
+    def on_resource_monitor_clicked(self):
+        if getattr(self, "resource_monitor_window", None) is None:
+            monitor = ResourceMonitor(self.server_pids, load_gui_config().get("monitor_interval", default_monitor_interval))
+            self.resource_monitor_window = ResourceMonitorWindow(monitor)
+        self.resource_monitor_window.show()
+        self.resource_monitor_window.raise_()
+
+    def server_pids(self):
+        # Every webui process StartUI started, the single server and the instances of a set
+        pids = list(self.supervisor.pids) if self.supervisor else []
+        if self.instance_set_window is not None:
+            pids += self.instance_set_window.pids()
+        return pids
+
+    def on_instance_sets_clicked(self):
+        if self.instance_set_window is None:
+            self.instance_set_window = InstanceSetWindow(self.restart_on_crash_action.isChecked())
+        self.instance_set_window.show()
+        self.instance_set_window.raise_()
+
+    def on_launch_history_clicked(self):
+        profile = self.launch_profile or self.profile_name_textfield.text() or "default"
+        LaunchHistoryDialog(profile, self).exec_()
+
+    def on_restart_on_crash_toggled(self, checked):
+        set_gui_config_value("restart_on_crash", checked)
+        if self.supervisor:
+            self.supervisor.restart_on_crash = checked
+
+    def on_open_server_log_clicked(self):
+        if not os.path.exists(server_log_file):
+            QMessageBox.information(self, "Server Log", "The webui wasn't started from StartUI yet.")
+            return
+        if sys.platform == "win32":
+            os.startfile(os.path.abspath(server_log_file))
+        else:
+            try:
+                subprocess.Popen(["xdg-open", os.path.abspath(server_log_file)])
+            except OSError:
+                self.show_error_message(f"Could not open the log. Please open it manually.\n{os.path.abspath(server_log_file)}")
             
     def on_update_button_clicked(self):
         run_cmd_with_conda(f"python {webui_file} --update && exit")
 
     def populate_profiles_dropdown(self):
-        self.profiles_dropdown.clear()
-        profiles = [name for name in os.listdir(profiles_folder) if name.endswith(".json")]
-        self.profiles_dropdown.addItems(profiles)
+        self.sync_combo_box(self.profiles_dropdown, list_profiles())
     
     def on_load_button_clicked(self):
         selected_profile = self.profiles_dropdown.currentText()
@@ -1933,123 +2809,14 @@ class MainWindow(QMainWindow):
         self.profile_name_textfield.setText(profile_name)
 
     def apply_load_settings(self, settings):
-        self.model_dropdown.setCurrentText(settings.get("model", ""))
-        self.model_type.setCurrentText(settings.get("model_type", ""))
-        self.wbit_dropdown.setCurrentText(settings.get("wbits", ""))
-        self.gsize_dropdown.setCurrentText(settings.get("groupsize", ""))
-        self.mode_dropdown.setCurrentText(settings.get("mode", ""))
-        use_gpu = settings.get("use_gpu", False)
-        use_cpu = settings.get("use_cpu", False)
-        self.gpu_radio_button.setChecked(use_gpu)
-        self.cpu_radio_button.setChecked(use_cpu)
-        built_in_ram = settings.get("built_in_ram", 0)
-        self.ram_slider.setValue(built_in_ram)
-        self.listen_port_checkbox.setChecked(settings.get("listen_port", False))
-        self.listen_port_textfield.setText(settings.get("port_number", ""))
-        self.use_8bit_checkbox.setChecked(settings.get("use_8bit", False))
-        self.use_nostream_checkbox.setChecked(settings.get("no_stream", False))
-        self.use_16bit_checkbox.setChecked(settings.get("use_16bit", False))
-        self.use_disk_checkbox.setChecked(settings.get("use_disk", False))
-        self.disk_cache_textfield.setText(settings.get("disk_cache", ""))
-        self.current_disk_cache_label.setText(f"Current folder: {settings.get('disk_cache', '')}")
-        self.use_xformers_checkbox.setChecked(settings.get("xformers", False))
-        self.use_trc_checkbox.setChecked(settings.get("trust_remote_code", False))
-        self.use_monkey_checkbox.setChecked(settings.get("monkeypatch", False))
-        self.use_quant_checkbox.setChecked(settings.get("quant_attn", False))
-        self.use_multimodal_checkbox.setChecked(settings.get("multimodal", False))
-        self.use_sdp_attention_checkbox.setChecked(settings.get("sdp_attention", False))
-        self.use_autogptq_checkbox.setChecked(settings.get("autogptq", False))
-        self.use_triton_checkbox.setChecked(settings.get("triton", False))
-        # Acceleration 4bit
-        self.Accelerate_settings_checkbox.setChecked(settings.get("acceleration", False))
-        self.accelerate4bit_checkbox.setChecked(settings.get("use_4bit", False))
-        self.accelerate4bit_compute_type_dropdown.setCurrentText(settings.get("compute_dtype", ""))
-        self.accelerate4bit_quant_type_dropdown.setCurrentText(settings.get("quant_type", ""))
-        self.accelerate4bit_double_quant_checkbox.setChecked(settings.get("use_x2_quant", False))
-        # Deepspeed
-        self.deepspeed_settings_checkbox.setChecked(settings.get("deepspeed", False))
-        self.deepspeed_checkbox.setChecked(settings.get("deepspeed_enabled", False))
-        self.deepspeed_gpu_num_spinbox.setValue(int(settings.get("deepspeed_gpu_num", 0)))
-        self.selected_offload_directory = settings.get("deepspeed_nvme_path", "")
-        self.deepspeed_nvme_current_label.setText(f"Current Directory Folder: {self.selected_offload_directory}")
-        self.deepspeed_nvme_checkbox.setChecked(settings.get("deepspeed_nvme_enabled", False))
-        self.deepspeed_local_rank_spinbox.setValue(int(settings.get("deepspeed_local_rank", 0)))
-        # llama
-        self.llama_settings_checkbox.setChecked(settings.get("llama_settings", False))
-        self.llama_threads_spinbox.setValue(int(settings.get("llama_threads", 0)))
-        self.llama_batch_size_spinbox.setValue(int(settings.get("llama_batch_size", 0)))
-        self.llama_mmap_checkbox.setChecked(settings.get("llama_no_map", False))
-        self.llama_mlock_checkbox.setChecked(settings.get("llama_use_mlock", False))
-        self.llama_cache_capacity_spinbox.setValue(int(settings.get("llama_cache_capacity", 0)))
-        self.llama_cache_capacity_units.setCurrentText(settings.get("llama_cache_units", ""))
-        self.llama_gpu_layer_spinbox.setValue(int(settings.get("llama_gpu_layer", 0)))
-        self.llama_n_ctx_dropdown.setCurrentText(settings.get("llama_n_ctx", ""))
-        self.llama_seed_spinbox.setValue(int(settings.get("llama_seed", 0)))
-        # flexgen
-        self.flexgen_settings_checkbox.setChecked(settings.get("flexgen_settings", False))
-        self.flexgen_checkbox.setChecked(settings.get("use_flexgen", False))
-        self.flexgen_percentage_spinbox1.setValue(int(settings.get("flexgen_precentage_1", 0)))
-        self.flexgen_percentage_spinbox2.setValue(int(settings.get("flexgen_precentage_2", 100)))
-        self.flexgen_percentage_spinbox3.setValue(int(settings.get("flexgen_precentage_3", 100)))
-        self.flexgen_percentage_spinbox4.setValue(int(settings.get("flexgen_precentage_4", 0)))
-        self.flexgen_percentage_spinbox5.setValue(int(settings.get("flexgen_precentage_5", 100)))
-        self.flexgen_percentage_spinbox6.setValue(int(settings.get("flexgen_precentage_6", 0)))
-        self.flexgen_compression_checkbox.setChecked(settings.get("flexgen_compression", False))
-        self.flexgen_pin_weight_dropdown.setCurrentText(settings.get("flexgen_pin_weight", ""))
-        # RWKV
-        self.rwkv_settings_checkbox.setChecked(settings.get("rwkv_settings", False))
-        self.rwkv_checkbox.setChecked(settings.get("use_rwkv", False))
-        self.rwkv_strategy_checkbox.setChecked(settings.get("rwkv_strategy", False))
-        self.rwkv_strategy_dropdown.setCurrentText(settings.get("rwkv_strategy_dropdown", ""))
-        self.rwkv_allocation_spinbox.setValue(int(settings.get("rwkv_allocation", 0)))
-        self.rwkv_cuda_checkbox.setChecked(settings.get("rwkv_cuda", False))
-        # API
-        self.api_settings_checkbox.setChecked(settings.get("api_settings", False))
-        self.api_checkbox.setChecked(settings.get("use_api", False))
-        self.api_blocking_port_checkbox.setChecked(settings.get("api_blocking_port_enabled", False))
-        self.api_blocking_port_SpinBox.setValue(int(settings.get("api_blocking_port", 5000)))
-        self.api_streaming_port_checkbox.setChecked(settings.get("api_streaming_port_enabled", False))
-        self.api_streaming_port_SpinBox.setValue(int(settings.get("api_streaming_port", 5005)))
-        self.api_public_checkbox.setChecked(settings.get("public_api", False))
-        self.use_autotune_checkbox.setChecked(settings.get("autotune", False))
-        self.use_autolaunch_checkbox.setChecked(settings.get("autolaunch", False))
-        self.use_autoclose_checkbox.setChecked(settings.get("autoclose", False))
-        self.use_nocache_checkbox.setChecked(settings.get("nocache", False))
-        self.authentication_checkbox.setChecked(settings.get("authentication", False))
-        self.choose_file_label.setText(settings.get("authentication_file", ""))
-        self.character_to_load.setCurrentText(settings.get("character", ""))
-        #self.pre_layer_slider.setValue(int(settings.get("prelayer", 0)))
-        self.use_autolaunch_checkbox.setChecked(settings.get("autolaunch", False))
-        self.use_network_checkbox.setChecked(settings.get("listen", False))
-
-        if "prelayer" in settings:
-            pre_layer_values = settings["prelayer"]
-            for i, value in enumerate(pre_layer_values):
-                self.pre_layer_slider[i].setValue(value)
-
-        if nvidia_gpu:
-            gpu_vram_settings = settings.get("gpu_vram", [])
-            for idx, slider in enumerate(self.gpu_vram_sliders):
-                if idx < len(gpu_vram_settings):
-                    slider.setValue(gpu_vram_settings[idx])
-
-        self.use_extensions_checkbox.setChecked(settings.get("use_extension", False))
-        extensions_settings = settings.get("extensions", [])
-        for i in range(self.extensions_list.count()):
-            extension = self.extensions_list.item(i).text()
-            if extension in extensions_settings:
-                self.extensions_list.item(i).setCheckState(Qt.Checked)
-            else:
-                self.extensions_list.item(i).setCheckState(Qt.Unchecked)
-        self.use_lora_checkbox.setChecked(settings.get("use_lora", False))
-        lora_settings = settings.get("loras", [])
-        for i in range(self.lora_list.count()):
-            lora = self.lora_list.item(i).text()
-            if lora in lora_settings:
-                self.lora_list.item(i).setCheckState(Qt.Checked)
-            else:
-                self.lora_list.item(i).setCheckState(Qt.Unchecked)
+        # The schema is in flag order, so the model is set before the wbits/groupsize it prefills.
+        # Keys missing from older profiles get the schema default (e.g. n_batch 512), like a fresh window.
+        for setting in schema:
+            self.write_setting_widget(setting, settings.get(setting.key, setting.default))
 
+        # Labels that show a setting, but aren't part of the profile
+        self.current_disk_cache_label.setText(f"Current folder: {self.disk_cache_textfield.text()}")
+        self.deepspeed_nvme_current_label.setText(f"Current Directory Folder: {self.selected_offload_directory}")
 
     def load_settings(self):
         default_profile = os.path.join(profiles_folder, "default.json")
@@ -2074,8 +2841,12 @@ class MainWindow(QMainWindow):
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     main_window = MainWindow()
+    # Style before showing the window, so it's only painted once
+    with startup_profiler.phase("theme"):
+        import darkdetect
+        if darkdetect.isDark():
+            import qdarkstyle
+            dark_stylesheet = qdarkstyle.load_stylesheet_pyqt5()
+            app.setStyleSheet(dark_stylesheet)
     main_window.show()
-    if darkdetect.isDark():
-        dark_stylesheet = qdarkstyle.load_stylesheet_pyqt5()
-        app.setStyleSheet(dark_stylesheet)
     sys.exit(app.exec_())
@@ -0,0 +1,189 @@
+import json, socket, time, urllib.request
+
+# The request the llama.cpp settings are tuned for: a longer prompt and a medium answer
+default_workload = {"prompt_tokens": 512, "new_tokens": 128}
+
+# Tries llama.cpp settings on a running server and keeps the fastest ones.
+# evaluate(params) returns (prompt tokens/s, generation tokens/s) or None if the server didn't work with these settings.
+# Instead of a full grid, every setting is searched on its own (coordinate descent), with a ternary search over its
+# candidates. That assumes the throughput curve of a single setting has one peak, which holds well enough for
+# threads, n_batch and n-gpu-layers.
+class LlamaAutotuner:
+    def __init__(self, evaluate, space, workload=default_workload, max_rounds=2, progress=None):
+        self.evaluate = evaluate
+        # name -> sorted list of candidate values, searched in this order
+        self.space = space
+        self.workload = workload
+        self.max_rounds = max_rounds
+        self.progress = progress
+        self.results = {}
+
+    def score(self, params):
+        # Higher is better. The score is the negative time the workload takes, so prompt processing and
+        # generation are weighted by how much they matter for a real request.
+        key = tuple(sorted(params.items()))
+        if key not in self.results:
+            measured = self.evaluate(dict(params))
+            if measured and measured[0] > 0 and measured[1] > 0:
+                prompt_tps, generation_tps = measured
+                seconds = self.workload["prompt_tokens"] / prompt_tps + self.workload["new_tokens"] / generation_tps
+                self.results[key] = (-seconds, prompt_tps, generation_tps)
+            else:
+                self.results[key] = (float("-inf"), 0, 0)
+            if self.progress:
+                self.progress(dict(params), self.results[key])
+        return self.results[key][0]
+
+    def tune(self, start):
+        best = dict(start)
+        for name, candidates in self.space.items():
+            if best.get(name) not in candidates:
+                best[name] = candidates[len(candidates) // 2]
+
+        for _ in range(self.max_rounds):
+            previous = dict(best)
+            for name in self.space:
+                best[name] = self.search_dimension(best, name)
+            if best == previous:
+                break
+
+        key = tuple(sorted(best.items()))
+        score, prompt_tps, generation_tps = self.results.get(key, (float("-inf"), 0, 0))
+        return {"params": best, "prompt_tps": prompt_tps, "generation_tps": generation_tps, "evaluations": len(self.results), "ok": score != float("-inf")}
+
+    def search_dimension(self, params, name):
+        candidates = self.space[name]
+
+        def score_at(index):
+            trial = dict(params)
+            trial[name] = candidates[index]
+            return self.score(trial)
+
+        low, high = 0, len(candidates) - 1
+        while high - low > 2:
+            third = (high - low) // 3
+            middle_low, middle_high = low + third, high - third
+            if score_at(middle_low) < score_at(middle_high):
+                low = middle_low + 1
+            else:
+                high = middle_high - 1
+        best_index = max(range(low, high + 1), key=score_at)
+        return candidates[best_index]
+
+def build_search_space(physical_cores, logical_cores, nvidia_gpu, layers=None):
+    # Threads beyond the physical cores rarely help llama.cpp, but they're tried in case they do
+    threads = sorted(set([1, 2, 4] + list(range(4, physical_cores + 1, 2)) + [physical_cores, logical_cores]))
+    threads = [value for value in threads if 0 < value <= logical_cores]
+    space = {"threads": threads, "n_batch": [64, 128, 256, 512, 1024, 2048]}
+    if nvidia_gpu:
+        if layers:
+            space["n_gpu_layers"] = sorted(set([0] + [max(layers * step // 8, 1) for step in range(1, 9)]))
+        else:
+            # 200000 offloads every layer
+            space["n_gpu_layers"] = [0, 8, 16, 24, 32, 40, 60, 80, 200000]
+    return space
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Starts the webui with the given llama.cpp settings and measures it through the blocking API
+class ServerEvaluator:
+    def __init__(self, start_server, stop_server, base_args, ready_timeout=300, workload=default_workload):
+        # start_server(args) returns a process, stop_server(process) ends it and its children
+        self.start_server = start_server
+        self.stop_server = stop_server
+        self.base_args = base_args
+        self.ready_timeout = ready_timeout
+        self.workload = workload
+        self.cancelled = False
+        # The server of the run in progress
+        self.process = None
+
+    def cancel(self):
+        # Stopping the server ends a request in flight right away, instead of after its timeout
+        self.cancelled = True
+        process = self.process
+        if process is not None:
+            self.stop_server(process)
+
+    def __call__(self, params):
+        if self.cancelled:
+            return None
+        api_port = find_free_port()
+        args = list(self.base_args) + ["--api", "--api-blocking-port", str(api_port), "--api-streaming-port", str(find_free_port()), "--listen-port", str(find_free_port())]
+        args += ["--threads", str(params["threads"]), "--n_batch", str(params["n_batch"])]
+        if "n_gpu_layers" in params:
+            args += ["--n-gpu-layers", str(params["n_gpu_layers"])]
+
+        process = self.process = self.start_server(args)
+        try:
+            # cancel() may have run before the process was known
+            if self.cancelled:
+                return None
+            api_url = f"http://127.0.0.1:{api_port}/api/v1"
+            if not self.wait_ready(process, api_url):
+                return None
+            return measure_throughput(api_url, self.workload)
+        except Exception as e:
+            print(f"Autotune run with {params} failed: {str(e)}")
+            return None
+        finally:
+            self.process = None
+            self.stop_server(process)
+
+    def wait_ready(self, process, api_url):
+        deadline = time.time() + self.ready_timeout
+        while time.time() < deadline and not self.cancelled:
+            # The server died, most likely out of memory with too many gpu layers
+            if process.poll() is not None:
+                return False
+            try:
+                with urllib.request.urlopen(f"{api_url}/model", timeout=2) as response:
+                    if response.status == 200:
+                        return True
+            except OSError:
+                pass
+            time.sleep(1)
+        return False
+
+def measure_throughput(api_url, workload):
+    prompt = make_prompt(api_url, workload["prompt_tokens"])
+    # One tiny request first, so the first measurement doesn't pay for warming up
+    generate(api_url, "Hello", 1)
+
+    # Prompt processing: long prompt, a single new token
+    start = time.perf_counter()
+    generate(api_url, prompt["text"], 1)
+    prompt_tps = prompt["tokens"] / (time.perf_counter() - start)
+
+    # Generation: short prompt, many new tokens. Banning EOS makes sure all of them are generated.
+    start = time.perf_counter()
+    generate(api_url, "Once upon a time", workload["new_tokens"])
+    generation_tps = workload["new_tokens"] / (time.perf_counter() - start)
+    return prompt_tps, generation_tps
+
+def post_json(url, data, timeout):
+    # Raises OSError (URLError, HTTPError, timeouts) or ValueError for an answer that isn't JSON
+    request = urllib.request.Request(url, data=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+def generate(api_url, prompt, max_new_tokens):
+    request = {"prompt": prompt, "max_new_tokens": max_new_tokens, "ban_eos_token": True, "do_sample": False, "seed": 1}
+    return post_json(f"{api_url}/generate", request, 600)
+
+def make_prompt(api_url, tokens):
+    # Plain text of roughly the wanted length, the tokenizer of the loaded model tells how long it really is
+    sentence = "The quick brown fox jumps over the lazy dog while the sun sets behind the quiet hills. "
+    text = sentence * max(tokens // 16, 1)
+    count = None
+    try:
+        count = post_json(f"{api_url}/token-count", {"prompt": text}, 30)["results"][0]["tokens"]
+    except (OSError, KeyError, IndexError, TypeError, ValueError):
+        pass
+    if not count:
+        # Rough guess, if the API can't count tokens
+        count = int(len(text.split()) * 1.3)
+    return {"text": text, "tokens": count}
@@ -0,0 +1,252 @@
+import json, re, sys, time
+from functools import lru_cache
+
+# Every setting StartUI knows, in one place: the profile key, the MainWindow widget it's bound to, the webui flag
+# it turns into, the settings it depends on and its default. Saving, loading and building the command all read
+# this list, so adding a flag means adding one line here.
+#
+# Widget kinds:
+#   check     QCheckBox/QRadioButton, isChecked/setChecked
+#   combo     QComboBox, currentText/setCurrentText
+#   spin      QSpinBox/QSlider, value/setValue
+#   text      QLineEdit/QLabel, text/setText
+#   checklist QListWidget with checkable items, list of the checked texts
+#   sliders   list of QSliders, list of their values
+#   attr      plain attribute of the window
+#
+# Flag kinds:
+#   switch    the flag alone, if the setting is set
+#   value     the flag and the value, if the setting is set
+#   always    the flag and the value, even if it's 0 or empty
+#   values    the flag and every entry of the list
+#   emit      a function settings -> list of arguments, for everything that doesn't fit the above
+
+# Values that count as "not set". "none" is what the dropdowns show when nothing is chosen.
+unset_values = (None, False, 0, "", "none", [])
+# Folders and files typed in by the user, "none" is a valid name there
+path_unset_values = (None, "")
+
+def is_set(value, unset_values=unset_values):
+    return not any(value is unset or (type(value) == type(unset) and value == unset) for unset in unset_values)
+
+class Setting:
+    def __init__(self, key, widget, kind, default, flag=None, flag_kind="switch", requires=(), emit=None, unset=unset_values):
+        self.key = key
+        self.widget = widget
+        self.kind = kind
+        self.default = default
+        self.flag = flag
+        self.flag_kind = flag_kind
+        # Keys that must be set for the flag to be used. "!key" means the key must not be set.
+        self.requires = requires
+        self.emit = emit
+        # Values of this setting that count as "not set"
+        self.unset = unset
+
+    def is_set(self, settings):
+        return is_set(settings.get(self.key), self.unset)
+
+    def enabled(self, settings):
+        for required in self.requires:
+            if required.startswith("!"):
+                if schema_by_key[required[1:]].is_set(settings):
+                    return False
+            elif not schema_by_key[required].is_set(settings):
+                return False
+        return True
+
+    def arguments(self, settings):
+        if self.emit is None and self.flag is None:
+            return []
+        if not self.enabled(settings):
+            return []
+        if self.emit is not None:
+            return self.emit(settings)
+
+        value = settings.get(self.key, self.default)
+        if self.flag_kind == "always":
+            return [self.flag, str(value)]
+        if not is_set(value, self.unset):
+            return []
+        if self.flag_kind == "switch":
+            return [self.flag]
+        if self.flag_kind == "values":
+            return [self.flag] + [str(entry) for entry in value]
+        return [self.flag, str(value)]
+
+def emit_cache_capacity(settings):
+    return ["--cache-capacity", f"{settings.get('llama_cache_capacity', 1024)}{settings.get('llama_cache_units', 'MiB')}"]
+
+def emit_flexgen_percent(settings):
+    defaults = (0, 100, 100, 0, 100, 0)
+    return ["--percent"] + [str(settings.get(f"flexgen_precentage_{i + 1}", default)) for i, default in enumerate(defaults)]
+
+def emit_mode(settings):
+    # Add the chosen mode to the command (Chat, cai-chat, notebook)
+    return [f"--{settings.get('mode') or 'chat'}"]
+
+def emit_device(settings):
+    # Handle GPU, CPU or Autodevice selection
+    if settings.get("use_gpu", False):
+        gpu_vram = settings.get("gpu_vram", [])
+        if sum(gpu_vram) == 0:
+            raise ValueError("At least one VRAM value must be greater than 0 for GPU execution.")
+        return ["--gpu-memory"] + [str(vram) for vram in gpu_vram if vram > 0]
+    if settings.get("use_cpu", False):
+        if settings.get("built_in_ram", 0) <= 0:
+            raise ValueError("RAM value cannot be 0 for CPU execution.")
+        return ["--cpu-memory", str(settings["built_in_ram"])]
+    if settings.get("use_auto", False):
+        return ["--auto-device"]
+    return []
+
+def emit_trust_remote_code(settings):
+    # MPT-7B needs trust_remote_code, even if it's not checked
+    if settings.get("trust_remote_code", False) or re.search(r"mpt.*7b", settings.get("model", "none")):
+        return ["--trust-remote-code"]
+    return []
+
+def emit_listen_port(settings):
+    port = str(settings.get("port_number", ""))
+    return ["--listen-port", port] if port.isdigit() else []
+
+def emit_pre_layer(settings):
+    values = [value for value in settings.get("prelayer", []) if value > 0]
+    return ["--pre_layer"] + [str(value) for value in values] if values else []
+
+schema = [
+    # llama.cpp
+    Setting("llama_settings", "llama_settings_checkbox", "check", False),
+    Setting("llama_threads", "llama_threads_spinbox", "spin", 0, "--threads", "value"),
+    Setting("llama_batch_size", "llama_batch_size_spinbox", "spin", 512, "--n_batch", "always", requires=("llama_threads",)),
+    Setting("llama_cache_capacity", "llama_cache_capacity_spinbox", "spin", 1024, requires=("llama_threads",), emit=emit_cache_capacity),
+    Setting("llama_cache_units", "llama_cache_capacity_units", "combo", "MiB"),
+    Setting("llama_n_ctx", "llama_n_ctx_dropdown", "combo", "2048", "--n_ctx", "always", requires=("llama_threads",)),
+    Setting("llama_seed", "llama_seed_spinbox", "spin", 0, "--llama_cpp_seed", "always", requires=("llama_threads",)),
+    Setting("llama_gpu_layer", "llama_gpu_layer_spinbox", "spin", 0, "--n-gpu-layers", "value"),
+    Setting("llama_no_map", "llama_mmap_checkbox", "check", False, "--no-mmap"),
+    Setting("llama_use_mlock", "llama_mlock_checkbox", "check", False, "--mlock"),
+    # FlexGen
+    Setting("flexgen_settings", "flexgen_settings_checkbox", "check", False),
+    Setting("use_flexgen", "flexgen_checkbox", "check", False, "--flexgen"),
+    Setting("flexgen_precentage_1", "flexgen_percentage_spinbox1", "spin", 0, requires=("use_flexgen",), emit=emit_flexgen_percent),
+    Setting("flexgen_precentage_2", "flexgen_percentage_spinbox2", "spin", 100),
+    Setting("flexgen_precentage_3", "flexgen_percentage_spinbox3", "spin", 100),
+    Setting("flexgen_precentage_4", "flexgen_percentage_spinbox4", "spin", 0),
+    Setting("flexgen_precentage_5", "flexgen_percentage_spinbox5", "spin", 100),
+    Setting("flexgen_precentage_6", "flexgen_percentage_spinbox6", "spin", 0),
+    Setting("flexgen_compression", "flexgen_compression_checkbox", "check", False, "--compression-weight", requires=("use_flexgen",)),
+    Setting("flexgen_pin_weight", "flexgen_pin_weight_dropdown", "combo", "none", "--pin-weight", "value", requires=("use_flexgen",)),
+    # Model
+    # An empty model name is still passed on, only "none" means no model
+    Setting("model", "model_dropdown", "combo", "none", "--model", "value", unset=(None, "none")),
+    Setting("model_type", "model_type", "combo", "none", "--model_type", "value", requires=("model",)),
+    Setting("use_lora", "use_lora_checkbox", "check", False),
+    Setting("loras", "lora_list", "checklist", [], "--lora", "values", requires=("use_lora", "model")),
+    Setting("character", "character_to_load", "combo", "none", "--character", "value"),
+    Setting("wbits", "wbit_dropdown", "combo", "none", "--wbits", "value", requires=("model", "!use_cpu")),
+    Setting("groupsize", "gsize_dropdown", "combo", "none", "--groupsize", "value", requires=("model", "!use_cpu")),
+    Setting("mode", "mode_dropdown", "combo", "chat", emit=emit_mode),
+    # Devices
+    Setting("use_gpu", "gpu_radio_button", "check", False, emit=emit_device),
+    Setting("use_cpu", "cpu_radio_button", "check", False),
+    Setting("use_auto", "auto_radio_button", "check", False),
+    Setting("built_in_ram", "ram_slider", "spin", 0),
+    Setting("gpu_vram", "gpu_vram_sliders", "sliders", []),
+    # Loading options
+    Setting("use_8bit", "use_8bit_checkbox", "check", False, "--load-in-8bit"),
+    Setting("no_stream", "use_nostream_checkbox", "check", False, "--no-stream"),
+    Setting("use_16bit", "use_16bit_checkbox", "check", False, "--bf16"),
+    Setting("xformers", "use_xformers_checkbox", "check", False, "--xformers"),
+    Setting("trust_remote_code", "use_trc_checkbox", "check", False, emit=emit_trust_remote_code),
+    Setting("autotune", "use_autotune_checkbox", "check", False, "--warmup_autotune"),
+    Setting("monkeypatch", "use_monkey_checkbox", "check", False, "--monkey-patch"),
+    Setting("quant_attn", "use_quant_checkbox", "check", False, "--quant_attn"),
+    # Accelerate 4-bit
+    Setting("acceleration", "Accelerate_settings_checkbox", "check", False),
+    Setting("use_4bit", "accelerate4bit_checkbox", "check", False, "--load-in-4bit"),
+    Setting("compute_dtype", "accelerate4bit_compute_type_dropdown", "combo", "none", "--compute_dtype", "value"),
+    Setting("quant_type", "accelerate4bit_quant_type_dropdown", "combo", "none", "--quant_type", "value"),
+    Setting("use_x2_quant", "accelerate4bit_double_quant_checkbox", "check", False, "--use_double_quant"),
+    Setting("nocache", "use_nocache_checkbox", "check", False, "--no-cache"),
+    Setting("autolaunch", "use_autolaunch_checkbox", "check", False, "--auto-launch"),
+    Setting("listen", "use_network_checkbox", "check", False, "--listen"),
+    Setting("multimodal", "use_multimodal_checkbox", "check", False, "--multimodal-pipeline"),
+    # Disk offloading
+    Setting("use_disk", "use_disk_checkbox", "check", False, "--disk"),
+    Setting("change_disk_cache", "change_disk_cache_checkbox", "check", False),
+    Setting("disk_cache", "disk_cache_textfield", "text", "", "--disk-cache-dir", "value", requires=("use_disk", "change_disk_cache"), unset=path_unset_values),
+    # Network and authentication
+    Setting("listen_port", "listen_port_checkbox", "check", False, requires=("listen_port",), emit=emit_listen_port),
+    Setting("port_number", "listen_port_textfield", "text", ""),
+    Setting("authentication", "authentication_checkbox", "check", False),
+    Setting("authentication_file", "choose_file_label", "text", "", "--gradio-auth-path", "value", requires=("authentication",), unset=path_unset_values),
+    Setting("prelayer", "pre_layer_slider", "sliders", [], emit=emit_pre_layer),
+    Setting("sdp_attention", "use_sdp_attention_checkbox", "check", False, "--sdp-attention"),
+    Setting("autogptq", "use_autogptq_checkbox", "check", False, "--autogptq"),
+    Setting("triton", "use_triton_checkbox", "check", False, "--triton"),
+    Setting("desc_act", "use_desc_act_checkbox", "check", False, "--desc_act"),
+    Setting("use_extension", "use_extensions_checkbox", "check", False),
+    Setting("extensions", "extensions_list", "checklist", [], "--extensions", "values", requires=("use_extension",)),
+    # API
+    Setting("api_settings", "api_settings_checkbox", "check", False),
+    Setting("use_api", "api_checkbox", "check", False, "--api"),
+    Setting("public_api", "api_public_checkbox", "check", False, "--public-api", requires=("use_api",)),
+    Setting("api_blocking_port_enabled", "api_blocking_port_checkbox", "check", False),
+    Setting("api_blocking_port", "api_blocking_port_SpinBox", "spin", 5000, "--api-blocking-port", "always", requires=("use_api", "!public_api", "api_blocking_port_enabled")),
+    Setting("api_streaming_port_enabled", "api_streaming_port_checkbox", "check", False),
+    Setting("api_streaming_port", "api_streaming_port_SpinBox", "spin", 5005, "--api-streaming-port", "always", requires=("use_api", "!public_api", "api_streaming_port_enabled")),
+    # DeepSpeed, these end up in the deepspeed launcher command instead of the webui flags
+    Setting("deepspeed", "deepspeed_settings_checkbox", "check", False),
+    Setting("deepspeed_enabled", "deepspeed_checkbox", "check", False),
+    Setting("deepspeed_gpu_num", "deepspeed_gpu_num_spinbox", "spin", 1),
+    Setting("deepspeed_nvme_enabled", "deepspeed_nvme_checkbox", "check", False),
+    Setting("deepspeed_nvme_path", "selected_offload_directory", "attr", "none"),
+    Setting("deepspeed_local_rank", "deepspeed_local_rank_spinbox", "spin", 0),
+    # RWKV
+    Setting("rwkv_settings", "rwkv_settings_checkbox", "check", False),
+    Setting("use_rwkv", "rwkv_checkbox", "check", False),
+    Setting("rwkv_strategy", "rwkv_strategy_checkbox", "check", False),
+    Setting("rwkv_strategy_dropdown", "rwkv_strategy_dropdown", "combo", "none"),
+    Setting("rwkv_allocation", "rwkv_allocation_spinbox", "spin", 0),
+    Setting("rwkv_cuda", "rwkv_cuda_checkbox", "check", False),
+    # StartUI only
+    Setting("autoclose", "use_autoclose_checkbox", "check", False),
+]
+
+schema_by_key = {setting.key: setting for setting in schema}
+
+def compile_profile(settings):
+    # Same profile, same command. The compiled argv is cached by the profile's content.
+    return compile_profile_json(json.dumps(settings, sort_keys=True))
+
+@lru_cache(maxsize=256)
+def compile_profile_json(settings_json):
+    settings = json.loads(settings_json)
+    args = []
+    for setting in schema:
+        args += setting.arguments(settings)
+    return tuple(args)
+
+def benchmark(runs=10000):
+    # Seconds building a command takes, uncached and cached. tests/test_flag_schema.py keeps them bounded,
+    # python flag_schema.py --benchmark prints them.
+    settings = {setting.key: setting.default for setting in schema}
+    settings.update({"model": "benchmark-model", "llama_threads": 8, "use_api": True, "use_extension": True, "extensions": ["api", "openai"]})
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        compile_profile_json.cache_clear()
+        compile_profile(settings)
+    uncached = (time.perf_counter() - start) / runs
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        compile_profile(settings)
+    cached = (time.perf_counter() - start) / runs
+    return uncached, cached
+
+if __name__ == "__main__" and "--benchmark" in sys.argv:
+    uncached, cached = benchmark()
+    print(f"{len(schema)} settings")
+    print(f"uncached: {uncached * 1e6:.1f} us, cached: {cached * 1e6:.1f} us per command")
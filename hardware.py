@@ -0,0 +1,183 @@
+import json, os, time
+
+# How long a hardware snapshot on disk is trusted, before the driver is asked again
+snapshot_ttl = 120
+
+# One inventory per session, shared by everything that needs GPU/CPU/RAM information
+hardware_inventory = None
+
+def get_hardware_inventory(snapshot_file=None):
+    global hardware_inventory
+    if hardware_inventory is None:
+        hardware_inventory = HardwareInventory(snapshot_file)
+        hardware_inventory.load()
+    return hardware_inventory
+
+class HardwareInventory:
+    def __init__(self, snapshot_file=None, ttl=snapshot_ttl):
+        self.snapshot_file = snapshot_file
+        self.ttl = ttl
+        # Every GPU is a dict with index, name, memory_total, memory_used, memory_free (MiB) and compute_capability
+        self.gpus = []
+        self.cpu_physical_cores = 1
+        self.cpu_logical_cores = 1
+        # RAM in MiB
+        self.ram_total = 0
+        self.ram_used = 0
+        self.ram_available = 0
+        self.timestamp = 0
+
+    @property
+    def nvidia_gpu(self):
+        return len(self.gpus) > 0
+
+    def load(self):
+        # Use the snapshot of a recent launch if it's still fresh, otherwise ask the driver
+        if not self.load_snapshot():
+            self.probe()
+            self.save_snapshot()
+        return self
+
+    def probe(self):
+        self.gpus = probe_nvidia_gpus()
+        self.probe_cpu_and_ram()
+        self.timestamp = time.time()
+
+    def probe_cpu_and_ram(self):
+        import psutil
+
+        self.cpu_logical_cores = psutil.cpu_count(logical=True) or os.cpu_count() or 1
+        self.cpu_physical_cores = psutil.cpu_count(logical=False) or self.cpu_logical_cores
+        ram_info = psutil.virtual_memory()
+        self.ram_total = ram_info.total // (1024 ** 2)
+        self.ram_used = ram_info.used // (1024 ** 2)
+        self.ram_available = ram_info.available // (1024 ** 2)
+
+    def load_snapshot(self):
+        if not self.snapshot_file:
+            return False
+        try:
+            with open(self.snapshot_file, "r") as file:
+                snapshot = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return False
+
+        if time.time() - snapshot.get("timestamp", 0) > self.ttl:
+            return False
+
+        try:
+            self.gpus = snapshot["gpus"]
+            self.cpu_physical_cores = snapshot["cpu_physical_cores"]
+            self.cpu_logical_cores = snapshot["cpu_logical_cores"]
+            self.ram_total = snapshot["ram_total"]
+            self.ram_used = snapshot["ram_used"]
+            self.ram_available = snapshot["ram_available"]
+            self.timestamp = snapshot["timestamp"]
+        except KeyError:
+            return False
+        return True
+
+    def save_snapshot(self):
+        if not self.snapshot_file:
+            return
+        snapshot = {
+            "timestamp": self.timestamp,
+            "gpus": self.gpus,
+            "cpu_physical_cores": self.cpu_physical_cores,
+            "cpu_logical_cores": self.cpu_logical_cores,
+            "ram_total": self.ram_total,
+            "ram_used": self.ram_used,
+            "ram_available": self.ram_available,
+        }
+        try:
+            with open(self.snapshot_file, "w") as file:
+                json.dump(snapshot, file, indent=4)
+        except OSError as e:
+            print(f"Error writing hardware snapshot: {str(e)}")
+
+def probe_nvidia_gpus():
+    # Ask NVML directly instead of running nvidia-smi. No driver (or no pynvml) means no Nvidia GPU.
+    try:
+        import pynvml
+        pynvml.nvmlInit()
+    except Exception:
+        return []
+
+    gpus = []
+    try:
+        for index in range(pynvml.nvmlDeviceGetCount()):
+            handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+            name = pynvml.nvmlDeviceGetName(handle)
+            if isinstance(name, bytes):
+                name = name.decode()
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            try:
+                major, minor = pynvml.nvmlDeviceGetCudaComputeCapability(handle)
+                compute_capability = f"{major}.{minor}"
+            except pynvml.NVMLError:
+                compute_capability = ""
+            gpus.append({
+                "index": index,
+                "name": name,
+                "memory_total": memory.total // (1024 ** 2),
+                "memory_used": memory.used // (1024 ** 2),
+                "memory_free": memory.free // (1024 ** 2),
+                "compute_capability": compute_capability,
+            })
+    except pynvml.NVMLError as e:
+        print(f"Error reading GPU information: {str(e)}")
+    finally:
+        pynvml.nvmlShutdown()
+    return gpus
+
+# NVML is initialized once and the device handles are kept, process_gpu_memory and the resource monitor ask every second
+nvml_device_handles = None
+
+def nvml_handles():
+    # The handles of all Nvidia GPUs, an empty list without a (working) driver
+    global nvml_device_handles
+    if nvml_device_handles is None:
+        try:
+            import pynvml
+            pynvml.nvmlInit()
+            nvml_device_handles = [pynvml.nvmlDeviceGetHandleByIndex(index) for index in range(pynvml.nvmlDeviceGetCount())]
+        except Exception:
+            nvml_device_handles = []
+    return nvml_device_handles
+
+def process_gpu_memory(pids):
+    # VRAM in MiB used by the given processes over all GPUs
+    handles = nvml_handles()
+    if not handles:
+        return 0
+    import pynvml
+
+    pids = set(pids)
+    used = 0
+    try:
+        for handle in handles:
+            for process in pynvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                # usedGpuMemory is None if the driver can't tell (e.g. on Windows with WDDM)
+                if process.pid in pids and process.usedGpuMemory:
+                    used += process.usedGpuMemory
+    except pynvml.NVMLError:
+        return 0
+    return used // (1024 ** 2)
+
+def sample_gpus():
+    # Memory (MiB), utilization (%) and SM clock (MHz) of every GPU, cheap enough to call every second
+    handles = nvml_handles()
+    if not handles:
+        return []
+    import pynvml
+
+    samples = []
+    for handle in handles:
+        try:
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
+            clock = pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_SM)
+            samples.append({"memory_used": memory.used // (1024 ** 2), "memory_total": memory.total // (1024 ** 2), "utilization": utilization.gpu, "clock": clock})
+        except pynvml.NVMLError:
+            samples.append({"memory_used": 0, "memory_total": 0, "utilization": 0, "clock": 0})
+    return samples
@@ -0,0 +1,110 @@
+import os, sqlite3, time
+
+# Every start of the webui from StartUI, with how it went. Kept in SQLite, so launches of a profile can be
+# compared before and after a webui update.
+class LaunchHistory:
+    columns = ("id", "profile", "command", "model", "webui_version", "started_at", "ended_at", "time_to_ready", "peak_vram", "peak_ram", "exit_code", "crash_reason")
+
+    def __init__(self, history_file):
+        self.history_file = history_file
+        self.connection = None
+
+    def connect(self):
+        # Opened on first use, so StartUI doesn't pay for it at startup
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.history_file)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS launches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    profile TEXT,
+                    command TEXT,
+                    model TEXT,
+                    webui_version TEXT,
+                    started_at REAL,
+                    ended_at REAL,
+                    time_to_ready REAL,
+                    peak_vram INTEGER,
+                    peak_ram INTEGER,
+                    exit_code INTEGER,
+                    crash_reason TEXT
+                )""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS launches_profile ON launches (profile, started_at)")
+            self.connection.commit()
+        return self.connection
+
+    def start(self, profile, command, model, webui_version):
+        # Returns the id to update the launch with later
+        cursor = self.connect().execute(
+            "INSERT INTO launches (profile, command, model, webui_version, started_at) VALUES (?, ?, ?, ?, ?)",
+            (profile, command, model, webui_version, time.time()))
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def update(self, launch_id, **fields):
+        fields = {name: value for name, value in fields.items() if name in self.columns and name != "id"}
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.connect().execute(f"UPDATE launches SET {assignments} WHERE id = ?", (*fields.values(), launch_id))
+        self.connection.commit()
+
+    def profiles(self):
+        return [row[0] for row in self.connect().execute("SELECT DISTINCT profile FROM launches ORDER BY profile COLLATE NOCASE")]
+
+    def launches(self, profile=None, limit=100):
+        # Newest first
+        if profile is None:
+            rows = self.connect().execute("SELECT * FROM launches ORDER BY started_at DESC LIMIT ?", (limit,))
+        else:
+            rows = self.connect().execute("SELECT * FROM launches WHERE profile = ? ORDER BY started_at DESC LIMIT ?", (profile, limit))
+        return [dict(row) for row in rows]
+
+    def compare_versions(self, profile):
+        # One row per webui version the profile was started with, oldest version first
+        rows = self.connect().execute("""
+            SELECT webui_version,
+                   COUNT(*) AS launches,
+                   MIN(started_at) AS first_started,
+                   AVG(time_to_ready) AS avg_time_to_ready,
+                   MIN(time_to_ready) AS best_time_to_ready,
+                   MAX(peak_vram) AS peak_vram,
+                   MAX(peak_ram) AS peak_ram,
+                   SUM(CASE WHEN time_to_ready IS NULL THEN 1 ELSE 0 END) AS never_ready,
+                   SUM(CASE WHEN crash_reason IS NOT NULL AND crash_reason != '' THEN 1 ELSE 0 END) AS crashes
+            FROM launches WHERE profile = ?
+            GROUP BY webui_version ORDER BY first_started""", (profile,))
+        return [dict(row) for row in rows]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+def webui_version(repo_path):
+    # The commit the text-generation-webui is at, read from .git directly instead of running git
+    git_folder = os.path.join(repo_path, ".git")
+    try:
+        with open(os.path.join(git_folder, "HEAD"), "r") as file:
+            head = file.read().strip()
+    except OSError:
+        return "unknown"
+    if not head.startswith("ref: "):
+        return head[:10]
+
+    ref = head[5:]
+    try:
+        with open(os.path.join(git_folder, ref), "r") as file:
+            return file.read().strip()[:10]
+    except OSError:
+        pass
+    # Refs get packed by git gc
+    try:
+        with open(os.path.join(git_folder, "packed-refs"), "r") as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0][:10]
+    except OSError:
+        pass
+    return "unknown"
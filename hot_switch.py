@@ -0,0 +1,105 @@
+import json, re, urllib.request
+
+from flag_schema import is_set
+
+# Flags that only change what the webui loads, not the process itself. The model endpoint of the api extension
+# sets them on the running server and loads the model again, which skips the Python/torch/extension imports.
+model_flags = {
+    "--model", "--model_type", "--lora", "--character",
+    "--wbits", "--groupsize", "--pre_layer", "--autogptq", "--triton", "--desc_act", "--quant_attn", "--warmup_autotune", "--monkey-patch",
+    "--cpu", "--auto-devices", "--gpu-memory", "--cpu-memory", "--disk", "--disk-cache-dir",
+    "--load-in-8bit", "--bf16", "--load-in-4bit", "--compute_dtype", "--quant_type", "--use_double_quant",
+    "--trust-remote-code", "--xformers", "--sdp-attention", "--no-cache",
+    "--threads", "--n_batch", "--n_ctx", "--llama_cpp_seed", "--n-gpu-layers", "--no-mmap", "--mlock", "--cache-capacity",
+}
+# The webui parses these as numbers, the API sets them as they are sent
+int_flags = {"--wbits", "--groupsize", "--pre_layer", "--threads", "--n_batch", "--n_ctx", "--llama_cpp_seed", "--n-gpu-layers"}
+# nargs="+" in the webui, always a list
+list_flags = {"--lora", "--gpu-memory", "--pre_layer"}
+# The webui's defaults for value flags, set again when a profile drops the flag. Anything else defaults to None.
+flag_defaults = {"--wbits": 0, "--groupsize": -1, "--threads": 0, "--n_batch": 512, "--n_ctx": 2048, "--llama_cpp_seed": 0, "--n-gpu-layers": 0, "--compute_dtype": "float16", "--quant_type": "nf4", "--disk-cache-dir": "cache"}
+# Spelled differently in the command than in the webui's arguments
+flag_aliases = {"--auto-device": "--auto-devices"}
+
+def parse_flags(args):
+    # Webui arguments as a list -> {flag: [values]}. Switches have no values.
+    flags = {}
+    current = None
+    for arg in args:
+        arg = str(arg)
+        if arg.startswith("--"):
+            name, _, value = arg.partition("=")
+            current = flag_aliases.get(name, name)
+            flags[current] = [value] if value else []
+        elif current is not None:
+            flags[current].append(arg)
+    return flags
+
+def flag_attribute(flag):
+    # --n-gpu-layers -> n_gpu_layers, the name in the webui's shared.args
+    return flag[2:].replace("-", "_")
+
+def flag_value(flag, values):
+    if flag in int_flags:
+        values = [int(value) if re.fullmatch(r"-?\d+", value) else value for value in values]
+    if flag in list_flags:
+        return values
+    if not values:
+        return True
+    return values[0] if len(values) == 1 else values
+
+def plan_switch(running_args, new_args, api_available=True):
+    # Decides how a running server gets from running_args to new_args. Both are the full server arguments
+    # (launch_args()). Returns {"action": "none" | "load" | "restart", "reason": str} and for "load" also
+    # the "model_name" and "args" to send to the model endpoint.
+    running = parse_flags(running_args)
+    new = parse_flags(new_args)
+    changed = sorted(flag for flag in set(running) | set(new) if running.get(flag) != new.get(flag))
+    if not changed:
+        return {"action": "none", "reason": "the server already runs with these settings"}
+
+    process_flags = [flag for flag in changed if flag not in model_flags]
+    if process_flags:
+        return {"action": "restart", "reason": f"{', '.join(process_flags)} can only be changed by restarting the server"}
+    if not api_available:
+        return {"action": "restart", "reason": "the running server has no API to load a model with"}
+    if not new.get("--model"):
+        return {"action": "restart", "reason": "no model is selected"}
+
+    args = {}
+    for flag in changed:
+        if flag == "--model":
+            continue
+        if flag in new:
+            args[flag_attribute(flag)] = flag_value(flag, new[flag])
+        else:
+            # Removed switches are turned off, removed values go back to the webui's default
+            args[flag_attribute(flag)] = False if not running[flag] else flag_defaults.get(flag)
+    return {"action": "load", "reason": f"changed: {', '.join(changed)}", "model_name": new["--model"][0], "args": args}
+
+def launch_args(settings, command_args):
+    # The arguments the server process really gets. DeepSpeed is started through its own launcher,
+    # its flags aren't part of the webui arguments of the profile.
+    args = list(command_args)
+    if settings.get("deepspeed_enabled", False):
+        args += ["--deepspeed", f"--num_gpus={settings.get('deepspeed_gpu_num', 1)}"]
+        if settings.get("deepspeed_nvme_enabled", False) and is_set(settings.get("deepspeed_nvme_path")):
+            args += ["--nvme-offload-dir", settings["deepspeed_nvme_path"]]
+        if int(settings.get("deepspeed_local_rank", 0)) != 0:
+            args += ["--local_rank", str(settings["deepspeed_local_rank"])]
+    return args
+
+def switch_model(api_url, plan, timeout=900):
+    # Loads plan["model_name"] with plan["args"] into the running server. Returns the model info the API answers
+    # with, raises RuntimeError if the server couldn't load it.
+    request = {"action": "load", "model_name": plan["model_name"], "args": plan["args"]}
+    request = urllib.request.Request(f"{api_url}/model", data=json.dumps(request).encode(), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            answer = json.loads(response.read())
+    except (OSError, ValueError) as e:
+        # URLError, HTTPError and timeouts are all OSErrors
+        raise RuntimeError(f"The model API didn't answer: {str(e)}")
+    if "error" in answer:
+        raise RuntimeError(answer["error"].get("message", "unknown error") if isinstance(answer["error"], dict) else str(answer["error"]))
+    return answer.get("result", answer)
@@ -0,0 +1,188 @@
+import json, os, socket
+
+from launcher import build_launch_command, cache_folder, default_api_blocking_port, default_api_streaming_port, default_listen_port, load_profile_settings, script_path, server_ports
+from supervisor import ServerSupervisor
+
+# Instance sets: several profiles started side by side, each on its own GPUs and ports.
+# name -> [{"profile": "llama-13b", "gpus": [0, 1]}, ...]
+instance_sets_file = os.path.join(os.path.dirname(script_path), "instance_sets.json")
+# Ports are searched upwards from the webui defaults, but not forever
+port_search_range = 200
+
+def load_instance_sets():
+    try:
+        with open(instance_sets_file, "r") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_instance_sets(instance_sets):
+    try:
+        with open(instance_sets_file, "w") as file:
+            json.dump(instance_sets, file, indent=4)
+    except OSError as e:
+        print(f"Error writing {instance_sets_file}: {str(e)}")
+
+def port_free(port):
+    # Binding is the only reliable test, a port nobody answers on may still be taken (TIME_WAIT, another user, ...)
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("0.0.0.0", port))
+            return True
+        except OSError:
+            return False
+
+def find_free_port(start, taken, is_free=port_free):
+    for port in range(start, start + port_search_range):
+        if port not in taken and is_free(port):
+            taken.add(port)
+            return port
+    raise ValueError(f"No free port found between {start} and {start + port_search_range - 1}")
+
+def pin_settings(settings, gpus):
+    # The profile as the instance runs it. With CUDA_VISIBLE_DEVICES the webui only sees the pinned GPUs,
+    # numbered from 0, so per GPU settings are cut down to those GPUs. Raises ValueError if the profile has
+    # per GPU settings, but none for a pinned GPU.
+    settings = dict(settings)
+    for key in ("gpu_vram", "prelayer"):
+        values = settings.get(key) or []
+        if len(values) > len(gpus):
+            unknown = [gpu for gpu in gpus if gpu >= len(values)]
+            if unknown:
+                raise ValueError(f"The profile has {key} values for {len(values)} GPUs, but not for GPU {', '.join(str(gpu) for gpu in unknown)}")
+            settings[key] = [values[gpu] for gpu in gpus]
+    if settings.get("deepspeed_enabled", False):
+        settings["deepspeed_gpu_num"] = min(int(settings.get("deepspeed_gpu_num", 1)), len(gpus)) or 1
+    return settings
+
+def allocate_ports(settings, taken, is_free=port_free):
+    # Gives the profile its own webui and API ports, none of them used by another instance or anything else.
+    # The public API keeps the default ports, plan_instances() reserved them before.
+    settings = dict(settings, listen_port=True, port_number=str(find_free_port(default_listen_port, taken, is_free)))
+    if settings.get("use_api", False) and not settings.get("public_api", False):
+        settings.update(
+            api_blocking_port_enabled=True, api_blocking_port=find_free_port(default_api_blocking_port, taken, is_free),
+            api_streaming_port_enabled=True, api_streaming_port=find_free_port(default_api_streaming_port, taken, is_free))
+    return settings
+
+def plan_instances(members, load_settings=load_profile_settings, is_free=port_free):
+    # members as saved in the instance set -> one dict per instance with its settings, ports, command and
+    # environment. Raises ValueError if the set can't be started. Warnings are returned, not raised.
+    instances = []
+    warnings = []
+    taken = set()
+    used_gpus = {}
+    profiles = []
+    for member in members:
+        try:
+            profiles.append(load_settings(member["profile"]))
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Could not load profile {member['profile']}: {str(e)}")
+
+    # The public API can't be moved to other ports, so only one instance can have it
+    public = [member["profile"] for member, settings in zip(members, profiles) if settings.get("use_api", False) and settings.get("public_api", False)]
+    if len(public) > 1:
+        raise ValueError(f"Only one instance can use the public API, but {', '.join(public)} do")
+    if public:
+        for port in (default_api_blocking_port, default_api_streaming_port):
+            if not is_free(port):
+                raise ValueError(f"The public API of {public[0]} needs port {port}, which is already in use")
+            taken.add(port)
+
+    for index, (member, settings) in enumerate(zip(members, profiles)):
+        profile = member["profile"]
+        gpus = [int(gpu) for gpu in member.get("gpus", [])]
+        for gpu in gpus:
+            if gpu in used_gpus:
+                warnings.append(f"GPU {gpu} is shared by {used_gpus[gpu]} and {profile}")
+            used_gpus.setdefault(gpu, profile)
+        if gpus:
+            try:
+                settings = pin_settings(settings, gpus)
+            except ValueError as e:
+                raise ValueError(f"{profile}: {str(e)}")
+        settings = allocate_ports(settings, taken, is_free)
+        # A browser per instance would be more annoying than helpful
+        settings["autolaunch"] = False
+
+        env = dict(os.environ)
+        if gpus:
+            env["CUDA_VISIBLE_DEVICES"] = ",".join(str(gpu) for gpu in gpus)
+        instances.append({
+            "name": f"{index + 1}-{os.path.splitext(os.path.basename(profile))[0]}",
+            "profile": profile,
+            "gpus": gpus,
+            "settings": settings,
+            "ports": server_ports(settings),
+            "command": build_launch_command(settings),
+            "env": env,
+        })
+    return instances, warnings
+
+# Starts, watches and stops every instance of a set together. Like ServerSupervisor, poll() has to be called regularly.
+class InstanceSet:
+    def __init__(self, name, instances, restart_on_crash=True, on_event=None):
+        self.name = name
+        self.instances = instances
+        # on_event(instance name, state, message)
+        self.on_event = on_event
+        self.supervisors = {}
+        for instance in instances:
+            log_file = os.path.join(cache_folder, f"server-{instance['name']}.log")
+            self.supervisors[instance["name"]] = ServerSupervisor(
+                instance["command"], log_file, restart_on_crash, self.event_handler(instance["name"]), env=instance["env"], ports=instance["ports"])
+
+    def event_handler(self, name):
+        def handle(state, message):
+            if self.on_event:
+                self.on_event(name, state, message)
+        return handle
+
+    @property
+    def running(self):
+        return any(supervisor.running or supervisor.restart_at is not None for supervisor in self.supervisors.values())
+
+    def start(self):
+        # If one instance can't be started, the ones already started are stopped again
+        try:
+            for supervisor in self.supervisors.values():
+                supervisor.start()
+        except OSError:
+            self.stop()
+            raise
+
+    def stop(self):
+        for supervisor in self.supervisors.values():
+            supervisor.stop()
+
+    def poll(self):
+        for supervisor in self.supervisors.values():
+            supervisor.poll()
+
+    def pids(self):
+        return [pid for supervisor in self.supervisors.values() for pid in supervisor.pids]
+
+    def backends(self, kind):
+        # [(instance name, port)] of the instances that are ready to answer on their "api" or "streaming api" port
+        backends = []
+        for instance in self.instances:
+            supervisor = self.supervisors[instance["name"]]
+            if kind in instance["ports"] and supervisor.running and supervisor.ready_at is not None:
+                backends.append((instance["name"], instance["ports"][kind]))
+        return backends
+
+    def status(self):
+        # One row per instance for the GUI
+        rows = []
+        for instance in self.instances:
+            supervisor = self.supervisors[instance["name"]]
+            rows.append({
+                "name": instance["name"],
+                "gpus": ",".join(str(gpu) for gpu in instance["gpus"]) or "all",
+                "ports": ", ".join(f"{name} {port}" for name, port in instance["ports"].items()),
+                "state": supervisor.state,
+                "time_to_ready": supervisor.time_to_ready,
+                "peak_vram": supervisor.peak_vram,
+                "restarts": supervisor.restarts,
+            })
+        return rows
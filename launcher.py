@@ -0,0 +1,463 @@
+import argparse, glob, json, os, platform, re, shlex, shutil, subprocess, sys
+
+from flag_schema import compile_profile, is_set
+
+# Everything needed to turn a profile into a webui command and start it. Nothing in here imports PyQt5,
+# so profiles can be launched headless with StartUI.py --profile NAME.
+
+# Profile folder for loading and saving profiles.
+profiles_folder = "./profiles"
+# Create the profile folder if it doesn't exist
+os.makedirs(profiles_folder, exist_ok=True)
+
+# Cache folder for data StartUI can rebuild at any time (release info, scans, ...)
+cache_folder = "./startui_cache"
+os.makedirs(cache_folder, exist_ok=True)
+
+repo_path = "./text-generation-webui"
+model_folder = "./text-generation-webui/models"
+extensions_folder = "./text-generation-webui/extensions"
+loras_folder = "./text-generation-webui/loras"
+characters_folder = "./text-generation-webui/characters"
+
+if getattr(sys, 'frozen', False):
+    webui_file = sys._MEIPASS + '/webuiGUI.py'
+else:
+    webui_file = 'webuiGUI.py'
+
+# # Get the absolute path of the script file
+script_path = os.path.abspath(__file__)
+
+# Define the path of the settings file relative to the script file
+settings_file = os.path.join(os.path.dirname(script_path), "gui-config.json")
+
+# Define the conda environment path
+if platform.system() == 'Windows':
+    # Sets the Conda Environment based on Windows
+    conda_binary = r".\installer_files\conda\condabin\conda.bat"
+    conda_env_path = r".\installer_files\env"
+if platform.system() == 'Linux':
+    # Sets the Conda Environment based on Linux
+    conda_binary = "./installer_files/conda/condabin/conda"
+    conda_env_path = "./installer_files/env"
+
+# Terminal emulators we know how to start, in order of preference
+terminal_emulators = ['xdg-terminal', 'gnome-terminal', 'konsole', 'xfce4-terminal', 'mate-terminal', 'lxterminal', 'termite', 'tilix', 'xterm']
+# Special gui-config.json value to run the server directly, without a terminal window
+no_terminal = "none"
+# gui-config.json value to look for an installed emulator on every start. Older configs use "" for the same.
+auto_terminal = "Auto detect"
+
+def load_gui_config():
+    try:
+        with open(settings_file, "r") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_gui_config(config):
+    try:
+        with open(settings_file, "w") as file:
+            json.dump(config, file, indent=4)
+    except OSError as e:
+        print(f"Error writing {settings_file}: {str(e)}")
+
+def set_gui_config_value(key, value):
+    config = load_gui_config()
+    config[key] = value
+    save_gui_config(config)
+
+# The resolved terminal emulator, so we only look it up once per session
+resolved_terminal = None
+
+def resolve_terminal_emulator():
+    # Resolve the terminal via PATH lookups only. Nothing gets executed, so a missing emulator costs nothing.
+    global resolved_terminal
+    if resolved_terminal is not None:
+        return resolved_terminal
+
+    configured_terminal = load_gui_config().get("terminal_emulator", auto_terminal)
+    if configured_terminal == no_terminal:
+        resolved_terminal = no_terminal
+        return resolved_terminal
+    if configured_terminal not in (auto_terminal, "") and shutil.which(configured_terminal):
+        resolved_terminal = configured_terminal
+        return resolved_terminal
+
+    # Only remembered for this session, so an uninstalled emulator is replaced on the next start
+    for emulator in terminal_emulators:
+        if shutil.which(emulator):
+            resolved_terminal = emulator
+            return resolved_terminal
+
+    raise RuntimeError("No compatible terminal emulator found.")
+
+def set_terminal_emulator(terminal):
+    # terminal can be an emulator name, no_terminal or auto_terminal to detect it on every start
+    global resolved_terminal
+    resolved_terminal = None
+    set_gui_config_value("terminal_emulator", terminal)
+
+def conda_activate_cmd():
+    if platform.system() == 'Windows':
+        # For Windows, activate the Conda environment using the activate.bat script
+        return f"{conda_binary} activate {conda_env_path}"
+
+    # Define the necessary variables from the bash script
+    install_dir = os.path.dirname(os.path.abspath(__file__))
+    conda_root_prefix = os.path.join(install_dir, "installer_files", "conda")
+    install_env_dir = os.path.join(install_dir, "installer_files", "env")
+
+    # For Linux, activate the Conda environment
+    return f"source {os.path.join(conda_root_prefix, 'etc', 'profile.d', 'conda.sh')} && conda activate {install_env_dir}"
+
+# The environment "conda activate" creates, captured once and reused until Conda changes the env
+conda_env_cache_file = os.path.join(cache_folder, "conda_env.json")
+# Set by the shell itself, not by the activation
+shell_variables = ("_", "SHLVL", "PWD", "OLDPWD", "PROMPT")
+# Marks the line with the environment in the output of the activation, which may print its own messages
+conda_env_marker = "<<STARTUI_ENV>>"
+# Bump when the format of the cached environment changes
+conda_env_version = 2
+
+def conda_env_mtime():
+    # conda-meta changes whenever a package is installed into or removed from the env
+    try:
+        return os.stat(os.path.join(conda_env_path, "conda-meta")).st_mtime_ns
+    except OSError:
+        return None
+
+def clean_environment():
+    # What the activation is captured in, like "env -i" with a minimal PATH. That way the captured changes are
+    # only what the activation adds, not whatever environment StartUI happened to be started from.
+    if platform.system() == 'Windows':
+        names = ("SYSTEMROOT", "WINDIR", "COMSPEC", "TEMP", "TMP", "USERPROFILE", "HOMEDRIVE", "HOMEPATH")
+        system_root = os.environ.get("SYSTEMROOT", r"C:\Windows")
+        path = os.pathsep.join([os.path.join(system_root, "System32"), system_root])
+    else:
+        names = ("HOME", "USER", "LANG", "LC_ALL", "LC_CTYPE", "TMPDIR")
+        path = "/usr/bin:/bin"
+    env = {name: os.environ[name] for name in names if name in os.environ}
+    env["PATH"] = path
+    return env
+
+def capture_conda_env():
+    # Activates the env once in a clean environment and returns the variables it set, the ones it removed and
+    # what it put in front of PATH
+    print_env = f"python -c \"import json, os; print('{conda_env_marker}' + json.dumps(dict(os.environ)))\""
+    base = clean_environment()
+    if platform.system() == 'Windows':
+        result = subprocess.run(f"{conda_activate_cmd()} && {print_env}", shell=True, env=base, capture_output=True, text=True)
+    else:
+        result = subprocess.run(['bash', '-c', f"{conda_activate_cmd()} && {print_env}"], env=base, capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith(conda_env_marker):
+            activated = json.loads(line[len(conda_env_marker):])
+            break
+    else:
+        return None
+    path = activated.pop("PATH", "")
+    if not path.endswith(base["PATH"]):
+        # Activation replaced PATH instead of extending it, nothing we could reapply to another PATH
+        return None
+    path_prefix = path[:len(path) - len(base["PATH"])]
+    changed = {name: value for name, value in activated.items() if base.get(name) != value and name not in shell_variables}
+    removed = [name for name in base if name not in activated and name != "PATH" and name not in shell_variables]
+    return {"set": changed, "unset": removed, "path_prefix": path_prefix}
+
+# Loaded once per session
+activated_conda_env = None
+
+def load_activated_conda_env():
+    global activated_conda_env
+    mtime = conda_env_mtime()
+    if mtime is None:
+        return None
+    if activated_conda_env is not None and activated_conda_env.get("conda_meta_mtime") == mtime:
+        return activated_conda_env
+
+    try:
+        with open(conda_env_cache_file, "r") as file:
+            cached = json.load(file)
+        if cached.get("version") == conda_env_version and cached.get("conda_meta_mtime") == mtime and cached.get("conda_env_path") == os.path.abspath(conda_env_path):
+            activated_conda_env = cached
+            return activated_conda_env
+    except (OSError, json.JSONDecodeError):
+        pass
+
+    captured = capture_conda_env()
+    if captured is None:
+        return None
+    activated_conda_env = dict(captured, version=conda_env_version, conda_meta_mtime=mtime, conda_env_path=os.path.abspath(conda_env_path))
+    try:
+        with open(conda_env_cache_file, "w") as file:
+            json.dump(activated_conda_env, file, indent=4)
+    except OSError as e:
+        print(f"Error writing {conda_env_cache_file}: {str(e)}")
+    return activated_conda_env
+
+def env_python():
+    if platform.system() == 'Windows':
+        return os.path.abspath(os.path.join(conda_env_path, "python.exe"))
+    return os.path.abspath(os.path.join(conda_env_path, "bin", "python"))
+
+def direct_conda_command(cmd, env=None):
+    # The command and environment to run cmd in the Conda env without activating it first, or None if the
+    # cached environment is turned off or couldn't be captured. Simple commands exec the env's python directly,
+    # anything with shell syntax still needs a shell (but not conda.sh).
+    if not load_gui_config().get("direct_conda_launch", True):
+        return None
+    activated = load_activated_conda_env()
+    if activated is None:
+        return None
+    full_env = dict(env if env is not None else os.environ)
+    full_env.update(activated["set"])
+    for name in activated["unset"]:
+        full_env.pop(name, None)
+    full_env["PATH"] = activated["path_prefix"] + full_env.get("PATH", "")
+
+    if platform.system() == 'Windows':
+        return cmd, full_env
+    if any(operator in cmd for operator in ("&&", "||", ";", "|", ">", "<", "$", "`")):
+        return ['bash', '-c', cmd], full_env
+    args = shlex.split(cmd)
+    if args and args[0] == "python":
+        args[0] = env_python()
+    return args, full_env
+
+def conda_output(cmd):
+    # Runs cmd in the Conda environment and returns its stdout, or None if it failed
+    direct = direct_conda_command(cmd)
+    if direct is not None:
+        args, env = direct
+        result = subprocess.run(args, shell=platform.system() == 'Windows', env=env, capture_output=True, text=True)
+    elif platform.system() == 'Windows':
+        result = subprocess.run(f"{conda_activate_cmd()} && {cmd}", shell=True, capture_output=True, text=True)
+    else:
+        result = subprocess.run(['bash', '-c', f"{conda_activate_cmd()} && {cmd}"], capture_output=True, text=True)
+    return result.stdout if result.returncode == 0 else None
+
+def popen_with_conda(cmd, env=None, stdout=None):
+    # Runs the command in the Conda environment in the background, without a terminal, and returns the process.
+    # The process gets its own process group, so stop_process_tree can end it with all its children.
+    # With stdout=subprocess.PIPE, stderr goes into the same pipe.
+    stderr = subprocess.STDOUT if stdout is not None else None
+    direct = direct_conda_command(cmd, env)
+    if direct is not None:
+        args, full_env = direct
+        if platform.system() == 'Windows':
+            return subprocess.Popen(args, shell=True, env=full_env, stdout=stdout, stderr=stderr, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+        return subprocess.Popen(args, env=full_env, stdout=stdout, stderr=stderr, start_new_session=True)
+    if platform.system() == 'Windows':
+        return subprocess.Popen(f"{conda_activate_cmd()} && {cmd}", shell=True, env=env, stdout=stdout, stderr=stderr, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+    return subprocess.Popen(['bash', '-c', f"{conda_activate_cmd()} && {cmd}"], env=env, stdout=stdout, stderr=stderr, start_new_session=True)
+
+def stop_process_tree(process, timeout=10):
+    if process.poll() is not None:
+        return
+    if platform.system() == 'Windows':
+        subprocess.run(['taskkill', '/T', '/F', '/PID', str(process.pid)], capture_output=True)
+    else:
+        import signal
+
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    process.wait()
+
+def run_cmd_with_conda(cmd, env=None):
+    if platform.system() == 'Windows':
+        full_cmd = f"{conda_activate_cmd()} && {cmd}"
+
+        if load_gui_config().get("terminal_emulator", "") == no_terminal:
+            # Run the command directly, the output ends up in StartUI's console
+            direct = direct_conda_command(cmd, env)
+            if direct is not None:
+                subprocess.Popen(direct[0], shell=True, env=direct[1])
+            else:
+                subprocess.Popen(full_cmd, shell=True, env=env)
+        else:
+            # Open a separate terminal window and execute the command
+            subprocess.Popen(['start', 'cmd', '/k', full_cmd], shell=True, env=env)
+    
+    elif platform.system() == 'Linux':
+        activate_cmd = conda_activate_cmd()
+        terminal_cmd = resolve_terminal_emulator()
+
+        print(cmd)
+        if terminal_cmd == no_terminal:
+            # Execute the command within the Conda environment, without a terminal window
+            direct = direct_conda_command(cmd, env)
+            if direct is not None:
+                subprocess.Popen(direct[0], env=direct[1])
+            else:
+                subprocess.Popen(['bash', '-c', f"{activate_cmd} && {cmd}"], env=env)
+        else:
+            # Execute the command within the Conda environment in a separate terminal
+            subprocess.Popen([terminal_cmd, '--', 'bash', '-c', f"{activate_cmd} && {cmd}"], env=env)
+
+def format_command(args):
+    # Quote the arguments for the shell the command ends up in
+    if platform.system() == 'Windows':
+        return subprocess.list2cmdline(args)
+    return " ".join(shlex.quote(str(arg)) for arg in args)
+
+def build_command_args(settings):
+    # Turns a profile (as saved by the GUI) into the webui arguments, as laid out in flag_schema.
+    # Raises ValueError if the profile can't be started like this.
+    return list(compile_profile(settings))
+
+# Ports the webui opens if the profile doesn't set them
+default_listen_port = 7860
+default_api_blocking_port = 5000
+default_api_streaming_port = 5005
+
+def server_ports(settings):
+    # The ports the webui will listen on with this profile, name -> port
+    port_number = str(settings.get("port_number", ""))
+    ports = {"webui": int(port_number) if settings.get("listen_port", False) and port_number.isdigit() else default_listen_port}
+    if settings.get("use_api", False):
+        custom_ports = not settings.get("public_api", False)
+        ports["api"] = int(settings.get("api_blocking_port", default_api_blocking_port)) if custom_ports and settings.get("api_blocking_port_enabled", False) else default_api_blocking_port
+        ports["streaming api"] = int(settings.get("api_streaming_port", default_api_streaming_port)) if custom_ports and settings.get("api_streaming_port_enabled", False) else default_api_streaming_port
+    return ports
+
+# Installed distributions of the Conda env, cached until Conda or pip change the env
+env_packages_cache_file = os.path.join(cache_folder, "env_packages.json")
+
+def env_packages_mtime():
+    # conda-meta changes with Conda installs, site-packages with pip installs
+    folders = [os.path.join(conda_env_path, "conda-meta")]
+    folders += glob.glob(os.path.join(conda_env_path, "lib", "python*", "site-packages")) + glob.glob(os.path.join(conda_env_path, "Lib", "site-packages"))
+    mtimes = []
+    for folder in folders:
+        try:
+            mtimes.append(os.stat(folder).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+def normalize_package_name(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def installed_env_packages():
+    # Names of all distributions installed in the env. One importlib.metadata query inside the env, then cached.
+    mtime = env_packages_mtime()
+    try:
+        with open(env_packages_cache_file, "r") as file:
+            cached = json.load(file)
+        if cached.get("mtime") == mtime:
+            return set(cached["packages"])
+    except (OSError, json.JSONDecodeError, KeyError):
+        pass
+
+    output = conda_output("python -c \"import json; from importlib import metadata; print(json.dumps([dist.metadata['Name'] for dist in metadata.distributions()]))\"")
+    if output is None:
+        return None
+    try:
+        packages = sorted({normalize_package_name(name) for name in json.loads(output.strip().splitlines()[-1]) if name})
+    except (ValueError, IndexError):
+        return None
+    try:
+        with open(env_packages_cache_file, "w") as file:
+            json.dump({"mtime": mtime, "packages": packages}, file, indent=4)
+    except OSError as e:
+        print(f"Error writing {env_packages_cache_file}: {str(e)}")
+    return set(packages)
+
+def required_packages(settings):
+    # Packages the webui only needs for some settings, and which its requirements don't always install
+    packages = []
+    if settings.get("use_8bit", False):
+        packages.append("accelerate")
+    if settings.get("deepspeed_enabled", False):
+        packages.append("deepspeed")
+    # MPT models run remote code that imports einops
+    if re.search(r"mpt.*7b", settings.get("model", "none"), re.IGNORECASE):
+        packages.append("einops")
+    return packages
+
+def missing_packages(settings):
+    required = required_packages(settings)
+    if not required:
+        return []
+    installed = installed_env_packages()
+    if installed is None:
+        # Couldn't ask the env, install them like before rather than failing the start
+        return required
+    return [package for package in required if normalize_package_name(package) not in installed]
+
+def build_launch_command(settings, check_packages=True):
+    # The full shell command, that runs the webui with the profile in the Conda environment
+    command = format_command(build_command_args(settings))
+    # Packages are only installed if the env doesn't have them yet
+    missing = missing_packages(settings) if check_packages else []
+    install_prefix = f"python -m pip install {' '.join(missing)} && " if missing else ""
+
+    if settings.get("deepspeed_enabled", False):
+        if platform.system() == "Windows":
+            raise ValueError("DeepSpeed is currently not supported on Windows")
+        deepspeed_command = f"deepspeed --num_gpus={settings.get('deepspeed_gpu_num', 1)} ./text-generation-webui/server.py --deepspeed"
+        if settings.get("deepspeed_nvme_enabled", False):
+            # The folder picker leaves "none" when nothing was chosen
+            if not is_set(settings.get("deepspeed_nvme_path")):
+                raise ValueError("NVMe offload is enabled, but no offload directory was chosen")
+            deepspeed_command += f" --nvme-offload-dir {format_command([settings['deepspeed_nvme_path']])}"
+        if int(settings.get("deepspeed_local_rank", 0)) != 0:
+            deepspeed_command += f" --local_rank {settings['deepspeed_local_rank']}"
+        return f"{install_prefix}{deepspeed_command} {command}"
+
+    return f"{install_prefix}python {webui_file} {command}"
+
+def load_profile_settings(profile_name):
+    # Accepts "default", "default.json" or a path to a profile
+    profile_file = profile_name
+    if not os.path.exists(profile_file):
+        if not profile_name.endswith(".json"):
+            profile_name += ".json"
+        profile_file = os.path.join(profiles_folder, profile_name)
+    with open(profile_file, "r") as file:
+        return json.load(file)
+
+def launch_in_foreground(command):
+    # For cron, systemd and SSH: no terminal window, the webui output goes to our stdout/stderr
+    direct = direct_conda_command(command)
+    if direct is not None:
+        args, env = direct
+        if platform.system() == 'Windows':
+            return subprocess.call(args, shell=True, env=env)
+        os.execvpe(args[0], args, env)
+    if platform.system() == 'Windows':
+        return subprocess.call(f"{conda_activate_cmd()} && {command}", shell=True)
+    # Replace this process with the shell, so signals from systemd & co reach the server directly
+    os.execvp('bash', ['bash', '-c', f"{conda_activate_cmd()} && {command}"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="StartUI", description="Starts the text-generation-webui with a saved StartUI profile, without opening the GUI.")
+    parser.add_argument("--profile", required=True, help="Name of a profile in ./profiles (with or without .json) or a path to a profile")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument("--print-cmd", action="store_true", help="Only print the generated command (default)")
+    action.add_argument("--launch", action="store_true", help="Start the webui in the Conda environment, in the foreground")
+    args = parser.parse_args(argv)
+
+    try:
+        settings = load_profile_settings(args.profile)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error loading profile {args.profile}: {str(e)}", file=sys.stderr)
+        return 1
+
+    try:
+        # Printing stays quick and side effect free: the package check may have to activate the Conda env
+        command = build_launch_command(settings, check_packages=args.launch)
+    except ValueError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+    if args.launch:
+        return launch_in_foreground(command)
+    print(command)
+    return 0
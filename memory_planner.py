@@ -0,0 +1,100 @@
+import math
+
+gib = 1024 ** 3
+
+# Bytes per parameter of the dtypes models are usually stored in
+dtype_bytes = {"float32": 4, "float16": 2, "bfloat16": 2}
+
+# CUDA context, kernels and allocator slack that every used GPU needs besides the weights
+gpu_overhead = 0.6 * gib
+# Activations and the kv cache on top of the weights
+activation_overhead = 0.12
+# Leave some VRAM for the desktop and the allocator when suggesting --gpu-memory
+gpu_reserve = 1
+
+# Formats that are already quantized on disk. Their file size is what ends up in memory.
+quantized_formats = ("GGUF", "GGML", "GPTQ")
+
+def estimate_model_memory(model, load_in_8bit=False, load_in_4bit=False):
+    # Returns the bytes the weights (plus activations) need once loaded
+    size = model.get("size", 0)
+    if model.get("format") in quantized_formats or model.get("wbits"):
+        weights = size
+    else:
+        # Work out the parameter count from the stored dtype, then convert to the dtype it's loaded in
+        parameters = size / dtype_bytes.get(model.get("dtype"), 2)
+        if load_in_4bit:
+            weights = parameters * 0.5
+        elif load_in_8bit:
+            weights = parameters
+        else:
+            # transformers loads in float16 unless told otherwise
+            weights = parameters * 2
+    return int(weights * (1 + activation_overhead))
+
+def plan_memory(required, gpu_limits, cpu_limit, use_disk=False):
+    # Place the model like accelerate does: fill the GPUs in order up to their limit, then the CPU, then the disk.
+    # gpu_limits and cpu_limit are in GiB (the slider values), required is in bytes.
+    placement = []
+    remaining = required
+    for index, limit in enumerate(gpu_limits):
+        if remaining <= 0 or limit <= 0:
+            continue
+        usable = max(limit * gib - gpu_overhead, 0)
+        used = min(remaining, usable)
+        placement.append((f"GPU {index}", used, limit * gib))
+        remaining -= used
+
+    if remaining > 0 and cpu_limit > 0:
+        used = min(remaining, cpu_limit * gib)
+        placement.append(("CPU", used, cpu_limit * gib))
+        remaining -= used
+
+    if remaining > 0 and use_disk:
+        placement.append(("Disk", remaining, None))
+        remaining = 0
+
+    return {"required": required, "placement": placement, "missing": max(remaining, 0), "fits": remaining <= 0}
+
+def suggest_settings(required, gpus, ram_available, layers=None):
+    # Suggests --gpu-memory values (GiB) spreading the model over the free VRAM, and a --pre_layer split if
+    # the model has to be offloaded to the CPU. gpus is the hardware inventory list, ram_available is in MiB.
+    free = [max(gpu["memory_free"] // 1024 - gpu_reserve, 0) for gpu in gpus]
+    gpu_memory = []
+    remaining = required
+    for limit in free:
+        if remaining <= 0:
+            gpu_memory.append(0)
+            continue
+        needed = math.ceil((remaining + gpu_overhead) / gib)
+        gpu_memory.append(min(needed, limit))
+        remaining -= max(min(needed, limit) * gib - gpu_overhead, 0)
+
+    suggestion = {"gpu_memory": gpu_memory, "cpu_memory": 0, "pre_layer": []}
+    if remaining > 0:
+        suggestion["cpu_memory"] = min(math.ceil(remaining / gib), ram_available // 1024)
+        if layers:
+            # pre_layer counts layers, so split them by the share of the model every GPU can hold
+            layer_size = required / layers
+            suggestion["pre_layer"] = [int(max(limit * gib - gpu_overhead, 0) // layer_size) for limit in gpu_memory if limit > 0]
+    return suggestion
+
+def describe_plan(plan, suggestion=None):
+    lines = [f"Estimated memory needed: {plan['required'] / gib:.1f} GiB"]
+    for device, used, limit in plan["placement"]:
+        if limit:
+            lines.append(f"  {device}: {used / gib:.1f} of {limit / gib:.0f} GiB")
+        else:
+            lines.append(f"  {device}: {used / gib:.1f} GiB")
+    if not plan["fits"]:
+        lines.append(f"  Missing: {plan['missing'] / gib:.1f} GiB")
+    if suggestion:
+        lines.append("")
+        lines.append("Suggested settings:")
+        if any(suggestion["gpu_memory"]):
+            lines.append(f"  --gpu-memory {' '.join(str(value) for value in suggestion['gpu_memory'] if value > 0)}")
+        if suggestion["cpu_memory"]:
+            lines.append(f"  --cpu-memory {suggestion['cpu_memory']}")
+        if suggestion["pre_layer"]:
+            lines.append(f"  --pre_layer {' '.join(str(value) for value in suggestion['pre_layer'])}")
+    return "\n".join(lines)
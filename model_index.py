@@ -0,0 +1,177 @@
+import json, os
+
+# Bump when the entries get new fields, so old indexes are rebuilt instead of missing them
+index_version = 1
+
+# Files that hold model weights. Everything else in a model folder is config, tokenizer, readme, ...
+weight_extensions = (".gguf", ".safetensors", ".bin", ".pt", ".pth", ".ggml")
+
+# Keeps track of the models folder: size, shard count, format and quantization of every model.
+# Entries are keyed by the mtime of the model folder, so a reload only rescans models that changed.
+class ModelIndex:
+    def __init__(self, model_folder, index_file):
+        self.model_folder = model_folder
+        self.index_file = index_file
+        self.models = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_file, "r") as file:
+                index = json.load(file)
+            self.models = index.get("models", {}) if index.get("version") == index_version else {}
+        except (OSError, json.JSONDecodeError, AttributeError):
+            self.models = {}
+
+    def save(self):
+        try:
+            with open(self.index_file, "w") as file:
+                json.dump({"version": index_version, "model_folder": os.path.abspath(self.model_folder), "models": self.models}, file, indent=4)
+        except OSError as e:
+            print(f"Error writing model index: {str(e)}")
+
+    def refresh(self):
+        # Returns the sorted model names. Unchanged models are taken from the index as they are.
+        changed = False
+        found = {}
+        try:
+            entries = list(os.scandir(self.model_folder))
+        except OSError:
+            entries = []
+
+        for entry in entries:
+            try:
+                if not entry.is_dir():
+                    continue
+                mtime = entry.stat().st_mtime_ns
+            except OSError:
+                continue
+
+            model = self.models.get(entry.name)
+            if model is None or model.get("mtime") != mtime:
+                model = scan_model(entry.path)
+                model["mtime"] = mtime
+                changed = True
+            found[entry.name] = model
+
+        if changed or found.keys() != self.models.keys():
+            self.models = found
+            self.save()
+        return sorted(self.models, key=str.lower)
+
+    def refresh_model(self, name):
+        # Rescan a single model, e.g. when a watcher saw a change inside its folder
+        path = os.path.join(self.model_folder, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            if self.models.pop(name, None) is not None:
+                self.save()
+            return None
+        model = scan_model(path)
+        model["mtime"] = mtime
+        self.models[name] = model
+        self.save()
+        return model
+
+    def get(self, name):
+        return self.models.get(name)
+
+def scan_model(path):
+    size = 0
+    weight_files = []
+    file_names = set()
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        entries = []
+    for entry in entries:
+        try:
+            if not entry.is_file():
+                continue
+            file_size = entry.stat().st_size
+        except OSError:
+            continue
+        size += file_size
+        file_names.add(entry.name)
+        if entry.name.lower().endswith(weight_extensions):
+            weight_files.append(entry.name)
+
+    wbits, groupsize, quant_method = read_quantization(path, file_names)
+    dtype, layers = read_architecture(path, file_names)
+    return {
+        "size": size,
+        "shards": len(weight_files),
+        "format": detect_format(weight_files, quant_method),
+        "wbits": wbits,
+        "groupsize": groupsize,
+        "dtype": dtype,
+        "layers": layers,
+    }
+
+def read_architecture(path, file_names):
+    # torch_dtype and the number of layers are needed to estimate memory and pre_layer splits
+    if "config.json" not in file_names:
+        return None, None
+    try:
+        with open(os.path.join(path, "config.json"), "r") as file:
+            config = json.load(file)
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+        return None, None
+    if not isinstance(config, dict):
+        return None, None
+    layers = config.get("num_hidden_layers") or config.get("n_layer") or config.get("n_layers")
+    return config.get("torch_dtype"), layers if isinstance(layers, int) else None
+
+def read_quantization(path, file_names):
+    # AutoGPTQ writes quantize_config.json, newer transformers put a quantization_config into config.json
+    wbits = None
+    groupsize = None
+    quant_method = None
+    for config_name in ("quantize_config.json", "config.json"):
+        if config_name not in file_names:
+            continue
+        try:
+            with open(os.path.join(path, config_name), "r") as file:
+                config = json.load(file)
+        except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+            continue
+        if not isinstance(config, dict):
+            continue
+        if config_name == "quantize_config.json":
+            quant_method = "gptq"
+        else:
+            config = config.get("quantization_config") or {}
+            if not isinstance(config, dict):
+                continue
+            quant_method = config.get("quant_method", quant_method)
+            if config.get("load_in_8bit") or config.get("load_in_4bit"):
+                # bitsandbytes configs don't describe the files on disk
+                continue
+        if wbits is None and config.get("bits"):
+            wbits = str(config["bits"])
+        if groupsize is None and isinstance(config.get("group_size"), int):
+            # -1 means no grouping
+            groupsize = str(config["group_size"]) if config["group_size"] > 0 else "none"
+    return wbits, groupsize, quant_method
+
+def detect_format(weight_files, quant_method):
+    names = [name.lower() for name in weight_files]
+    if any(name.endswith(".gguf") for name in names):
+        return "GGUF"
+    if quant_method == "gptq" or any("gptq" in name or name.endswith(".pt") for name in names):
+        return "GPTQ"
+    if any(name.endswith(".safetensors") for name in names):
+        return "safetensors"
+    if any("ggml" in name for name in names):
+        return "GGML"
+    if any(name.endswith(".bin") for name in names):
+        return ".bin"
+    return "unknown"
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
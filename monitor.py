@@ -0,0 +1,97 @@
+import collections, threading, time
+
+from hardware import sample_gpus
+
+# Samples kept per metric, at one sample per second that's the last 5 minutes
+monitor_history = 300
+# Seconds between samples, unless set otherwise in gui-config.json
+default_monitor_interval = 1.0
+
+# Samples GPU and system usage and the usage of the webui process tree on a background thread.
+# Every metric is a ring buffer of the last monitor_history values. Readers take a copy with series().
+class ResourceMonitor:
+    def __init__(self, get_pids, interval=default_monitor_interval, history=monitor_history):
+        # get_pids() returns the PIDs of the server process tree, an empty list if it isn't running
+        self.get_pids = get_pids
+        self.interval = interval
+        self.history = history
+        self.metrics = {}
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        # psutil.Process objects are kept, cpu_percent() measures since the previous call on the same object
+        self.processes = {}
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(self.interval + 1)
+            self.thread = None
+
+    def run(self):
+        while not self.stop_event.is_set():
+            started = time.perf_counter()
+            try:
+                self.record(self.sample())
+            except Exception as e:
+                print(f"Error sampling resources: {str(e)}")
+            # Sleep what's left of the interval, so sampling itself doesn't slow down the rate
+            self.stop_event.wait(max(self.interval - (time.perf_counter() - started), 0))
+
+    def sample(self):
+        values = {}
+        for index, gpu in enumerate(sample_gpus()):
+            values[f"GPU {index} VRAM (MiB)"] = gpu["memory_used"]
+            values[f"GPU {index} Utilization (%)"] = gpu["utilization"]
+            values[f"GPU {index} Clock (MHz)"] = gpu["clock"]
+
+        import psutil
+
+        ram = psutil.virtual_memory()
+        values["RAM used (MiB)"] = (ram.total - ram.available) // (1024 ** 2)
+        rss = 0
+        cpu = 0.0
+        pids = set(self.get_pids())
+        for pid in pids:
+            process = self.processes.get(pid)
+            try:
+                if process is None:
+                    process = self.processes[pid] = psutil.Process(pid)
+                # oneshot() reads /proc once for all values instead of once per value
+                with process.oneshot():
+                    rss += process.memory_info().rss
+                    cpu += process.cpu_percent()
+            except psutil.Error:
+                self.processes.pop(pid, None)
+        # Forget processes that ended
+        for pid in list(self.processes):
+            if pid not in pids:
+                del self.processes[pid]
+        values["Server RSS (MiB)"] = rss // (1024 ** 2)
+        values["Server CPU (%)"] = round(cpu, 1)
+        return values
+
+    def record(self, values):
+        with self.lock:
+            for name, value in values.items():
+                if name not in self.metrics:
+                    self.metrics[name] = collections.deque(maxlen=self.history)
+                self.metrics[name].append(value)
+            self.latest = values
+
+    def series(self):
+        # name -> list of values, oldest first
+        with self.lock:
+            return {name: list(values) for name, values in self.metrics.items()}
@@ -0,0 +1,168 @@
+import ctypes, ctypes.util, mmap, os, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from model_index import weight_extensions
+
+# Reads per call. Large sequential reads keep HDDs and network shares streaming instead of seeking.
+prewarm_chunk_size = 16 * 1024 ** 2
+# Files read at the same time. More than that makes a single HDD seek between the files.
+prewarm_workers = 2
+# A file counts as already cached if this much of it is resident
+resident_threshold = 0.95
+# How often (seconds) the progress callback is called at most
+progress_interval = 0.5
+
+def model_shards(model_path):
+    # The weight files of a model folder, biggest first so the slowest reads start early
+    shards = []
+    for root, _, files in os.walk(model_path):
+        for name in files:
+            if name.lower().endswith(weight_extensions):
+                path = os.path.join(root, name)
+                try:
+                    shards.append((path, os.path.getsize(path)))
+                except OSError:
+                    pass
+    return sorted(shards, key=lambda shard: shard[1], reverse=True)
+
+# mincore() tells which pages of a mapping are in the page cache. Python has no wrapper for it, so it's called
+# through libc, on Linux only. Everywhere else residency is unknown and every file is read.
+libc = None
+if sys.platform.startswith("linux"):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long)
+        libc.munmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+        libc.mincore.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p)
+    except (OSError, AttributeError):
+        libc = None
+
+def resident_fraction(path, size):
+    # Share of the file that is in the page cache, or None if that can't be told
+    if libc is None or size == 0:
+        return None
+    page_size = mmap.PAGESIZE
+    pages = (size + page_size - 1) // page_size
+    with open(path, "rb") as file:
+        address = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, file.fileno(), 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            return None
+        try:
+            vector = (ctypes.c_ubyte * pages)()
+            if libc.mincore(address, size, vector) != 0:
+                return None
+            return sum(page & 1 for page in vector) / pages
+        finally:
+            libc.munmap(address, size)
+
+def advise_willneed(fd, size):
+    # Lets the kernel start reading ahead on its own, our reads then mostly find the pages already there
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+
+# Reads the shards of a model once, so they are in the page cache when the webui loads them.
+# Runs on a background thread while the Conda env and the webui start up.
+class ModelPrewarmer:
+    def __init__(self, model_path, progress=None, workers=prewarm_workers, budget=None):
+        self.model_path = model_path
+        # progress(done bytes, total bytes, MB/s, files already cached, files over the budget) from the worker threads
+        self.progress = progress
+        self.workers = workers
+        # Bytes the page cache can take without evicting what was read first, None for no limit
+        self.budget = budget
+        self.done = 0
+        self.total = 0
+        # Files not read because they are already in the page cache, and because they didn't fit the budget
+        self.skipped = 0
+        self.over_budget = 0
+        self.started_at = None
+        self.finished_at = None
+        self.last_progress = 0
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def speed(self):
+        # MB/s of what was actually read
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at if self.started_at else 0
+        return self.done / elapsed / 1e6 if elapsed > 0 else 0.0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.thread is not None:
+            self.thread.join(5)
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        shards = []
+        for path, size in model_shards(self.model_path):
+            try:
+                resident = resident_fraction(path, size)
+            except OSError:
+                resident = None
+            if resident is not None and resident >= resident_threshold:
+                self.skipped += 1
+                continue
+            if self.budget is not None and self.total + size > self.budget:
+                # Reading more would push the first shards out of the cache again
+                self.over_budget += 1
+                continue
+            shards.append((path, size))
+            self.total += size
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for path, size in shards:
+                pool.submit(self.read_shard, path, size)
+        self.finished_at = time.perf_counter()
+        self.report(force=True)
+
+    def read_shard(self, path, size):
+        buffer = bytearray(prewarm_chunk_size)
+        try:
+            with open(path, "rb", buffering=0) as file:
+                advise_willneed(file.fileno(), size)
+                while not self.cancelled.is_set():
+                    read = file.readinto(buffer)
+                    if not read:
+                        break
+                    with self.lock:
+                        self.done += read
+                    self.report()
+        except OSError as e:
+            print(f"Error prewarming {path}: {str(e)}")
+
+    def report(self, force=False):
+        if self.progress is None:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            if not force and now - self.last_progress < progress_interval:
+                return
+            self.last_progress = now
+        self.progress(self.done, self.total, self.speed, self.skipped, self.over_budget)
+
+    def status(self):
+        # One line for the GUI, "" before anything is known
+        if self.started_at is None:
+            return ""
+        over_budget = f"{self.over_budget} files skipped, not enough free RAM" if self.over_budget else ""
+        if not self.total:
+            if over_budget:
+                return f"not prewarmed, {over_budget}"
+            return "model files already cached" if self.skipped and self.finished_at else ""
+        state = "prewarmed" if self.finished_at else "prewarming"
+        return f"{state} {self.done * 100 // self.total}% at {self.speed:.0f} MB/s" + (f", {over_budget}" if over_budget else "")
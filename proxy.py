@@ -0,0 +1,196 @@
+import asyncio, json, threading, time
+
+# Ports the proxy listens on, clients use these instead of the ports of the single instances
+default_proxy_ports = {"api": 5100, "streaming api": 5105}
+proxy_strategies = ("least-outstanding", "round-robin")
+# GET this path on a proxy port for the per backend stats as JSON
+stats_path = "/proxy/stats"
+# A backend that refused a connection is skipped for this many seconds
+backend_retry_delay = 5
+connect_timeout = 5
+# Longest request head the proxy reads before it gives up on a client
+max_head_size = 64 * 1024
+read_size = 64 * 1024
+# Weight of the newest request in the average latency
+latency_smoothing = 0.2
+
+# Spreads the blocking and streaming API requests over the running instances.
+# Every client connection is one request: the proxy reads the request head, picks a backend and from then on only
+# relays bytes in both directions as they arrive. Streamed responses and WebSockets pass through unbuffered.
+# Runs its own asyncio loop on a background thread, start() and stop() are called from the GUI.
+class LoadBalancingProxy:
+    def __init__(self, get_backends, strategy="least-outstanding", ports=None, host="127.0.0.1"):
+        # get_backends(kind) returns [(name, port), ...] of the healthy instances for "api" or "streaming api"
+        self.get_backends = get_backends
+        self.strategy = strategy
+        self.ports = dict(ports or default_proxy_ports)
+        self.host = host
+        self.backend_stats = {}
+        self.down_until = {}
+        self.next_backend = 0
+        self.lock = threading.Lock()
+        self.loop = None
+        self.stopped = None
+        self.thread = None
+        self.started = threading.Event()
+        self.error = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        # Returns once the ports are open, raises OSError if they couldn't be
+        if self.running:
+            return
+        self.error = None
+        self.started.clear()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.serve()), daemon=True)
+        self.thread.start()
+        self.started.wait(10)
+        if self.error is not None:
+            self.thread.join()
+            self.thread = None
+            raise self.error
+
+    def stop(self):
+        if self.running and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join(10)
+        self.thread = None
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        servers = []
+        try:
+            for kind, port in self.ports.items():
+                servers.append(await asyncio.start_server(lambda reader, writer, kind=kind: self.handle(reader, writer, kind), self.host, port, limit=max_head_size))
+        except OSError as e:
+            self.error = e
+            for server in servers:
+                server.close()
+            self.started.set()
+            return
+        self.started.set()
+        await self.stopped.wait()
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+
+    def stats(self):
+        # backend name -> copy of its counters
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.backend_stats.items()}
+
+    def stats_for(self, name, kind, port):
+        stats = self.backend_stats.get(name)
+        if stats is None or stats["port"] != port:
+            stats = self.backend_stats[name] = {"kind": kind, "port": port, "requests": 0, "active": 0, "peak_active": 0, "errors": 0, "avg_latency": None, "last_latency": None, "avg_duration": None}
+        return stats
+
+    def choose_backends(self, kind):
+        # Healthy backends in the order they should be tried
+        now = time.time()
+        backends = [(name, port) for name, port in self.get_backends(kind) if self.down_until.get(name, 0) <= now]
+        if not backends:
+            return []
+        with self.lock:
+            self.next_backend += 1
+            offset = self.next_backend % len(backends)
+            backends = backends[offset:] + backends[:offset]
+            if self.strategy == "least-outstanding":
+                # sorted() is stable, so backends with the same load still take turns
+                backends.sort(key=lambda backend: self.stats_for(backend[0], kind, backend[1])["active"])
+        return backends
+
+    async def handle(self, reader, writer, kind):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 30)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        request_line, *headers = head.decode("latin-1").split("\r\n")[:-2]
+        if request_line.split(" ")[1:2] == [stats_path]:
+            await self.respond(writer, "200 OK", json.dumps(self.stats(), indent=4))
+            return
+
+        upgrade = any(header.lower().startswith("upgrade:") for header in headers)
+        if not upgrade:
+            # One request per connection, so every request is balanced on its own and the backend closes
+            # the connection when the response is done
+            headers = [header for header in headers if header.split(":", 1)[0].strip().lower() not in ("connection", "keep-alive", "proxy-connection")]
+            headers.append("Connection: close")
+        head = "\r\n".join([request_line] + headers + ["", ""]).encode("latin-1")
+
+        for name, port in self.choose_backends(kind):
+            # Counted as outstanding right away, so requests arriving while this one connects go elsewhere
+            with self.lock:
+                stats = self.stats_for(name, kind, port)
+                stats["active"] += 1
+            try:
+                backend_reader, backend_writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), connect_timeout)
+            except (OSError, asyncio.TimeoutError):
+                with self.lock:
+                    stats["active"] -= 1
+                    stats["errors"] += 1
+                self.down_until[name] = time.time() + backend_retry_delay
+                continue
+            await self.relay(reader, writer, backend_reader, backend_writer, head, stats)
+            return
+        await self.respond(writer, "503 Service Unavailable", json.dumps({"error": f"No {kind} backend is ready"}))
+
+    async def relay(self, reader, writer, backend_reader, backend_writer, head, stats):
+        with self.lock:
+            stats["requests"] += 1
+            stats["peak_active"] = max(stats["peak_active"], stats["active"])
+        start = time.perf_counter()
+        first_byte = None
+
+        async def pipe(source, target, response):
+            nonlocal first_byte
+            try:
+                while True:
+                    data = await source.read(read_size)
+                    if not data:
+                        break
+                    if response and first_byte is None:
+                        first_byte = time.perf_counter()
+                    target.write(data)
+                    await target.drain()
+                if target.can_write_eof():
+                    target.write_eof()
+            except (ConnectionError, OSError):
+                pass
+
+        try:
+            backend_writer.write(head)
+            await backend_writer.drain()
+            upload = asyncio.ensure_future(pipe(reader, backend_writer, False))
+            # The request is done when the backend is done answering
+            await pipe(backend_reader, writer, True)
+            upload.cancel()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            for stream in (backend_writer, writer):
+                stream.close()
+            duration = time.perf_counter() - start
+            with self.lock:
+                stats["active"] -= 1
+                if first_byte is None:
+                    stats["errors"] += 1
+                else:
+                    latency = first_byte - start
+                    stats["last_latency"] = latency
+                    stats["avg_latency"] = latency if stats["avg_latency"] is None else stats["avg_latency"] + latency_smoothing * (latency - stats["avg_latency"])
+                    stats["avg_duration"] = duration if stats["avg_duration"] is None else stats["avg_duration"] + latency_smoothing * (duration - stats["avg_duration"])
+
+    async def respond(self, writer, status, body):
+        body = body.encode()
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
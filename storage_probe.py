@@ -0,0 +1,209 @@
+import mmap, os, random, sys, time
+
+# Size of the test file. Big enough to get past the drive's own cache, small enough to be quick.
+probe_file_size = 256 * 1024 ** 2
+sequential_block_size = 4 * 1024 ** 2
+random_block_size = 4096
+# Each random test stops after this many operations or seconds, whatever comes first
+random_operations = 2000
+phase_time_limit = 5
+probe_file_name = ".startui-storage-probe"
+
+# What the offload modes need to not slow the webui down to a crawl. Sequential MB/s and random read latency (ms).
+# The disk cache is read layer by layer for every token, DeepSpeed's NVMe offload swaps parameters in parallel.
+offload_requirements = {
+    "disk": {"seq_read": 200, "random_read_latency": 5},
+    "nvme": {"seq_read": 1000, "random_read_latency": 1},
+}
+# Filesystems that live in RAM. Offloading there saves no memory at all.
+ram_filesystems = ("tmpfs", "ramfs")
+
+def existing_folder(path):
+    # The folder may not exist yet (the webui creates the cache folder), its nearest parent is on the same disk
+    path = os.path.abspath(path)
+    while not os.path.isdir(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+def filesystem_type(path):
+    # From /proc/mounts: the longest mount point the path is in. None where there is no /proc.
+    path = os.path.realpath(path)
+    best = ("", None)
+    try:
+        with open("/proc/mounts", "r") as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount_point = parts[1].replace("\\040", " ")
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) >= len(best[0]):
+                    best = (mount_point, parts[2])
+    except OSError:
+        return None
+    return best[1]
+
+def is_rotational(path):
+    # True for spinning disks, None if it can't be told (not Linux, network share, device mapper without info)
+    try:
+        device = os.stat(path).st_dev
+        block = os.path.realpath(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+        # Partitions have the queue settings on their parent device
+        for folder in (block, os.path.dirname(block)):
+            rotational = os.path.join(folder, "queue", "rotational")
+            if os.path.exists(rotational):
+                with open(rotational, "r") as file:
+                    return file.read().strip() == "1"
+    except (OSError, AttributeError):
+        pass
+    return None
+
+def open_test_file(path, flags):
+    # O_DIRECT bypasses the page cache, so we measure the disk and not the RAM. Not every filesystem has it
+    # (tmpfs, some network filesystems) and Windows/macOS don't have the flag at all.
+    direct = getattr(os, "O_DIRECT", 0)
+    if direct:
+        try:
+            return os.open(path, flags | direct), True
+        except OSError:
+            pass
+    return os.open(path, flags | getattr(os, "O_BINARY", 0)), False
+
+def drop_cache(fd):
+    # Without O_DIRECT, at least ask the kernel to forget the pages we just wrote
+    os.fsync(fd)
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+def read_at(fd, buffer, offset):
+    # preadv/pwritev read into and write from the aligned buffers directly, Windows only has plain read/write
+    if hasattr(os, "preadv"):
+        return os.preadv(fd, [buffer], offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    data = os.read(fd, len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+def write_at(fd, buffer, offset):
+    if hasattr(os, "pwritev"):
+        return os.pwritev(fd, [buffer], offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, buffer)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else None
+
+def probe_storage(folder, file_size=probe_file_size):
+    # Measures the folder's disk. Returns MB/s for sequential reads and writes, IOPS and latency (ms) for random
+    # 4 KiB reads and writes, and what's known about the disk. Raises OSError if the folder can't be written.
+    folder = existing_folder(folder)
+    path = os.path.join(folder, probe_file_name)
+    result = {"folder": folder, "filesystem": filesystem_type(folder), "rotational": is_rotational(folder)}
+    # Anonymous mmaps are page aligned, which O_DIRECT needs for its buffers
+    sequential_buffer = mmap.mmap(-1, sequential_block_size)
+    sequential_buffer.write(os.urandom(sequential_block_size))
+    random_buffer = mmap.mmap(-1, random_block_size)
+    # At least one block, a smaller file_size would leave nothing to read
+    blocks = max(1, file_size // sequential_block_size)
+    try:
+        # Sequential write, including getting it onto the disk
+        fd, direct = open_test_file(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        result["direct_io"] = direct
+        try:
+            start = time.perf_counter()
+            written = 0
+            for _ in range(blocks):
+                written += os.write(fd, sequential_buffer)
+                if time.perf_counter() - start > phase_time_limit:
+                    break
+            os.fsync(fd)
+            result["seq_write"] = written / (time.perf_counter() - start) / 1e6
+            if not direct:
+                drop_cache(fd)
+        finally:
+            os.close(fd)
+        file_size = written
+
+        # Sequential read
+        fd, direct = open_test_file(path, os.O_RDONLY)
+        try:
+            start = time.perf_counter()
+            read = 0
+            while read < file_size and time.perf_counter() - start < phase_time_limit:
+                count = read_at(fd, sequential_buffer, read)
+                if not count:
+                    break
+                read += count
+            result["seq_read"] = read / (time.perf_counter() - start) / 1e6
+
+            # Random 4 KiB reads, the access pattern of offloaded layers that aren't stored in order
+            result.update(random_operations_test(lambda offset: read_at(fd, random_buffer, offset), file_size, "random_read"))
+        finally:
+            os.close(fd)
+
+        # Random 4 KiB writes, each one synced, like swapped out optimizer state
+        fd, direct = open_test_file(path, os.O_WRONLY | getattr(os, "O_DSYNC", 0))
+        try:
+            sync = (lambda: None) if getattr(os, "O_DSYNC", 0) else (lambda: os.fsync(fd))
+            result.update(random_operations_test(lambda offset: (write_at(fd, random_buffer, offset), sync()), file_size, "random_write"))
+        finally:
+            os.close(fd)
+    finally:
+        sequential_buffer.close()
+        random_buffer.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    result["file_size"] = file_size
+    return result
+
+def random_operations_test(operation, file_size, name):
+    # Files smaller than a block are still tested at offset 0
+    blocks = max(1, file_size // random_block_size)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(random_operations):
+        offset = random.randrange(blocks) * random_block_size
+        before = time.perf_counter()
+        operation(offset)
+        latencies.append((time.perf_counter() - before) * 1000)
+        if time.perf_counter() - start > phase_time_limit:
+            break
+    elapsed = time.perf_counter() - start
+    return {f"{name}_iops": len(latencies) / elapsed, f"{name}_latency": sum(latencies) / len(latencies), f"{name}_latency_p99": percentile(latencies, 0.99)}
+
+def assess_storage(result, mode):
+    # Warnings for the offload mode ("disk" or "nvme"), an empty list if the folder is fine for it
+    warnings = []
+    needs = offload_requirements[mode]
+    if result["filesystem"] in ram_filesystems:
+        warnings.append(f"The folder is on {result['filesystem']}, which lives in RAM. Offloading to it doesn't free any memory.")
+        return warnings
+    # Virtual disks often claim to be rotational, the seek times tell if it really spins
+    if result["rotational"] and result["random_read_latency"] > 1:
+        warnings.append("The folder is on a spinning disk. Offloaded layers will be read very slowly.")
+    if result["seq_read"] < needs["seq_read"]:
+        warnings.append(f"Sequential reads are {result['seq_read']:.0f} MB/s, at least {needs['seq_read']} MB/s are recommended.")
+    if result["random_read_latency"] > needs["random_read_latency"]:
+        warnings.append(f"Random reads take {result['random_read_latency']:.2f} ms, {needs['random_read_latency']} ms or less are recommended.")
+    if not result["direct_io"]:
+        warnings.append("The filesystem doesn't support direct I/O, the numbers may include caching.")
+    return warnings
+
+def describe_storage(result):
+    lines = [
+        f"Folder: {result['folder']} ({result['filesystem'] or 'unknown filesystem'}{', reported as rotational' if result['rotational'] else ''})",
+        f"Sequential: {result['seq_read']:.0f} MB/s read, {result['seq_write']:.0f} MB/s write",
+        f"Random 4 KiB read: {result['random_read_iops']:.0f} IOPS, {result['random_read_latency']:.2f} ms (p99 {result['random_read_latency_p99']:.2f} ms)",
+        f"Random 4 KiB write: {result['random_write_iops']:.0f} IOPS, {result['random_write_latency']:.2f} ms (p99 {result['random_write_latency_p99']:.2f} ms)",
+        f"Test file: {result['file_size'] // 1024 ** 2} MiB, {'direct I/O' if result['direct_io'] else 'buffered I/O'}",
+    ]
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    # python storage_probe.py FOLDER [disk|nvme]
+    probe = probe_storage(sys.argv[1] if len(sys.argv) > 1 else ".")
+    print(describe_storage(probe))
+    for warning in assess_storage(probe, sys.argv[2] if len(sys.argv) > 2 else "disk"):
+        print(f"Warning: {warning}")
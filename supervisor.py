@@ -0,0 +1,231 @@
+import collections, os, socket, subprocess, sys, threading, time
+
+from hardware import process_gpu_memory
+from launcher import popen_with_conda, stop_process_tree
+
+# Seconds to wait before restarting a crashed server, the last value is used for every further restart
+restart_backoff = [2, 5, 10, 30, 60]
+# Give up after this many crashes in a row
+max_restarts = 5
+# A server that ran this long before it died was stable, so the next crash starts the backoff over
+stable_runtime = 120
+# Lines of server output kept to tell why it crashed
+log_tail_lines = 40
+# The log is moved to server.log.1 when it gets bigger than this
+max_log_size = 10 * 1024 ** 2
+
+# Owns the webui process: starts it, watches it, restarts it when it crashes and stops it with all its children.
+# Nothing in here runs on its own, poll() has to be called regularly (a QTimer in the GUI).
+class ServerSupervisor:
+    def __init__(self, command, log_file, restart_on_crash=True, on_event=None, env=None, ports=None):
+        self.command = command
+        self.log_file = log_file
+        self.restart_on_crash = restart_on_crash
+        # name -> port. The server is ready once all of them accept connections.
+        self.ports = ports or {}
+        # on_event(state, message) is called from poll(), start() and stop()
+        self.on_event = on_event
+        self.env = env
+        self.process = None
+        self.state = "stopped"
+        self.pids = []
+        # psutil.Process objects of the process tree. They remember the start time of each process, so a PID
+        # the OS has given to another program in the meantime is never killed.
+        self.processes = []
+        self.exit_code = None
+        self.crash_reason = ""
+        self.restarts = 0
+        self.restart_at = None
+        self.started_at = None
+        self.ready_at = None
+        # Highest VRAM and RAM (MiB) the process tree used since it was started
+        self.peak_vram = 0
+        self.peak_ram = 0
+        self.output = collections.deque(maxlen=log_tail_lines)
+        self.reader = None
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def emit(self, state, message=""):
+        self.state = state
+        if self.on_event:
+            self.on_event(state, message)
+
+    def start(self):
+        if self.running:
+            return
+        self.rotate_log()
+        self.output.clear()
+        self.exit_code = None
+        self.restart_at = None
+        # Without a terminal Python buffers its output, which would hold back the log lines
+        env = dict(self.env if self.env is not None else os.environ, PYTHONUNBUFFERED="1")
+        self.process = popen_with_conda(self.command, env, stdout=subprocess.PIPE)
+        self.pids = [self.process.pid]
+        self.processes = []
+        self.started_at = time.time()
+        self.ready_at = None
+        self.peak_vram = 0
+        self.peak_ram = 0
+        self.reader = threading.Thread(target=self.read_output, args=(self.process,), daemon=True)
+        self.reader.start()
+        self.emit("running", f"PID {self.process.pid}")
+
+    def rotate_log(self):
+        os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+        try:
+            if os.path.getsize(self.log_file) > max_log_size:
+                os.replace(self.log_file, f"{self.log_file}.1")
+        except OSError:
+            pass
+
+    def read_output(self, process):
+        # Everything the server prints goes to the log file and StartUI's console, the last lines are kept
+        with open(self.log_file, "ab") as log:
+            for line in iter(process.stdout.readline, b""):
+                log.write(line)
+                log.flush()
+                text = line.decode(errors="replace").rstrip()
+                self.output.append(text)
+                if sys.stdout:
+                    print(text, flush=True)
+        process.stdout.close()
+
+    def stop(self):
+        restart_pending = self.restart_at is not None
+        self.restart_at = None
+        if self.process is None:
+            # Stopped while waiting to restart after a crash
+            if restart_pending:
+                self.emit("stopped")
+            return
+        self.emit("stopping")
+        self.update_pids()
+        stop_process_tree(self.process)
+        # Children that left the process group (DeepSpeed workers, ...) still hold VRAM
+        self.kill_leftovers()
+        self.exit_code = self.process.returncode
+        self.process = None
+        self.pids = []
+        self.emit("stopped")
+
+    def restart(self):
+        self.stop()
+        self.restarts = 0
+        self.start()
+
+    @property
+    def time_to_ready(self):
+        # Seconds from starting the process (including the Conda activation) until every port was open
+        if self.ready_at is None:
+            return None
+        return self.ready_at - self.started_at
+
+    def ports_open(self):
+        # Checked from the GUI thread, but a connect to localhost is answered (or refused) right away
+        return all(port_open(port) for port in self.ports.values())
+
+    def update_pids(self):
+        if not self.running:
+            return self.pids
+        try:
+            import psutil
+
+            parent = psutil.Process(self.process.pid)
+            # Children that left the tree since the last call are still kept, as long as they run
+            processes = [process for process in self.processes if process.is_running()]
+            for process in [parent] + parent.children(recursive=True):
+                if process not in processes:
+                    processes.append(process)
+            self.processes = processes
+            self.pids = [process.pid for process in processes]
+        except Exception:
+            self.pids = [self.process.pid]
+        return self.pids
+
+    def sample_memory(self):
+        self.peak_vram = max(self.peak_vram, process_gpu_memory(self.pids))
+        try:
+            import psutil
+        except ImportError:
+            return
+        ram = 0
+        for pid in self.pids:
+            try:
+                ram += psutil.Process(pid).memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_ram = max(self.peak_ram, ram // (1024 ** 2))
+
+    def kill_leftovers(self):
+        try:
+            import psutil
+        except ImportError:
+            return
+        # is_running() compares the start time too, a reused PID doesn't count
+        leftovers = [process for process in self.processes if process.is_running()]
+        self.processes = []
+        for process in leftovers:
+            try:
+                process.kill()
+            except psutil.Error:
+                pass
+        psutil.wait_procs(leftovers, timeout=5)
+
+    def poll(self):
+        if self.restart_at is not None:
+            if time.time() >= self.restart_at:
+                self.emit("restarting", f"restart {self.restarts} of {max_restarts}")
+                self.start()
+            return
+
+        if self.process is None:
+            return
+        if self.running:
+            self.update_pids()
+            self.sample_memory()
+            if self.ready_at is None and self.ports_open():
+                self.ready_at = time.time()
+                self.emit("ready", f"after {self.time_to_ready:.1f}s")
+            return
+
+        # The server ended without being stopped
+        if self.reader:
+            self.reader.join(2)
+        self.exit_code = self.process.returncode
+        self.kill_leftovers()
+        self.process = None
+        self.pids = []
+        if self.exit_code == 0:
+            self.emit("exited", "exit code 0")
+            return
+
+        self.crash_reason = find_crash_reason(list(self.output))
+        if time.time() - self.started_at >= stable_runtime:
+            self.restarts = 0
+        if not self.restart_on_crash or self.restarts >= max_restarts:
+            self.emit("crashed", f"exit code {self.exit_code}: {self.crash_reason}")
+            return
+        delay = restart_backoff[min(self.restarts, len(restart_backoff) - 1)]
+        self.restarts += 1
+        self.restart_at = time.time() + delay
+        self.emit("crashed", f"exit code {self.exit_code}: {self.crash_reason}, restarting in {delay}s")
+
+def port_open(port, host="127.0.0.1", timeout=0.2):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def find_crash_reason(lines):
+    # The last error line of a traceback is usually the best explanation, otherwise the last line at all
+    for line in reversed(lines):
+        if "Error" in line or "error:" in line or "Killed" in line:
+            return line.strip()[:200]
+    for line in reversed(lines):
+        if line.strip():
+            return line.strip()[:200]
+    return "no output"
@@ -0,0 +1,160 @@
+import re
+
+# build_command_args() as it was before flag_schema replaced it, kept unchanged as the reference the schema is
+# compared against. Do not update it when flags are added, new flags get their own tests.
+
+def build_command_args(settings):
+    # Turns a profile (as saved by the GUI) into the webui arguments.
+    # Raises ValueError if the profile can't be started like this.
+    args = []
+    chosen_model = settings.get("model", "none")
+
+    # llama.cpp threads
+    if settings.get("llama_threads", 0) != 0:
+        args += ["--threads", str(settings["llama_threads"])]
+        args += ["--n_batch", str(settings.get("llama_batch_size", 512))]
+        args += ["--cache-capacity", f"{settings.get('llama_cache_capacity', 1024)}{settings.get('llama_cache_units', 'MiB')}"]
+        args += ["--n_ctx", str(settings.get("llama_n_ctx", "2048"))]
+        args += ["--llama_cpp_seed", str(settings.get("llama_seed", 0))]
+
+    if settings.get("llama_gpu_layer", 0) != 0:
+        args += ["--n-gpu-layers", str(settings["llama_gpu_layer"])]
+
+    if settings.get("llama_no_map", False):
+        args.append("--no-mmap")
+
+    if settings.get("llama_use_mlock", False):
+        args.append("--mlock")
+
+    # FlexGen Commands
+    if settings.get("use_flexgen", False):
+        args.append("--flexgen")
+        args += ["--percent"] + [str(settings.get(f"flexgen_precentage_{i}", default)) for i, default in zip(range(1, 7), (0, 100, 100, 0, 100, 0))]
+        if settings.get("flexgen_compression", False):
+            args.append("--compression-weight")
+        if settings.get("flexgen_pin_weight", "none") not in ("none", ""):
+            args += ["--pin-weight", settings["flexgen_pin_weight"]]
+
+    # Add the chosen model to the command
+    if chosen_model != "none":
+        args += ["--model", chosen_model]
+
+    # Add the chosen model type to the command
+    if settings.get("model_type", "none") not in ("none", "") and chosen_model != "none":
+        args += ["--model_type", settings["model_type"]]
+
+    # Add loras to the command
+    if settings.get("use_lora", False) and chosen_model != "none" and settings.get("loras"):
+        args += ["--lora"] + settings["loras"]
+
+    # Add Characters to the command
+    if settings.get("character", "none") not in ("none", ""):
+        args += ["--character", settings["character"]]
+
+    # Adds wbits and groupsize to the command, if not "none"
+    if settings.get("wbits", "none") not in ("none", "") and not settings.get("use_cpu", False) and chosen_model != "none":
+        args += ["--wbits", settings["wbits"]]
+    if settings.get("groupsize", "none") not in ("none", "") and not settings.get("use_cpu", False) and chosen_model != "none":
+        args += ["--groupsize", settings["groupsize"]]
+
+    # Add the chosen mode to the command (Chat, cai-chat, notebook)
+    args.append(f"--{settings.get('mode') or 'chat'}")
+
+    # Handle GPU or CPU selection
+    if settings.get("use_gpu", False):
+        gpu_vram = settings.get("gpu_vram", [])
+        if sum(gpu_vram) == 0:
+            raise ValueError("At least one VRAM value must be greater than 0 for GPU execution.")
+        args += ["--gpu-memory"] + [str(vram) for vram in gpu_vram if vram > 0]
+    elif settings.get("use_cpu", False):
+        if settings.get("built_in_ram", 0) <= 0:
+            raise ValueError("RAM value cannot be 0 for CPU execution.")
+        args += ["--cpu-memory", str(settings["built_in_ram"])]
+    elif settings.get("use_auto", False):
+        args.append("--auto-device")
+
+    simple_flags = [
+        ("use_8bit", "--load-in-8bit"),
+        ("no_stream", "--no-stream"),
+        ("use_16bit", "--bf16"),
+        ("xformers", "--xformers"),
+    ]
+    for key, flag in simple_flags:
+        if settings.get(key, False):
+            args.append(flag)
+
+    # Use "Trust Remote Code=TRUE" for ex. MPT-7B
+    if settings.get("trust_remote_code", False) or re.search(r"mpt.*7b", chosen_model):
+        args.append("--trust-remote-code")
+
+    simple_flags = [
+        ("autotune", "--warmup_autotune"),
+        ("monkeypatch", "--monkey-patch"),
+        ("quant_attn", "--quant_attn"),
+        ("use_4bit", "--load-in-4bit"),
+    ]
+    for key, flag in simple_flags:
+        if settings.get(key, False):
+            args.append(flag)
+
+    # Accelerate 4-bit
+    if settings.get("compute_dtype", "none") not in ("none", ""):
+        args += ["--compute_dtype", settings["compute_dtype"]]
+    if settings.get("quant_type", "none") not in ("none", ""):
+        args += ["--quant_type", settings["quant_type"]]
+
+    simple_flags = [
+        ("use_x2_quant", "--use_double_quant"),
+        ("nocache", "--no-cache"),
+        ("autolaunch", "--auto-launch"),
+        ("listen", "--listen"),
+        ("multimodal", "--multimodal-pipeline"),
+    ]
+    for key, flag in simple_flags:
+        if settings.get(key, False):
+            args.append(flag)
+
+    # Use Disk to store part of the Model
+    if settings.get("use_disk", False):
+        args.append("--disk")
+        if settings.get("change_disk_cache", False) and settings.get("disk_cache"):
+            args += ["--disk-cache-dir", settings["disk_cache"]]
+
+    # Add listen port if the checkbox is checked and a port number is provided
+    if settings.get("listen_port", False) and str(settings.get("port_number", "")).isdigit():
+        args += ["--listen-port", str(settings["port_number"])]
+
+    # Adds the authentication to the command, if active
+    if settings.get("authentication", False) and settings.get("authentication_file"):
+        args += ["--gradio-auth-path", settings["authentication_file"]]
+
+    # Adds the Prelayer selection
+    pre_layer_values = settings.get("prelayer", [])
+    if any(value > 0 for value in pre_layer_values):
+        args += ["--pre_layer"] + [str(value) for value in pre_layer_values if value > 0]
+
+    simple_flags = [
+        ("sdp_attention", "--sdp-attention"),
+        ("autogptq", "--autogptq"),
+        ("triton", "--triton"),
+        ("desc_act", "--desc_act"),
+    ]
+    for key, flag in simple_flags:
+        if settings.get(key, False):
+            args.append(flag)
+
+    # Adds the chosen extensions to the list of the command.
+    if settings.get("use_extension", False) and settings.get("extensions"):
+        args += ["--extensions"] + settings["extensions"]
+
+    if settings.get("use_api", False):
+        args.append("--api")
+        if settings.get("public_api", False):
+            args.append("--public-api")
+        else:
+            if settings.get("api_blocking_port_enabled", False):
+                args += ["--api-blocking-port", str(settings.get("api_blocking_port", 5000))]
+            if settings.get("api_streaming_port_enabled", False):
+                args += ["--api-streaming-port", str(settings.get("api_streaming_port", 5005))]
+
+    return args
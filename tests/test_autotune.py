@@ -0,0 +1,158 @@
+import itertools, json, math, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from autotune import LlamaAutotuner, ServerEvaluator, build_search_space
+
+workload = {"prompt_tokens": 512, "new_tokens": 128}
+
+def unimodal(params):
+    # Peaks at 8 threads and n_batch 512, more GPU layers help until they don't fit anymore
+    threads, n_batch = params["threads"], params["n_batch"]
+    if params.get("n_gpu_layers", 0) > 30:
+        return None
+    gpu = 1 + params.get("n_gpu_layers", 0) / 10
+    prompt_tps = 1000 * gpu / (1 + (threads - 8) ** 2 / 10) / (1 + (math.log2(n_batch) - 9) ** 2 / 4)
+    generation_tps = 20 * gpu / (1 + (threads - 8) ** 2 / 20)
+    return prompt_tps, generation_tps
+
+def plateau(params):
+    # Gets faster up to 6 threads and n_batch 256, flat after that
+    threads, n_batch = params["threads"], params["n_batch"]
+    return 100 * min(n_batch, 256) / 256 * min(threads, 6), 5 * min(threads, 6)
+
+def grid_search(evaluate, space):
+    tuner = LlamaAutotuner(evaluate, space, workload)
+    for values in itertools.product(*space.values()):
+        tuner.score(dict(zip(space, values)))
+    return max(tuner.results.values())[0], len(tuner.results)
+
+@pytest.mark.parametrize("curve, space", [
+    (unimodal, build_search_space(16, 32, False)),
+    (unimodal, build_search_space(16, 32, True, layers=40)),
+    (plateau, build_search_space(12, 24, False)),
+])
+def test_tuner_finds_the_optimum_with_fewer_runs(curve, space):
+    best_score, grid_runs = grid_search(curve, space)
+    result = LlamaAutotuner(curve, space, workload).tune({})
+    assert result["ok"]
+    assert LlamaAutotuner(curve, space, workload).score(result["params"]) == pytest.approx(best_score)
+    assert result["evaluations"] < grid_runs
+
+def test_tuner_unimodal_optimum():
+    result = LlamaAutotuner(unimodal, build_search_space(16, 32, True, layers=40), workload).tune({})
+    assert result["params"] == {"threads": 8, "n_batch": 512, "n_gpu_layers": 30}
+
+def test_tuner_every_run_failing():
+    runs = []
+    result = LlamaAutotuner(lambda params: runs.append(params), {"threads": [1, 2, 4, 8], "n_batch": [128, 512]}, workload).tune({})
+    assert not result["ok"]
+    assert result["prompt_tps"] == 0 and runs
+
+class StandInWebui(BaseHTTPRequestHandler):
+    # The blocking API of a webui started with --threads, answers as fast as plateau() says
+    def do_GET(self):
+        self.answer({"result": "model"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/token-count"):
+            self.answer({"results": [{"tokens": 512}]})
+            return
+        if self.server.hang.is_set():
+            # Like a request the killed server never answers
+            self.server.killed.wait(30)
+            self.close_connection = True
+            return
+        prompt_tps, generation_tps = plateau({"threads": self.server.threads, "n_batch": 256})
+        tokens = request["max_new_tokens"]
+        time.sleep(tokens / generation_tps / 100 if tokens > 1 else 512 / prompt_tps / 100)
+        self.answer({"results": [{"text": "x"}]})
+
+    def answer(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class FakeProcess:
+    def __init__(self, returncode=None):
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+class StandInLauncher:
+    # start_server/stop_server for ServerEvaluator, the "process" is a stand-in server on the requested API port
+    def __init__(self, hang=False):
+        self.servers = {}
+        self.stopped = []
+        self.hang = hang
+
+    def start(self, args):
+        server = ThreadingHTTPServer(("127.0.0.1", int(args[args.index("--api-blocking-port") + 1])), StandInWebui)
+        server.daemon_threads = True
+        server.threads = int(args[args.index("--threads") + 1])
+        server.hang = threading.Event()
+        server.killed = threading.Event()
+        if self.hang:
+            server.hang.set()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        process = FakeProcess()
+        self.servers[id(process)] = server
+        return process
+
+    def stop(self, process):
+        server = self.servers.pop(id(process), None)
+        self.stopped.append(process)
+        if server is not None:
+            server.killed.set()
+            server.shutdown()
+            server.server_close()
+
+def test_evaluator_measures_the_stand_in():
+    launcher = StandInLauncher()
+    evaluator = ServerEvaluator(launcher.start, launcher.stop, ["--model", "m"], ready_timeout=10, workload=workload)
+    slow = evaluator({"threads": 1, "n_batch": 512})
+    fast = evaluator({"threads": 6, "n_batch": 512})
+    assert slow and fast
+    assert fast[1] > slow[1] * 2
+    assert len(launcher.stopped) == 2 and not launcher.servers
+
+def test_evaluator_server_that_dies():
+    stopped = []
+    evaluator = ServerEvaluator(lambda args: FakeProcess(returncode=1), stopped.append, [], ready_timeout=10)
+    assert evaluator({"threads": 4, "n_batch": 512}) is None
+    assert len(stopped) == 1
+
+def test_evaluator_server_never_ready():
+    stopped = []
+    evaluator = ServerEvaluator(lambda args: FakeProcess(), stopped.append, [], ready_timeout=1)
+    start = time.perf_counter()
+    assert evaluator({"threads": 4, "n_batch": 512}) is None
+    assert time.perf_counter() - start < 5
+    assert len(stopped) == 1
+
+def test_cancel_ends_the_request_in_flight():
+    launcher = StandInLauncher(hang=True)
+    evaluator = ServerEvaluator(launcher.start, launcher.stop, [], ready_timeout=10, workload=workload)
+    results = []
+    run = threading.Thread(target=lambda: results.append(evaluator({"threads": 4, "n_batch": 512})))
+    run.start()
+    deadline = time.time() + 10
+    while evaluator.process is None and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.5)
+    start = time.perf_counter()
+    evaluator.cancel()
+    run.join(10)
+    assert not run.is_alive() and results == [None]
+    assert time.perf_counter() - start < 5
+    # Later runs don't start a server at all
+    assert evaluator({"threads": 8, "n_batch": 512}) is None
+    assert len(launcher.stopped) >= 1 and not launcher.servers
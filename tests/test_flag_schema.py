@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from flag_schema import benchmark, compile_profile, schema
+from legacy_builder import build_command_args
+
+generated_profiles = 5000
+
+# Values a profile can have per widget kind, including the ones that count as unset
+kind_values = {
+    "check": [True, False],
+    "spin": [0, 8, 512],
+    "text": ["", "none", "abc"],
+    "combo": ["none", "", "chat"],
+    "checklist": [[], ["lora-a"], ["api", "openai"]],
+    "sliders": [[], [0, 0], [10, 0], [8, 12], [0, 20]],
+    "attr": ["none", "", "/nvme"],
+}
+# What the dropdowns and text fields really offer
+key_values = {
+    "model": ["none", "", "vicuna-13b", "mpt-7b-chat", "llama-7b-4bit"],
+    "model_type": ["none", "", "llama", "gptj"],
+    "character": ["none", "", "Example"],
+    "wbits": ["none", "", "4", "8"],
+    "groupsize": ["none", "", "32", "128"],
+    "mode": ["chat", "cai-chat", "notebook", ""],
+    "compute_dtype": ["none", "", "bfloat16", "float16"],
+    "quant_type": ["none", "", "nf4", "fp4"],
+    "flexgen_pin_weight": ["none", "", "True", "False"],
+    "llama_cache_units": ["MiB", "GiB"],
+    "llama_n_ctx": ["2048", "4096"],
+    "rwkv_strategy_dropdown": ["none", "cuda fp16"],
+    "disk_cache": ["", "none", "/data/cache"],
+    "authentication_file": ["", "none", "/home/user/auth.txt"],
+    "port_number": ["", "7861", "abc"],
+}
+
+def generate_profiles(count, seed=2023):
+    # Random profiles, some keys left out like in profiles saved by older versions
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield {setting.key: rng.choice(key_values.get(setting.key) or kind_values[setting.kind]) for setting in schema if rng.random() >= 0.15}
+
+def test_generated_profiles_match_the_legacy_builder():
+    compared = 0
+    for profile in generate_profiles(generated_profiles):
+        try:
+            expected = build_command_args(profile)
+        except ValueError:
+            with pytest.raises(ValueError):
+                compile_profile(profile)
+            continue
+        assert list(compile_profile(profile)) == expected, profile
+        compared += 1
+    # Most profiles have to build a command, or the comparison proves little
+    assert compared > generated_profiles // 2
+
+@pytest.mark.parametrize("settings, expected", [
+    # "none" is a folder or file name like any other in the text fields
+    ({"use_disk": True, "change_disk_cache": True, "disk_cache": "none"}, ["--chat", "--disk", "--disk-cache-dir", "none"]),
+    ({"use_disk": True, "change_disk_cache": True, "disk_cache": ""}, ["--chat", "--disk"]),
+    ({"authentication": True, "authentication_file": "none"}, ["--chat", "--gradio-auth-path", "none"]),
+    ({"authentication": True, "authentication_file": ""}, ["--chat"]),
+    # Only "none" means no model, an empty name is passed on together with what depends on the model
+    ({"model": "", "model_type": "llama", "wbits": "4"}, ["--model", "", "--model_type", "llama", "--wbits", "4", "--chat"]),
+    ({"model": "none", "model_type": "llama", "wbits": "4"}, ["--chat"]),
+    ({"model_type": "llama"}, ["--chat"]),
+    # The dropdowns use "none" for nothing chosen
+    ({"model": "m", "wbits": "none", "groupsize": "", "character": "none"}, ["--model", "m", "--chat"]),
+    ({"model": "m", "wbits": "4", "use_cpu": True, "built_in_ram": 8}, ["--model", "m", "--chat", "--cpu-memory", "8"]),
+])
+def test_unset_values_per_setting(settings, expected):
+    assert list(compile_profile(settings)) == expected
+
+def test_defaults_build_the_plain_command():
+    assert compile_profile({setting.key: setting.default for setting in schema}) == ("--chat",)
+
+def test_compile_speed():
+    # Regression bound, a few hundred microseconds uncached on a laptop
+    uncached, cached = benchmark(runs=2000)
+    assert uncached < 0.002
+    assert cached < uncached / 2
+
+def test_gpu_without_vram_is_refused():
+    with pytest.raises(ValueError):
+        compile_profile({"use_gpu": True, "gpu_vram": [0, 0]})
@@ -0,0 +1,96 @@
+import json, threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from hot_switch import launch_args, plan_switch, switch_model
+
+base_args = ["--model", "llama-7b", "--wbits", "4", "--chat", "--api", "--listen-port", "7860"]
+
+def test_plan_same_arguments():
+    assert plan_switch(base_args, list(base_args))["action"] == "none"
+
+def test_plan_model_change_is_loaded():
+    plan = plan_switch(base_args, ["--model", "vicuna-13b", "--wbits", "4", "--groupsize", "128", "--chat", "--api", "--listen-port", "7860"])
+    assert plan["action"] == "load"
+    assert plan["model_name"] == "vicuna-13b"
+    assert plan["args"] == {"groupsize": 128}
+
+def test_plan_process_flag_needs_restart():
+    plan = plan_switch(base_args, ["--model", "llama-7b", "--wbits", "4", "--chat", "--api", "--listen-port", "7861"])
+    assert plan["action"] == "restart"
+    assert "--listen-port" in plan["reason"]
+
+def test_plan_without_api_or_model_needs_restart():
+    assert plan_switch(base_args, ["--model", "other"] + base_args[2:], api_available=False)["action"] == "restart"
+    assert plan_switch(base_args, base_args[2:])["action"] == "restart"
+
+def test_plan_removed_flags_go_back_to_defaults():
+    running = ["--model", "a", "--wbits", "4", "--groupsize", "128", "--load-in-8bit", "--gpu-memory", "10", "12", "--chat"]
+    plan = plan_switch(running, ["--model", "b", "--chat"])
+    assert plan["action"] == "load"
+    assert plan["args"] == {"wbits": 0, "groupsize": -1, "load_in_8bit": False, "gpu_memory": None}
+
+def test_plan_aliases_and_list_flags():
+    plan = plan_switch(["--model", "a", "--chat"], ["--model", "a", "--auto-device", "--gpu-memory", "10", "--chat"])
+    assert plan["args"] == {"auto_devices": True, "gpu_memory": ["10"]}
+
+def test_launch_args_deepspeed():
+    settings = {"deepspeed_enabled": True, "deepspeed_gpu_num": 2, "deepspeed_nvme_enabled": True, "deepspeed_nvme_path": "none"}
+    assert launch_args(settings, ["--chat"]) == ["--chat", "--deepspeed", "--num_gpus=2"]
+    settings["deepspeed_nvme_path"] = "/nvme"
+    assert launch_args(settings, ["--chat"]) == ["--chat", "--deepspeed", "--num_gpus=2", "--nvme-offload-dir", "/nvme"]
+
+class ModelApi(BaseHTTPRequestHandler):
+    # Stand-in for the model endpoint of the webui's api extension
+    answer = {}
+    status = 200
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        ModelApi.requests.append((self.path, body))
+        data = json.dumps(ModelApi.answer).encode()
+        self.send_response(ModelApi.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def model_api():
+    ModelApi.answer = {}
+    ModelApi.status = 200
+    ModelApi.requests = []
+    server = HTTPServer(("127.0.0.1", 0), ModelApi)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+    server.shutdown()
+    server.server_close()
+
+def test_switch_model_sends_the_plan(model_api):
+    ModelApi.answer = {"result": {"model_name": "vicuna-13b"}}
+    plan = {"model_name": "vicuna-13b", "args": {"wbits": 4}}
+    assert switch_model(model_api, plan) == {"model_name": "vicuna-13b"}
+    assert ModelApi.requests == [("/api/v1/model", {"action": "load", "model_name": "vicuna-13b", "args": {"wbits": 4}})]
+
+def test_switch_model_api_error(model_api):
+    ModelApi.answer = {"error": {"message": "out of memory"}}
+    with pytest.raises(RuntimeError, match="out of memory"):
+        switch_model(model_api, {"model_name": "m", "args": {}})
+
+def test_switch_model_http_error(model_api):
+    ModelApi.status = 500
+    with pytest.raises(RuntimeError, match="didn't answer"):
+        switch_model(model_api, {"model_name": "m", "args": {}})
+
+def test_switch_model_no_server():
+    server = HTTPServer(("127.0.0.1", 0), ModelApi)
+    port = server.server_address[1]
+    server.server_close()
+    with pytest.raises(RuntimeError, match="didn't answer"):
+        switch_model(f"http://127.0.0.1:{port}/api/v1", {"model_name": "m", "args": {}}, timeout=5)
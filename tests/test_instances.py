@@ -0,0 +1,19 @@
+import pytest
+
+from instances import pin_settings
+
+def test_pin_settings_cuts_down_per_gpu_values():
+    settings = pin_settings({"gpu_vram": [10, 12, 20, 24], "prelayer": [0, 30, 40, 0]}, [1, 2])
+    assert settings["gpu_vram"] == [12, 20]
+    assert settings["prelayer"] == [30, 40]
+
+def test_pin_settings_keeps_values_for_as_many_gpus():
+    assert pin_settings({"gpu_vram": [10, 12]}, [2, 3])["gpu_vram"] == [10, 12]
+
+def test_pin_settings_gpu_without_a_value():
+    # The instance would otherwise start without any --gpu-memory cap
+    with pytest.raises(ValueError, match="GPU 3"):
+        pin_settings({"gpu_vram": [10, 10]}, [3])
+
+def test_pin_settings_deepspeed_gpu_count():
+    assert pin_settings({"deepspeed_enabled": True, "deepspeed_gpu_num": 4}, [0, 1])["deepspeed_gpu_num"] == 2
@@ -0,0 +1,13 @@
+import json
+
+import launcher
+
+def test_print_cmd_skips_the_package_check(tmp_path, monkeypatch, capsys):
+    def fail(settings):
+        raise AssertionError("missing_packages() was called")
+    monkeypatch.setattr(launcher, "missing_packages", fail)
+    profile = tmp_path / "profile.json"
+    profile.write_text(json.dumps({"model": "llama-7b", "use_extension": True, "extensions": ["api"]}))
+    assert launcher.main(["--profile", str(profile), "--print-cmd"]) == 0
+    assert "--model llama-7b" in capsys.readouterr().out
+    assert launcher.main(["--profile", str(profile)]) == 0
@@ -0,0 +1,38 @@
+import prewarm
+from prewarm import ModelPrewarmer
+
+def make_model(tmp_path, sizes):
+    model = tmp_path / "model"
+    model.mkdir(parents=True)
+    for index, size in enumerate(sizes):
+        (model / f"model-{index}.safetensors").write_bytes(b"\0" * size)
+    (model / "config.json").write_text("{}")
+    return str(model)
+
+def run(prewarmer):
+    prewarmer.start()
+    prewarmer.thread.join(10)
+    return prewarmer
+
+def test_reads_every_shard(tmp_path, monkeypatch):
+    monkeypatch.setattr(prewarm, "resident_fraction", lambda path, size: 0.0)
+    prewarmer = run(ModelPrewarmer(make_model(tmp_path, [3000, 2000, 1000])))
+    assert prewarmer.done == prewarmer.total == 6000
+    assert prewarmer.status().startswith("prewarmed 100%")
+
+def test_cached_files_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(prewarm, "resident_fraction", lambda path, size: 1.0)
+    prewarmer = run(ModelPrewarmer(make_model(tmp_path, [3000, 2000])))
+    assert (prewarmer.skipped, prewarmer.over_budget, prewarmer.done) == (2, 0, 0)
+    assert prewarmer.status() == "model files already cached"
+
+def test_files_over_the_budget_are_not_reported_as_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(prewarm, "resident_fraction", lambda path, size: 0.0)
+    prewarmer = run(ModelPrewarmer(make_model(tmp_path, [3000, 2000, 1000]), budget=4500))
+    # The biggest shard is read first, the next one doesn't fit anymore, the smallest one does
+    assert (prewarmer.total, prewarmer.skipped, prewarmer.over_budget) == (4000, 0, 1)
+    assert prewarmer.status().endswith("1 files skipped, not enough free RAM")
+
+    prewarmer = run(ModelPrewarmer(make_model(tmp_path / "big", [3000]), budget=1000))
+    assert "cached" not in prewarmer.status()
+    assert prewarmer.status() == "not prewarmed, 1 files skipped, not enough free RAM"
@@ -0,0 +1,212 @@
+import json, socket, socketserver, threading, time
+
+import pytest
+
+from proxy import LoadBalancingProxy, stats_path
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Backend(socketserver.ThreadingTCPServer):
+    # Stand-in for a webui API port. handler(connection, request head) answers one request.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.heads = []
+        super().__init__(("127.0.0.1", 0), BackendRequest)
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class BackendRequest(socketserver.BaseRequestHandler):
+    def handle(self):
+        head = b""
+        while b"\r\n\r\n" not in head:
+            data = self.request.recv(4096)
+            if not data:
+                return
+            head += data
+        self.server.heads.append(head.decode("latin-1"))
+        self.server.handler(self.request, head)
+
+def answer(body):
+    def handler(connection, head):
+        connection.sendall(f"HTTP/1.1 200 OK\r\nContent-Length: {len(body)}\r\n\r\n{body}".encode())
+    return handler
+
+def request(port, path="/api/v1/generate"):
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n".encode())
+        return read_all(sock)
+
+def read_all(sock):
+    response = b""
+    while True:
+        data = sock.recv(4096)
+        if not data:
+            return response.decode()
+        response += data
+
+def wait_until(condition, timeout=5):
+    # The client sees the end of the response a moment before the proxy has counted it
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+@pytest.fixture
+def backends():
+    started = []
+    def start(handler):
+        backend = Backend(handler)
+        started.append(backend)
+        return backend
+    yield start
+    for backend in started:
+        backend.stop()
+
+@pytest.fixture
+def proxy():
+    proxies = []
+    def start(get_backends, strategy="least-outstanding"):
+        balancer = LoadBalancingProxy(get_backends, strategy, ports={"api": free_port(), "streaming api": free_port()})
+        balancer.start()
+        proxies.append(balancer)
+        return balancer
+    yield start
+    for balancer in proxies:
+        balancer.stop()
+
+def test_round_robin_takes_turns():
+    balancer = LoadBalancingProxy(lambda kind: [("a", 1), ("b", 2), ("c", 3)], "round-robin")
+    firsts = [balancer.choose_backends("api")[0][0] for _ in range(6)]
+    assert firsts == ["b", "c", "a", "b", "c", "a"]
+
+def test_least_outstanding_prefers_idle_backends():
+    balancer = LoadBalancingProxy(lambda kind: [("a", 1), ("b", 2), ("c", 3)], "least-outstanding")
+    balancer.stats_for("a", "api", 1)["active"] = 2
+    balancer.stats_for("b", "api", 2)["active"] = 1
+    for _ in range(4):
+        assert [name for name, port in balancer.choose_backends("api")] == ["c", "b", "a"]
+    # Round-robin ignores the load
+    balancer.strategy = "round-robin"
+    assert {balancer.choose_backends("api")[0][0] for _ in range(3)} == {"a", "b", "c"}
+
+def test_down_backends_are_skipped():
+    balancer = LoadBalancingProxy(lambda kind: [("a", 1), ("b", 2)])
+    balancer.down_until["a"] = time.time() + 60
+    assert [name for name, port in balancer.choose_backends("api")] == ["b"]
+    balancer.down_until["a"] = time.time() - 1
+    assert len(balancer.choose_backends("api")) == 2
+
+def test_requests_are_spread_over_backends(backends, proxy):
+    first = backends(answer("first"))
+    second = backends(answer("second"))
+    balancer = proxy(lambda kind: [("first", first.port), ("second", second.port)], "round-robin")
+    bodies = [request(balancer.ports["api"]).split("\r\n\r\n", 1)[1] for _ in range(4)]
+    assert sorted(bodies) == ["first", "first", "second", "second"]
+    # Every request gets its own backend connection
+    assert all("Connection: close" in head and "keep-alive" not in head for head in first.heads + second.heads)
+    assert wait_until(lambda: all(stats["active"] == 0 for stats in balancer.stats().values()))
+    stats = balancer.stats()
+    assert stats["first"]["requests"] == 2 and stats["second"]["requests"] == 2
+    assert stats["first"]["errors"] == 0 and stats["first"]["avg_latency"] is not None
+
+def test_no_ready_backend_is_503(proxy):
+    balancer = proxy(lambda kind: [])
+    response = request(balancer.ports["api"])
+    assert response.startswith("HTTP/1.1 503")
+    assert "No api backend is ready" in response
+
+def test_refused_backend_is_marked_down(backends, proxy):
+    alive = backends(answer("alive"))
+    dead_port = free_port()
+    balancer = proxy(lambda kind: [("dead", dead_port), ("alive", alive.port)], "round-robin")
+    for _ in range(2):
+        assert request(balancer.ports["api"]).endswith("alive")
+    assert balancer.down_until["dead"] > time.time()
+    assert balancer.stats()["dead"]["errors"] == 1
+    # While it's down it isn't even tried
+    request(balancer.ports["api"])
+    assert balancer.stats()["dead"]["errors"] == 1
+
+def test_streamed_response_is_not_buffered(backends, proxy):
+    client_got_first_chunk = threading.Event()
+
+    def stream(connection, head):
+        connection.sendall(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nfirst\r\n")
+        # The rest only comes once the client has seen the first chunk
+        assert client_got_first_chunk.wait(5)
+        connection.sendall(b"6\r\nsecond\r\n0\r\n\r\n")
+
+    backend = backends(stream)
+    balancer = proxy(lambda kind: [("stream", backend.port)])
+    with socket.create_connection(("127.0.0.1", balancer.ports["streaming api"]), timeout=5) as sock:
+        sock.sendall(b"GET /api/v1/stream HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        received = b""
+        while b"first" not in received:
+            received += sock.recv(4096)
+        client_got_first_chunk.set()
+        received += read_all(sock).encode()
+    assert received.endswith(b"6\r\nsecond\r\n0\r\n\r\n")
+
+def test_websocket_upgrade_passes_through(backends, proxy):
+    def echo(connection, head):
+        connection.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n\r\n")
+        while True:
+            data = connection.recv(4096)
+            if not data:
+                return
+            connection.sendall(data)
+
+    backend = backends(echo)
+    balancer = proxy(lambda kind: [("ws", backend.port)])
+    with socket.create_connection(("127.0.0.1", balancer.ports["streaming api"]), timeout=5) as sock:
+        sock.sendall(b"GET /api/v1/stream HTTP/1.1\r\nHost: localhost\r\nConnection: Upgrade\r\nUpgrade: websocket\r\n\r\n")
+        received = b""
+        while b"\r\n\r\n" not in received:
+            received += sock.recv(4096)
+        assert received.startswith(b"HTTP/1.1 101")
+        for message in (b"ping", b"frame two"):
+            sock.sendall(message)
+            assert sock.recv(4096) == message
+    assert "Connection: Upgrade" in backend.heads[0]
+
+def test_stats_path(proxy):
+    balancer = proxy(lambda kind: [])
+    response = request(balancer.ports["api"], stats_path)
+    assert response.startswith("HTTP/1.1 200")
+    assert json.loads(response.split("\r\n\r\n", 1)[1]) == {}
+
+def test_busy_backend_is_avoided(backends, proxy):
+    release = threading.Event()
+
+    def slow(connection, head):
+        release.wait(5)
+        answer("slow")(connection, head)
+
+    slow_backend = backends(slow)
+    fast_backend = backends(answer("fast"))
+    balancer = proxy(lambda kind: [("slow", slow_backend.port), ("fast", fast_backend.port)])
+    results = []
+    # Pinned to the slow backend until it answers
+    balancer.down_until["fast"] = time.time() + 60
+    waiting = threading.Thread(target=lambda: results.append(request(balancer.ports["api"])))
+    waiting.start()
+    assert wait_until(lambda: balancer.stats().get("slow", {}).get("active") == 1)
+    balancer.down_until.clear()
+    try:
+        # The slow backend has a request outstanding, so every new one goes to the other
+        for _ in range(3):
+            assert request(balancer.ports["api"]).endswith("fast")
+    finally:
+        release.set()
+        waiting.join(5)
+    assert results[0].endswith("slow")
@@ -0,0 +1,69 @@
+import hashlib, json, struct
+
+import pytest
+
+from verify import ModelVerifier, check_index, check_structure, read_safetensors_header
+
+def write_safetensors(path, header, data_size=None):
+    header_bytes = json.dumps(header).encode()
+    if data_size is None:
+        data_size = max((tensor["data_offsets"][1] for name, tensor in header.items() if name != "__metadata__"), default=0)
+    path.write_bytes(struct.pack("<Q", len(header_bytes)) + header_bytes + b"\0" * data_size)
+    return path.stat().st_size
+
+def test_complete_file(tmp_path):
+    path = tmp_path / "model.safetensors"
+    size = write_safetensors(path, {"__metadata__": {"format": "pt"}, "a": {"dtype": "F16", "shape": [2], "data_offsets": [0, 4]}})
+    assert set(read_safetensors_header(path, size)) == {"__metadata__", "a"}
+    assert check_structure(str(path), size) is None
+
+def test_cut_off_file(tmp_path):
+    path = tmp_path / "model.safetensors"
+    size = write_safetensors(path, {"a": {"data_offsets": [0, 4]}}, data_size=2)
+    assert "incomplete download" in check_structure(str(path), size)
+
+@pytest.mark.parametrize("header", [
+    [1, 2, 3],
+    {"a": [0, 4]},
+    {"a": {"dtype": "F16"}},
+    {"a": {"data_offsets": [0]}},
+    {"a": {"data_offsets": ["0", "4"]}},
+])
+def test_malformed_header(tmp_path, header):
+    path = tmp_path / "model.safetensors"
+    size = write_safetensors(path, header, data_size=0)
+    with pytest.raises(ValueError):
+        read_safetensors_header(path, size)
+    assert check_structure(str(path), size) is not None
+
+def test_index_with_malformed_shard_or_map(tmp_path):
+    shard = tmp_path / "model-00001.safetensors"
+    size = write_safetensors(shard, [1, 2], data_size=0)
+    (tmp_path / "model.safetensors.index.json").write_text(json.dumps({"weight_map": {"a": shard.name}}))
+    # The structure check reports the shard, the index check skips it
+    assert check_index(str(tmp_path), {str(shard): size}) == []
+    (tmp_path / "model.safetensors.index.json").write_text(json.dumps({"weight_map": [shard.name]}))
+    assert check_index(str(tmp_path), {str(shard): size}) == ["model.safetensors.index.json: can't be read"]
+
+def test_checksum_mismatch_and_cache(tmp_path):
+    model = tmp_path / "model"
+    model.mkdir()
+    data = model / "model.bin"
+    data.write_bytes(b"weights")
+    (model / "SHA256SUMS").write_text(f"{hashlib.sha256(b'other').hexdigest()}  model.bin\n")
+    verifier = ModelVerifier(str(tmp_path / "cache.json"))
+    result = verifier.verify(str(model))
+    assert not result["ok"] and result["checked"] == 1
+    assert "doesn't match" in result["problems"][0]
+    assert ModelVerifier(str(tmp_path / "cache.json")).verify(str(model))["cached"] == 1
+
+def test_cancelled_check_is_not_cached(tmp_path):
+    model = tmp_path / "model"
+    model.mkdir()
+    (model / "model.bin").write_bytes(b"weights")
+    (model / "SHA256SUMS").write_text(f"{hashlib.sha256(b'weights').hexdigest()}  model.bin\n")
+    verifier = ModelVerifier(str(tmp_path / "cache.json"))
+    verifier.cancel()
+    assert verifier.verify(str(model))["cancelled"]
+    result = ModelVerifier(str(tmp_path / "cache.json")).verify(str(model))
+    assert result["ok"] and result["checked"] == 1
@@ -0,0 +1,198 @@
+import os, sys
+
+import pytest
+
+import webuiGUI
+
+Requirement, InvalidRequirement, canonicalize_name = webuiGUI.load_requirement_parser()
+
+def write(path, *lines):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+@pytest.fixture
+def webui(tmp_path):
+    # The webui's requirements with an include, and two extensions
+    main = write(tmp_path / "requirements.txt", "numpy==1.24", "-r base.txt", "--extra-index-url https://example.org/simple")
+    write(tmp_path / "base.txt", "requests>=2", "flask")
+    rich = write(tmp_path / "extensions" / "rich" / "requirements.txt", "rich", "numpy>=1.20")
+    return main, rich
+
+def test_included_requirements_are_installed(webui):
+    lines, constraints, conflicts = webuiGUI.merge_requirements(list(webui))
+    assert lines == ["numpy==1.24", "requests>=2", "flask", "--extra-index-url https://example.org/simple", "rich", "numpy>=1.20"]
+    assert constraints == [] and conflicts == []
+
+def test_unchanged_files_become_constraints(webui):
+    main, rich = webui
+    lines, constraints, conflicts = webuiGUI.merge_requirements([main, rich], [rich])
+    # Options still apply, pinned lines of the unchanged file (and its includes) keep their versions
+    assert lines == ["--extra-index-url https://example.org/simple", "rich", "numpy>=1.20"]
+    assert constraints == ["numpy==1.24", "requests>=2"]
+
+def test_include_of_a_changed_file_is_installed(webui):
+    main, rich = webui
+    lines, constraints, conflicts = webuiGUI.merge_requirements([main, rich], [main])
+    assert "flask" in lines and "requests>=2" in lines
+    assert constraints == ["numpy>=1.20"]
+
+def test_markers_urls_and_duplicates(tmp_path):
+    main = write(tmp_path / "requirements.txt", "colorama; sys_platform == 'nonexistent'", "tqdm; python_version >= '3'", "pkg @ https://example.org/pkg-1.0.tar.gz", "tqdm; python_version >= '3'")
+    other = write(tmp_path / "extensions" / "x" / "requirements.txt", "pkg @ https://example.org/pkg-2.0.tar.gz", "git+https://example.org/repo.git")
+    lines, constraints, conflicts = webuiGUI.merge_requirements([main, other])
+    assert lines == ["tqdm; python_version >= '3'", "pkg @ https://example.org/pkg-1.0.tar.gz", "git+https://example.org/repo.git"]
+    assert [conflict[0] for conflict in conflicts] == ["pkg"]
+
+def test_disjoint_ranges_are_conflicts(tmp_path):
+    main = write(tmp_path / "requirements.txt", "foo>=2", "bar~=1.0")
+    other = write(tmp_path / "extensions" / "x" / "requirements.txt", "foo<2", "bar>=2", "baz==1.0")
+    lines, constraints, conflicts = webuiGUI.merge_requirements([main, other])
+    # The webui's requirements win, the extension's conflicting lines are left out
+    assert lines == ["foo>=2", "bar~=1.0", "baz==1.0"]
+    assert sorted((name, winner, loser) for name, _, winner, _, loser in conflicts) == [("bar", "bar~=1.0", "bar>=2"), ("foo", "foo>=2", "foo<2")]
+
+@pytest.mark.parametrize("first, second, expected", [
+    ("foo>=2", "foo<2", False),
+    ("foo~=1.0", "foo>=2", False),
+    ("foo>=1,<1.4", "foo>=1.4", False),
+    ("foo==1.*", "foo>=2", False),
+    ("foo!=1.0", "foo==1.0", False),
+    ("foo==1.2", "foo>=1", True),
+    ("foo>1.9", "foo<2", True),
+    ("foo<1", "foo<2", True),
+    ("foo==1.*", "foo>=1.5", True),
+    ("foo", "foo==3", True),
+    ("foo[extra]>=1", "foo<=1", True),
+    ("foo @ https://example.org/a.whl", "foo @ https://example.org/b.whl", False),
+    ("foo @ https://example.org/a.whl", "foo>=1", True),
+])
+def test_compatible(first, second, expected):
+    assert webuiGUI.compatible(Requirement(first), Requirement(second)) == expected
+    assert webuiGUI.compatible(Requirement(second), Requirement(first)) == expected
+
+@pytest.mark.parametrize("line, expected", [
+    ("foo>=1,<2", "foo<2,>=1"),
+    ("foo[extra]==1.0", "foo==1.0"),
+    ("foo>=1; python_version >= '3'", "foo>=1"),
+    ("foo", None),
+    ("foo @ https://example.org/foo.whl", None),
+])
+def test_constraint_line(line, expected):
+    assert webuiGUI.constraint_line(Requirement(line)) == expected
+
+@pytest.fixture
+def ledger_env(tmp_path, monkeypatch, webui):
+    # A fake pip: records what it was asked to install and "installs" it by changing the package snapshot
+    state = {"packages": "snapshot-1", "returncode": 0, "installs": []}
+    def install(files, changed=None):
+        state["installs"].append([os.path.relpath(path, tmp_path) for path in changed])
+        if state["returncode"] == 0:
+            state["packages"] = f"snapshot-{len(state['installs']) + 1}"
+        return state["returncode"]
+    monkeypatch.setattr(webuiGUI, "script_dir", str(tmp_path))
+    monkeypatch.setattr(webuiGUI, "ledger_file", str(tmp_path / "startui_cache" / "dependency_ledger.json"))
+    monkeypatch.setattr(webuiGUI, "installed_packages_hash", lambda: state["packages"])
+    monkeypatch.setattr(webuiGUI, "install_requirements", install)
+    return state
+
+def test_ledger_skips_unchanged_files(ledger_env, webui):
+    assert webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    assert webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    assert ledger_env["installs"] == [["requirements.txt", os.path.join("extensions", "rich", "requirements.txt")]]
+
+def test_ledger_installs_changed_files_and_includes(ledger_env, webui, tmp_path):
+    webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    # Comments and formatting don't count, a changed include does
+    with open(webui[1], "a") as file:
+        file.write("# just a comment\n")
+    webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    assert len(ledger_env["installs"]) == 1
+    write(tmp_path / "base.txt", "requests>=2.30", "flask")
+    webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    assert ledger_env["installs"][1] == ["requirements.txt"]
+
+def test_ledger_reinstalls_after_the_packages_changed(ledger_env, webui):
+    webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    # Something was installed or removed outside of the update
+    ledger_env["packages"] = "changed by hand"
+    webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    assert len(ledger_env["installs"]) == 2 and len(ledger_env["installs"][1]) == 2
+
+def test_ledger_not_updated_when_pip_fails(ledger_env, webui):
+    ledger_env["returncode"] = 1
+    assert not webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    assert webuiGUI.load_ledger() == {}
+    ledger_env["returncode"] = 0
+    assert webuiGUI.update_requirements(webuiGUI.load_ledger(), list(webui))
+    assert len(ledger_env["installs"]) == 2
+
+# Stands in for "python setup_cuda.py bdist_wheel": writes a wheel into dist/ and logs MAX_JOBS, or fails halfway
+fake_setup = """
+import os, sys
+os.makedirs("dist", exist_ok=True)
+with open("builds.log", "a") as log:
+    log.write(os.environ["MAX_JOBS"] + "\\n")
+with open(os.path.join("dist", "quant_cuda-0.0.0-cp310-cp310-linux_x86_64.whl"), "w") as wheel:
+    wheel.write("partial" if os.path.exists("FAIL") else "wheel")
+sys.exit(1 if os.path.exists("FAIL") else 0)
+"""
+
+@pytest.fixture
+def gptq_repo(tmp_path):
+    repo = tmp_path / "GPTQ-for-LLaMa"
+    repo.mkdir()
+    (repo / "fake_setup.py").write_text(fake_setup)
+    webuiGUI.run_cmd(f"git -C \"{repo}\" init -q && git -C \"{repo}\" -c user.name=test -c user.email=test@example.org commit -q --allow-empty -m first")
+    return repo
+
+def build_wheel(repo, cache, torch_version="2.0.1", cuda_version="11.7"):
+    key = webuiGUI.gptq_wheel_key(webuiGUI.git_head(str(repo)), torch_version, cuda_version, "g++ 11.2")
+    return webuiGUI.gptq_wheel(str(repo), str(cache), key, build_cmd=f"\"{sys.executable}\" fake_setup.py")
+
+def builds(repo):
+    log = repo / "builds.log"
+    return log.read_text().split() if log.exists() else []
+
+def test_cached_wheel_skips_the_build(gptq_repo, tmp_path):
+    cache = tmp_path / "cache"
+    wheel = build_wheel(gptq_repo, cache)
+    assert wheel.startswith(str(cache)) and open(wheel).read() == "wheel"
+    assert build_wheel(gptq_repo, cache) == wheel
+    assert len(builds(gptq_repo)) == 1
+
+def test_changed_key_rebuilds(gptq_repo, tmp_path):
+    cache = tmp_path / "cache"
+    first = build_wheel(gptq_repo, cache)
+    assert build_wheel(gptq_repo, cache, torch_version="2.1.0") != first
+    assert build_wheel(gptq_repo, cache, cuda_version="12.1") != first
+    webuiGUI.run_cmd(f"git -C \"{gptq_repo}\" -c user.name=test -c user.email=test@example.org commit -q --allow-empty -m second")
+    assert build_wheel(gptq_repo, cache) != first
+    assert len(builds(gptq_repo)) == 4
+    assert len(os.listdir(cache)) == 4
+
+def test_failed_build_caches_nothing(gptq_repo, tmp_path):
+    cache = tmp_path / "cache"
+    (gptq_repo / "FAIL").write_text("")
+    assert build_wheel(gptq_repo, cache) is None
+    assert not cache.exists() or not any(files for _, _, files in os.walk(cache))
+    # The next update builds again instead of installing the half written wheel
+    (gptq_repo / "FAIL").unlink()
+    assert open(build_wheel(gptq_repo, cache)).read() == "wheel"
+    assert len(builds(gptq_repo)) == 2
+
+@pytest.mark.parametrize("cores, available_gib, expected", [
+    (16, 64, 16),
+    (16, 12, 4),
+    (16, 2, 1),
+    (2, 64, 2),
+])
+def test_build_jobs(monkeypatch, cores, available_gib, expected):
+    monkeypatch.setattr(webuiGUI.os, "cpu_count", lambda: cores)
+    monkeypatch.setattr(webuiGUI.os, "sysconf", lambda name: 4096 if name == "SC_PAGE_SIZE" else available_gib * 1024 ** 3 // 4096)
+    assert webuiGUI.build_jobs() == expected
+
+def test_build_jobs_are_passed_as_max_jobs(gptq_repo, tmp_path, monkeypatch):
+    monkeypatch.setattr(webuiGUI, "build_jobs", lambda: 3)
+    build_wheel(gptq_repo, tmp_path / "cache")
+    assert builds(gptq_repo) == ["3"]
@@ -0,0 +1,233 @@
+import glob, hashlib, json, mmap, os, re, struct, threading, zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from model_index import weight_extensions
+
+# Bump when the checks change, so old results are checked again
+verify_version = 1
+# Files hashed at the same time. hashlib releases the GIL, so this really runs in parallel.
+verify_workers = min(4, os.cpu_count() or 1)
+hash_chunk_size = 64 * 1024 ** 2
+# Checksum lists next to the model, in the format of sha256sum
+manifest_patterns = ("SHA256SUMS", "sha256sums.txt", "checksums.sha256", "*.sha256")
+# The huggingface_hub cache stores LFS files as blobs/<sha256>, model folders often link there
+blob_name = re.compile(r"[0-9a-f]{64}")
+
+def file_key(path):
+    # A file is only checked again once one of these changed
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+def read_safetensors_header(path, size):
+    # Returns the header dict, raises ValueError if the file can't be a complete safetensors file
+    with open(path, "rb") as file:
+        prefix = file.read(8)
+        if len(prefix) < 8:
+            raise ValueError("shorter than the safetensors header")
+        header_size = struct.unpack("<Q", prefix)[0]
+        if header_size > size - 8:
+            raise ValueError("header is longer than the file")
+        try:
+            header = json.loads(file.read(header_size))
+        except ValueError:
+            raise ValueError("header is not valid JSON")
+    if not isinstance(header, dict):
+        raise ValueError("header is not a JSON object")
+    for name, tensor in header.items():
+        if name == "__metadata__":
+            continue
+        offsets = tensor.get("data_offsets") if isinstance(tensor, dict) else None
+        if not isinstance(offsets, list) or len(offsets) != 2 or not all(type(offset) == int for offset in offsets):
+            raise ValueError(f"header entry {name} has no valid data_offsets")
+    data_size = max((tensor["data_offsets"][1] for name, tensor in header.items() if name != "__metadata__"), default=0)
+    if 8 + header_size + data_size != size:
+        raise ValueError(f"{size} bytes, but the header describes {8 + header_size + data_size} (incomplete download?)")
+    return header
+
+def check_structure(path, size):
+    # The cheap check: does the file have the size and ending its format promises. Returns a problem or None.
+    name = path.lower()
+    try:
+        if name.endswith(".safetensors"):
+            read_safetensors_header(path, size)
+        elif name.endswith(".gguf"):
+            with open(path, "rb") as file:
+                if file.read(4) != b"GGUF":
+                    return "not a GGUF file"
+        elif name.endswith((".bin", ".pt", ".pth")):
+            with open(path, "rb") as file:
+                magic = file.read(2)
+            # Current PyTorch files are zip archives with the directory at the end, a cut off file has none.
+            # Old pickle-only checkpoints and GGML files have nothing to check against.
+            if magic == b"PK" and not zipfile.is_zipfile(path):
+                return "zip archive without its central directory (incomplete download?)"
+    except ValueError as e:
+        return str(e)
+    except OSError as e:
+        return f"can't be read: {str(e)}"
+    if size == 0:
+        return "empty file"
+    return None
+
+def sha256_file(path, cancelled=None):
+    # mmap avoids copying every chunk into a Python bytes object. Returns None if the cancelled event was set.
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), hash_chunk_size):
+                    if cancelled is not None and cancelled.is_set():
+                        return None
+                    digest.update(view[offset:offset + hash_chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+def load_manifests(model_path):
+    # file name -> expected sha256, from checksum lists in the model folder
+    expected = {}
+    for pattern in manifest_patterns:
+        for manifest in glob.glob(os.path.join(model_path, pattern)):
+            try:
+                with open(manifest, "r") as file:
+                    for line in file:
+                        parts = line.strip().split(None, 1)
+                        if len(parts) == 2 and blob_name.fullmatch(parts[0].lower()):
+                            expected[os.path.basename(parts[1].lstrip("*"))] = parts[0].lower()
+            except OSError:
+                pass
+    return expected
+
+def expected_hash(path, manifests):
+    if os.path.basename(path) in manifests:
+        return manifests[os.path.basename(path)]
+    target = os.path.realpath(path)
+    if os.path.basename(os.path.dirname(target)) == "blobs" and blob_name.fullmatch(os.path.basename(target)):
+        return os.path.basename(target)
+    return None
+
+def check_index(model_path, shards):
+    # The HF *.index.json files name the shard of every tensor. Every shard has to be there, and every
+    # safetensors shard has to contain the tensors mapped to it.
+    problems = []
+    for index_file in glob.glob(os.path.join(model_path, "*.index.json")):
+        try:
+            with open(index_file, "r") as file:
+                weight_map = json.load(file)["weight_map"]
+            if not isinstance(weight_map, dict) or not all(isinstance(shard, str) for shard in weight_map.values()):
+                raise ValueError("weight_map is not a map of tensor names to files")
+        except (OSError, ValueError, KeyError, TypeError):
+            problems.append(f"{os.path.basename(index_file)}: can't be read")
+            continue
+        tensors = {}
+        for tensor, shard in weight_map.items():
+            tensors.setdefault(shard, []).append(tensor)
+        for shard, names in sorted(tensors.items()):
+            path = os.path.join(model_path, shard)
+            if path not in shards:
+                problems.append(f"{shard}: missing (listed in {os.path.basename(index_file)})")
+            elif shard.endswith(".safetensors"):
+                try:
+                    header = read_safetensors_header(path, shards[path])
+                except (OSError, ValueError):
+                    # Already reported by the structure check
+                    continue
+                missing = [name for name in names if name not in header]
+                if missing:
+                    problems.append(f"{shard}: {len(missing)} tensors from {os.path.basename(index_file)} are missing, e.g. {missing[0]}")
+    return problems
+
+# Checks the weight files of a model before it's loaded. Results are cached per file by (size, mtime, inode),
+# so an unchanged model costs one stat() per file.
+class ModelVerifier:
+    def __init__(self, cache_file, workers=verify_workers):
+        self.cache_file = cache_file
+        self.workers = workers
+        self.cache = None
+        self.lock = threading.Lock()
+        # Set by cancel(), verify() then stops after the chunk it's hashing
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def load(self):
+        if self.cache is None:
+            try:
+                with open(self.cache_file, "r") as file:
+                    cache = json.load(file)
+                self.cache = cache.get("files", {}) if cache.get("version") == verify_version else {}
+            except (OSError, json.JSONDecodeError, AttributeError):
+                self.cache = {}
+        return self.cache
+
+    def save(self):
+        try:
+            with open(self.cache_file, "w") as file:
+                json.dump({"version": verify_version, "files": self.cache}, file, indent=4)
+        except OSError as e:
+            print(f"Error writing {self.cache_file}: {str(e)}")
+
+    def check_file(self, path, key, expected):
+        # None instead of the result if the check was cancelled
+        if self.cancelled.is_set():
+            return path, None
+        result = {"key": key, "problem": check_structure(path, key[0]), "sha256": None}
+        if result["problem"] is None and expected is not None:
+            try:
+                result["sha256"] = sha256_file(path, self.cancelled)
+            except (OSError, ValueError) as e:
+                result["problem"] = f"can't be read: {str(e)}"
+            if result["sha256"] is None and result["problem"] is None:
+                return path, None
+        return path, result
+
+    def verify(self, model_path):
+        # Returns {"ok": bool, "problems": [...], "checked": files checked now, "cached": files taken from the cache},
+        # with "cancelled": True if cancel() stopped it. Files checked until then are cached anyway.
+        cache = self.load()
+        manifests = load_manifests(model_path)
+        shards = {}
+        jobs = []
+        cached = 0
+        for root, _, files in os.walk(model_path):
+            for name in files:
+                if not name.lower().endswith(weight_extensions):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    key = file_key(path)
+                except OSError:
+                    continue
+                shards[path] = key[0]
+                expected = expected_hash(path, manifests)
+                entry = cache.get(os.path.abspath(path))
+                # A hash is only missing from the cache if there was nothing to compare it with back then
+                if entry is not None and entry["key"] == key and (expected is None or entry["sha256"] or entry["problem"]):
+                    cached += 1
+                else:
+                    jobs.append((path, key, expected))
+
+        if jobs:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for path, result in pool.map(lambda job: self.check_file(*job), jobs):
+                    if result is not None:
+                        with self.lock:
+                            cache[os.path.abspath(path)] = result
+            self.save()
+        if self.cancelled.is_set():
+            return {"ok": False, "problems": ["the check was cancelled"], "checked": len(jobs), "cached": cached, "cancelled": True}
+
+        problems = []
+        for path in sorted(shards):
+            entry = cache[os.path.abspath(path)]
+            expected = expected_hash(path, manifests)
+            if entry["problem"]:
+                problems.append(f"{os.path.relpath(path, model_path)}: {entry['problem']}")
+            elif expected is not None and entry["sha256"] != expected:
+                problems.append(f"{os.path.relpath(path, model_path)}: SHA-256 doesn't match the checksum")
+        problems += check_index(model_path, shards)
+        return {"ok": not problems, "problems": problems, "checked": len(jobs), "cached": cached}
@@ -1,13 +1,25 @@
 import argparse
 import glob
+import hashlib
+import json
 import os
+import re
 import shutil
 import site
 import subprocess
 import sys
+import tempfile
 
 script_dir = os.getcwd()
 
+# What the last successful update installed: requirement file hashes, a snapshot of the installed packages and
+# whether torch is the CPU build. Lets an update without changes skip pip.
+ledger_file = os.path.join(script_dir, "startui_cache", "dependency_ledger.json")
+# Built GPTQ-for-LLaMa CUDA wheels, one folder per repo/torch/CUDA/compiler combination
+gptq_wheel_cache = os.path.join(script_dir, "startui_cache", "wheels", "gptq")
+# RAM (GiB) one parallel CUDA compile job may need
+build_job_memory = 3
+
 
 def run_cmd(cmd, capture_output=False, env=None):
     # Run shell commands
@@ -60,22 +72,275 @@ def install_dependencies():
     update_dependencies()
 
 
+def load_requirement_parser():
+    # packaging is in every environment pip is, at least as pip's vendored copy
+    try:
+        from packaging.requirements import InvalidRequirement, Requirement
+        from packaging.utils import canonicalize_name
+    except ImportError:
+        from pip._vendor.packaging.requirements import InvalidRequirement, Requirement
+        from pip._vendor.packaging.utils import canonicalize_name
+    return Requirement, InvalidRequirement, canonicalize_name
+
+
+def load_version_class():
+    try:
+        from packaging.version import InvalidVersion, Version
+    except ImportError:
+        from pip._vendor.packaging.version import InvalidVersion, Version
+    return Version, InvalidVersion
+
+
+def read_requirements(path, seen=None, origin=None):
+    # Returns the lines of a requirements file as (origin, line) pairs, with -r includes resolved.
+    # origin is the file that was passed in, also for lines that come from the files it includes.
+    seen = seen if seen is not None else set()
+    path = os.path.abspath(path)
+    origin = origin or path
+    if path in seen:
+        return []
+    seen.add(path)
+
+    with open(path, "r", encoding="utf-8") as file:
+        content = file.read().replace("\\\n", "")
+
+    lines = []
+    for line in content.splitlines():
+        line = line.split(" #")[0].strip()
+        if not line or line.startswith("#"):
+            continue
+        option = line.split(maxsplit=1)
+        if option[0] in ("-r", "--requirement") and len(option) == 2:
+            lines += read_requirements(os.path.join(os.path.dirname(path), option[1]), seen, origin)
+        elif option[0] in ("-c", "--constraint") and len(option) == 2:
+            lines.append((origin, f"{option[0]} {os.path.join(os.path.dirname(path), option[1])}"))
+        else:
+            lines.append((origin, line))
+    return lines
+
+
+def merge_requirements(requirement_files, changed_files=None):
+    # Merges the requirement files into one list for a single pip run.
+    # Returns (lines, constraints, conflicts). A conflict is a requirement no version of which satisfies
+    # another file. The first file (the webui's own requirements) wins, the conflicting lines of later files are
+    # left out. Requirements of files not in changed_files become constraints instead of lines.
+    Requirement, InvalidRequirement, canonicalize_name = load_requirement_parser()
+
+    merged = []
+    seen_lines = set()
+    wanted = {}
+    for requirement_file in requirement_files:
+        for path, line in read_requirements(requirement_file):
+            # The same line from several files (or an include of the webui's requirements) is only needed once
+            if line in seen_lines:
+                continue
+            seen_lines.add(line)
+            try:
+                requirement = Requirement(line)
+            except InvalidRequirement:
+                # Options, plain URLs and editable installs go to pip as they are
+                merged.append((path, line, None))
+                continue
+            if requirement.marker is not None and not requirement.marker.evaluate():
+                continue
+            name = canonicalize_name(requirement.name)
+            wanted.setdefault(name, []).append((path, requirement))
+            merged.append((path, line, name))
+
+    conflicts = []
+    rejected = set()
+    for name, requirements in wanted.items():
+        accepted = []
+        for path, requirement in requirements:
+            clash = next((other for other in accepted if not compatible(requirement, other[1])), None)
+            if clash is None:
+                accepted.append((path, requirement))
+            else:
+                conflicts.append((name, clash[0], str(clash[1]), path, str(requirement)))
+                rejected.add((path, name))
+
+    changed_files = [os.path.abspath(path) for path in (changed_files or requirement_files)]
+    lines = []
+    constraints = []
+    for path, line, name in merged:
+        if name is not None and (path, name) in rejected:
+            continue
+        # Options like --extra-index-url are needed whatever file is installed
+        if path in changed_files or (name is None and line.startswith("-")):
+            lines.append(line)
+        elif name is not None:
+            constraint = constraint_line(Requirement(line))
+            if constraint:
+                constraints.append(constraint)
+    return lines, constraints, conflicts
+
+
+def constraint_line(requirement):
+    # Constraints only limit versions, pip doesn't accept extras or URLs in them
+    if requirement.url or not requirement.specifier:
+        return None
+    return f"{requirement.name}{requirement.specifier}"
+
+
+def boundary_versions(specifier):
+    # The version a specifier names and versions right next to it. If two specifier sets allow a common version,
+    # one of these versions of either set is in both.
+    Version, InvalidVersion = load_version_class()
+    text = specifier.version[:-2] if specifier.version.endswith(".*") else specifier.version
+    try:
+        version = Version(text)
+    except InvalidVersion:
+        # === compares plain strings
+        return [specifier.version]
+    epoch = f"{version.epoch}!" if version.epoch else ""
+    release = list(version.release)
+    candidates = [str(version), epoch + ".".join(str(part) for part in release + [1])]
+    # Just below: 2 -> 1.999999, 1.4.0 -> 1.3.999999
+    nonzero = [index for index, part in enumerate(release) if part > 0]
+    if nonzero:
+        below = release[:nonzero[-1] + 1]
+        below[-1] -= 1
+        candidates.append(epoch + ".".join(str(part) for part in below + [999999]))
+    return candidates
+
+
+def compatible(requirement, other):
+    # Two requirements conflict if no version satisfies both, or they point to different URLs
+    if requirement.url or other.url:
+        return requirement.url == other.url or not (requirement.url and other.url)
+    if not requirement.specifier or not other.specifier:
+        return True
+    candidates = [version for specifier in list(requirement.specifier) + list(other.specifier) for version in boundary_versions(specifier)]
+    return any(requirement.specifier.contains(version, prereleases=True) and other.specifier.contains(version, prereleases=True) for version in candidates)
+
+
+def requirement_files():
+    # The webui's requirements first, so they win over the extensions
+    files = ["requirements.txt"]
+    for extension in sorted(next(os.walk("extensions"))[1]):
+        extension_req_path = os.path.join("extensions", extension, "requirements.txt")
+        if os.path.exists(extension_req_path):
+            files.append(extension_req_path)
+    return files
+
+
+def load_ledger():
+    try:
+        with open(ledger_file, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_ledger(ledger):
+    try:
+        os.makedirs(os.path.dirname(ledger_file), exist_ok=True)
+        with open(ledger_file, "w") as file:
+            json.dump(ledger, file, indent=4)
+    except OSError as e:
+        print(f"Error writing {ledger_file}: {str(e)}")
+
+
+def requirements_hash(path):
+    # Hash of the requirement lines, including -r includes, so formatting changes don't count
+    try:
+        lines = [line for _, line in read_requirements(path)]
+    except OSError:
+        return None
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+def installed_packages_hash():
+    # Snapshot of the installed distributions. If it differs from the ledger, something was installed or
+    # removed behind our back and everything is checked again.
+    from importlib import metadata
+
+    packages = sorted(f"{dist.metadata['Name']}=={dist.version}".lower() for dist in metadata.distributions())
+    return hashlib.sha256("\n".join(packages).encode()).hexdigest()
+
+
+def ledger_key(path):
+    # Relative to the StartUI folder, the webui and GPTQ-for-LLaMa both have a requirements.txt
+    return os.path.relpath(os.path.abspath(path), script_dir)
+
+
+def changed_requirement_files(ledger, files):
+    if ledger.get("packages") != installed_packages_hash():
+        return list(files)
+    recorded = ledger.get("requirements", {})
+    return [path for path in files if recorded.get(ledger_key(path)) != requirements_hash(path)]
+
+
+def update_requirements(ledger, files):
+    # Installs the requirement files that changed since the last successful update, returns False if pip failed
+    changed = changed_requirement_files(ledger, files)
+    if not changed:
+        print(f"Requirements unchanged since the last update, skipping pip ({', '.join(files)}).")
+        return True
+
+    if install_requirements(files, changed) != 0:
+        return False
+    ledger.setdefault("requirements", {}).update({ledger_key(path): requirements_hash(path) for path in files})
+    ledger["packages"] = installed_packages_hash()
+    save_ledger(ledger)
+    return True
+
+
+def torch_is_cpu_only(ledger):
+    # conda-meta changes whenever Conda installs or removes a package, so the last answer holds until then
+    conda_meta = os.path.join(os.environ.get("CONDA_PREFIX", sys.prefix), "conda-meta")
+    try:
+        conda_meta_mtime = os.stat(conda_meta).st_mtime_ns
+    except OSError:
+        conda_meta_mtime = None
+
+    cached = ledger.get("cpuonly", {})
+    if conda_meta_mtime is not None and cached.get("conda_meta_mtime") == conda_meta_mtime:
+        return cached["installed"]
+
+    if conda_meta_mtime is not None:
+        # Conda keeps one json file per installed package there, no need to run conda list
+        installed = len(glob.glob(os.path.join(conda_meta, "cpuonly-*.json"))) > 0
+    else:
+        installed = not run_cmd("conda list cpuonly | grep cpuonly", capture_output=True).returncode
+    ledger["cpuonly"] = {"conda_meta_mtime": conda_meta_mtime, "installed": installed}
+    save_ledger(ledger)
+    return installed
+
+
+def install_requirements(requirement_files, changed_files=None):
+    # One pip run (and one dependency resolution) for all requirement files instead of one per file.
+    # Only the lines of changed_files are installed, the others keep their versions as constraints.
+    changed_files = [os.path.abspath(path) for path in (changed_files or requirement_files)]
+    lines, constraints, conflicts = merge_requirements(requirement_files, changed_files)
+    if conflicts:
+        print("These extensions require versions that conflict with other requirements and are skipped:")
+        for name, winner_file, winner, loser_file, loser in conflicts:
+            print(f"  {name}: {os.path.relpath(loser_file)} wants {loser}, {os.path.relpath(winner_file)} wants {winner}")
+        print()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as merged_file:
+        merged_file.write("\n".join(lines) + "\n")
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as constraints_file:
+        constraints_file.write("\n".join(constraints) + "\n")
+    try:
+        return run_cmd(f"python -m pip install --upgrade -r \"{merged_file.name}\" -c \"{constraints_file.name}\"").returncode
+    finally:
+        os.remove(merged_file.name)
+        os.remove(constraints_file.name)
+
+
 def update_dependencies():
     os.chdir("text-generation-webui")
     run_cmd("git pull")
 
-    # Installs/Updates dependencies from all requirements.txt
-    run_cmd("python -m pip install -r requirements.txt --upgrade")
-    extensions = next(os.walk("extensions"))[1]
-    for extension in extensions:
-        extension_req_path = os.path.join("extensions", extension, "requirements.txt")
-        if os.path.exists(extension_req_path):
-            run_cmd("python -m pip install -r " + extension_req_path + " --upgrade")
+    # Installs/Updates dependencies from all requirements.txt, if they changed since the last update
+    ledger = load_ledger()
+    update_requirements(ledger, requirement_files())
 
     # The following dependencies are for CUDA, not CPU
     # Check if the package cpuonly exists to determine if torch uses CUDA or not
-    cpuonly_exist = not run_cmd("conda list cpuonly | grep cpuonly", capture_output=True).returncode
-    if cpuonly_exist:
+    if torch_is_cpu_only(ledger):
         return
 
     # Finds the path to your dependencies
@@ -104,26 +369,24 @@ def update_dependencies():
     # Install GPTQ-for-LLaMa dependencies
     os.chdir("GPTQ-for-LLaMa")
     run_cmd("git pull")
-    run_cmd("python -m pip install -r requirements.txt")
-    
-    # On some Linux distributions, g++ may not exist or be the wrong version to compile GPTQ-for-LLaMa
-    install_flag = True
-    if sys.platform.startswith("linux"):
-        gxx_output = run_cmd("g++ --version", capture_output=True)
-        if gxx_output.returncode != 0 or b"g++ (GCC) 12" in gxx_output.stdout:
-            # Install the correct version of g++
-            run_cmd("conda install -y -k gxx_linux-64=11.2.0")
-            
-            # Activate the conda environment to compile GPTQ-for-LLaMa
-            conda_env_path = os.path.join(script_dir, "installer_files", "env")
-            conda_sh_path = os.path.join(script_dir, "installer_files", "conda", "etc", "profile.d", "conda.sh")
-            run_cmd(". " + conda_sh_path + " && conda activate " + conda_env_path + " && python setup_cuda.py install")
-            install_flag = False
-
-    if install_flag:
-        run_cmd("python setup_cuda.py install")
-        install_flag = False
+    update_requirements(ledger, ["requirements.txt"])
     
+    # The CUDA kernel only needs a rebuild if GPTQ-for-LLaMa, torch, CUDA or the compiler changed
+    compiler = find_compiler()
+    torch_version, cuda_version = torch_build()
+    key = gptq_wheel_key(git_head("."), torch_version, cuda_version, compiler["version"])
+    quant_cuda_installed = len(glob.glob(os.path.join(site_packages_path, "quant_cuda*"))) > 0
+    if quant_cuda_installed and ledger.get("gptq_wheel") == key:
+        print("GPTQ-for-LLaMa CUDA kernel is up to date.")
+    else:
+        # Install the correct version of g++, if it's needed for a build
+        install_compiler = (lambda: run_cmd("conda install -y -k gxx_linux-64=11.2.0")) if compiler["conda_gxx"] else None
+        wheel = gptq_wheel(".", gptq_wheel_cache, key, compiler["activate"], before_build=install_compiler)
+        if wheel is not None and run_cmd(f"python -m pip install --force-reinstall --no-deps \"{wheel}\"").returncode == 0:
+            ledger["gptq_wheel"] = key
+            ledger["packages"] = installed_packages_hash()
+            save_ledger(ledger)
+
     # If the path does not exist, then the install failed
     quant_cuda_path_regex = os.path.join(site_packages_path, "quant_cuda*/")
     if not glob.glob(quant_cuda_path_regex):
@@ -136,6 +399,98 @@ def update_dependencies():
                 print("Wheel installation failed.")
 
 
+def git_head(repo_dir):
+    result = run_cmd(f"git -C \"{repo_dir}\" rev-parse HEAD", capture_output=True)
+    return result.stdout.decode().strip() if result.returncode == 0 else "unknown"
+
+
+def torch_build():
+    # torch and CUDA version, read from the installed files instead of importing torch (which takes seconds)
+    import importlib.util
+    from importlib import metadata
+
+    try:
+        torch_version = metadata.version("torch")
+    except metadata.PackageNotFoundError:
+        return "none", "none"
+    cuda_version = "none"
+    spec = importlib.util.find_spec("torch")
+    if spec is not None and spec.submodule_search_locations:
+        try:
+            with open(os.path.join(spec.submodule_search_locations[0], "version.py"), "r") as file:
+                match = re.search(r"^cuda\b.*?=\s*['\"]([^'\"]+)['\"]", file.read(), re.MULTILINE)
+            if match:
+                cuda_version = match.group(1)
+        except OSError:
+            pass
+    return torch_version, cuda_version
+
+
+def find_compiler():
+    # On some Linux distributions, g++ may not exist or be the wrong version to compile GPTQ-for-LLaMa.
+    # Then the g++ 11.2 from Conda is used, which needs the activated Conda environment to build.
+    if not sys.platform.startswith("linux"):
+        return {"version": os.environ.get("VCToolsVersion", "msvc"), "conda_gxx": False, "activate": ""}
+    gxx_output = run_cmd("g++ --version", capture_output=True)
+    if gxx_output.returncode != 0 or b"g++ (GCC) 12" in gxx_output.stdout:
+        conda_env_path = os.path.join(script_dir, "installer_files", "env")
+        conda_sh_path = os.path.join(script_dir, "installer_files", "conda", "etc", "profile.d", "conda.sh")
+        return {"version": "conda gxx_linux-64=11.2.0", "conda_gxx": True, "activate": ". " + conda_sh_path + " && conda activate " + conda_env_path + " && "}
+    return {"version": gxx_output.stdout.decode().splitlines()[0].strip(), "conda_gxx": False, "activate": ""}
+
+
+def gptq_wheel_key(head, torch_version, cuda_version, compiler_version):
+    text = "\n".join([head, torch_version, cuda_version, compiler_version, sys.version.split()[0], sys.platform])
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def cached_wheel(cache_dir, key):
+    wheels = glob.glob(os.path.join(cache_dir, key, "*.whl"))
+    return wheels[0] if wheels else None
+
+
+def gptq_wheel(repo_dir, cache_dir, key, prefix="", build_cmd="python setup_cuda.py bdist_wheel", before_build=None):
+    # The cached wheel for key, or a new build of it. None if it had to be built and the build failed.
+    wheel = cached_wheel(cache_dir, key)
+    if wheel is not None:
+        print(f"Installing the cached GPTQ-for-LLaMa CUDA kernel {os.path.basename(wheel)}.")
+        return wheel
+    if before_build is not None:
+        before_build()
+    return build_gptq_wheel(repo_dir, cache_dir, key, build_jobs(), prefix, build_cmd)
+
+
+def build_jobs():
+    # nvcc takes up to ~3 GiB per job, so the available RAM limits the jobs as well as the cores
+    cores = os.cpu_count() or 1
+    try:
+        available_gib = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES") / 1024 ** 3
+    except (AttributeError, ValueError, OSError):
+        return cores
+    return max(1, min(cores, int(available_gib // build_job_memory)))
+
+
+def build_gptq_wheel(repo_dir, cache_dir, key, jobs, prefix="", build_cmd="python setup_cuda.py bdist_wheel"):
+    # Builds the wheel in repo_dir and moves it into cache_dir/key. Returns its path, or None if the build failed.
+    print(f"Building the GPTQ-for-LLaMa CUDA kernel with {jobs} jobs.")
+    dist_dir = os.path.join(repo_dir, "dist")
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    # torch's BuildExtension reads MAX_JOBS for ninja
+    env = dict(os.environ, MAX_JOBS=str(jobs))
+    if run_cmd(f"{prefix}cd \"{repo_dir}\" && {build_cmd}", env=env).returncode != 0:
+        return None
+    wheels = glob.glob(os.path.join(dist_dir, "*.whl"))
+    if not wheels:
+        return None
+    target_dir = os.path.join(cache_dir, key)
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, os.path.basename(wheels[0]))
+    # Moved under another name first, so an interrupted copy to another drive never looks like a cached wheel
+    shutil.move(wheels[0], target + ".part")
+    os.replace(target + ".part", target)
+    return target
+
+
 def download_model():
     os.chdir("text-generation-webui")
     run_cmd("python download-model.py")